@@ -1,25 +1,23 @@
 #!/bin/env python
 
 from __future__ import print_function
-from qds_sdk.commands import *
-from qds_sdk.cluster import *
+import sys
+if __name__ == '__main__':
+    # let a running `qds.py daemon` run the command, before paying for the
+    # imports below
+    from qds_sdk.daemon import forward
+    _status = forward(sys.argv[1:])
+    if _status is not None:
+        sys.exit(_status)
+
+# Subsystems are imported by the functions using them, so that a command
+# does not pay for importing the modules of all the others
+from importlib import import_module
+from qds_sdk.qubole import Qubole
+from qds_sdk.resource import Resource
+from qds_sdk.exception import ParseError
 import qds_sdk.exception
-from qds_sdk.scheduler import SchedulerCmdLine
-from qds_sdk.actions import ActionCmdLine
-from qds_sdk.report import ReportCmdLine
-from qds_sdk.dbtaps import DbTapCmdLine
-from qds_sdk.role import RoleCmdLine
-from qds_sdk.group import GroupCmdLine
-from qds_sdk.account import AccountCmdLine
-from qds_sdk.app import AppCmdLine
-from qds_sdk.nezha import NezhaCmdLine
-from qds_sdk.user import UserCmdLine
-from qds_sdk.template import TemplateCmdLine
-from qds_sdk.clusterv2 import ClusterCmdLine
-from qds_sdk.sensors import *
-from qds_sdk.pipelines import PipelinesCmdLine
 import os
-import sys
 import traceback
 import logging
 import json
@@ -27,23 +25,28 @@ from optparse import OptionParser
 
 log = logging.getLogger("qds")
 CommandClasses = {
-    "hivecmd": HiveCommand,
-    "sparkcmd": SparkCommand,
-    "dbtapquerycmd": DbTapQueryCommand,
-    "pigcmd":  PigCommand,
-    "hadoopcmd": HadoopCommand,
-    "shellcmd": ShellCommand,
-    "dbexportcmd": DbExportCommand,
-    "dbimportcmd": DbImportCommand,
-    "prestocmd": PrestoCommand,
-    "jupyternotebookcmd": JupyterNotebookCommand
+    "hivecmd": "HiveCommand",
+    "sparkcmd": "SparkCommand",
+    "dbtapquerycmd": "DbTapQueryCommand",
+    "pigcmd": "PigCommand",
+    "hadoopcmd": "HadoopCommand",
+    "shellcmd": "ShellCommand",
+    "dbexportcmd": "DbExportCommand",
+    "dbimportcmd": "DbImportCommand",
+    "prestocmd": "PrestoCommand",
+    "jupyternotebookcmd": "JupyterNotebookCommand"
 }
 
 SensorClasses = {
-    "filesensor": FileSensor,
-    "partitionsensor": PartitionSensor
+    "filesensor": "FileSensor",
+    "partitionsensor": "PartitionSensor"
 }
 
+
+def _load_class(module, name):
+    return getattr(import_module(module), name)
+
+
 usage_str = (
     "Usage: qds.py [options] <subcommand>\n"
     "\nCommand subcommands:\n"
@@ -56,6 +59,7 @@ usage_str = (
     "    cancel <id> : cancels the cmd with this id\n"
     "    getresult <id> <include_header>: id -> get the results for the cmd with this id\n"
     "                                     include_header -> to include headers in results(true/false)\n"
+    "                                     --concurrency N -> number of parallel downloads\n"
     "    getlog <id> : get the logs for the cmd with this id\n"
     "\nCluster subcommand:\n"
     "  cluster <action>\n"
@@ -100,6 +104,11 @@ usage_str = (
     "  nezha --help\n"
     "\nUser subcommad:\n"
     "  user --help\n"
+    "\nBatch subcommand:\n"
+    "  batch --help\n"
+    "\nDaemon subcommand:\n"
+    "  daemon [--socket PATH] [--idle-timeout SECS] : run the commands of later\n"
+    "                                               qds.py invocations in this process\n"
     "\nSensor subcommand:\n"
     " <filesensor|partitionsensor> --help\n")
 
@@ -128,10 +137,12 @@ def submitaction(cmdclass, args):
         return 0
 
 
-def _getresult(cmdclass, cmd, args=[]):
+def _getresult(cmdclass, cmd, args=[], concurrency=1):
+    from qds_sdk.commands import Command
     if Command.is_success(cmd.status):
         log.info("Fetching results for %s, Id: %s" % (cmdclass.__name__, cmd.id))
-        cmd.get_results(sys.stdout, delim='\t', qlog=cmd.qlog, arguments=args)
+        cmd.get_results(sys.stdout, delim='\t', qlog=cmd.qlog, arguments=args,
+                        concurrency=concurrency)
         return 0
     else:
         log.error("Cannot fetch results - command Id: %s failed with status: %s" % (cmd.id, cmd.status))
@@ -183,16 +194,28 @@ def cancelaction(cmdclass, args):
 def listaction(cmdclass, args):
     args = cmdclass.listparse(args)
     if args is not None:
+        all_pages = args.pop("all_pages")
+        parallel = args.pop("parallel")
+        if all_pages:
+            from qds_sdk.command_history import export
+            args.pop("page")
+            per_page = args.pop("per_page") or 100
+            export(sys.stdout, parallel=parallel, per_page=per_page, **args)
+            return 0
         return json.dumps(cmdclass.list(**args), indent=4)
 
 
 def getresultaction(cmdclass, args):
+    parsed = cmdclass.getresultparse(args)
+    if parsed is None:
+        return 0
+    options, args = parsed
     if len(args) > 2:
         sys.stderr.write("expecting not more than 2 arguments\n")
         usage()
 
     cmd = cmdclass.find(args.pop(0))
-    return _getresult(cmdclass, cmd, args)
+    return _getresult(cmdclass, cmd, args, concurrency=options['concurrency'])
 
 
 def getlogaction(cmdclass, args):
@@ -203,6 +226,7 @@ def getlogaction(cmdclass, args):
 
 def getjobsaction(cmdclass, args):
     checkargs_id(args)
+    from qds_sdk.commands import Command
     cmd = cmdclass.find(args.pop(0))
     if Command.is_done(cmd.status):
         log.info("Fetching jobs for %s, Id: %s" % (cmdclass.__name__, cmd.id))
@@ -214,7 +238,7 @@ def getjobsaction(cmdclass, args):
 
 
 def cmdmain(cmd, args):
-    cmdclass = CommandClasses[cmd]
+    cmdclass = _load_class("qds_sdk.commands", CommandClasses[cmd])
 
     actionset = set(["list", "submit", "run", "check", "cancel", "getresult", "getlog", "getjobs"])
     if len(args) < 1:
@@ -230,7 +254,8 @@ def cmdmain(cmd, args):
 
 
 def sensormain(sensor, args):
-    sensor_class = SensorClasses[sensor]
+    from qds_sdk.sensors import SensorCmdLine
+    sensor_class = _load_class("qds_sdk.sensors", SensorClasses[sensor])
     print(SensorCmdLine.check(sensor_class, args))
     return 0
 
@@ -263,6 +288,7 @@ def cluster_clone_action(clusterclass, args, api_version=1.2):
     return 0
 
 def _create_cluster_info(arguments, api_version):
+    from qds_sdk.cluster import ClusterInfo, ClusterInfoV13
     custom_config = _read_file(arguments.custom_config_file, "custom config file")
     presto_custom_config = _read_file(arguments.presto_custom_config_file, "presto custom config file")
     fairscheduler_config_xml = _read_file(arguments.fairscheduler_config_xml_file, "config xml file")
@@ -479,6 +505,7 @@ def cluster_update_node_action(clusterclass, args):
     return 0
 
 def clustermain(args, api_version):
+    from qds_sdk.cluster import Cluster
     clusterclass = Cluster
     actionset = set(["create", "delete", "update", "clone", "list", "start", "terminate", "status", "master", "reassign_label", "add_node", "remove_node", "update_node", "snapshot", "restore_point", "get_snapshot_schedule", "update_snapshot_schedule"])
 
@@ -507,101 +534,231 @@ def clustermainv2(args):
         sys.stderr.write("action must be one of <%s>\n" % "|".join(actionset))
         usage()
     elif action in set(["create", "update", "clone", "list"]):
+        from qds_sdk.clusterv2 import ClusterCmdLine
         result =  ClusterCmdLine.run(args)
     else:
+        from qds_sdk.cluster import Cluster
         action = args.pop(0)
         result = globals()["cluster_" + action + "_action"](Cluster, args)
     print(result)
 
 def accountmain(args):
+    from qds_sdk.account import AccountCmdLine
     result = AccountCmdLine.run(args)
     print(result)
 
 def usermain(args):
+    from qds_sdk.user import UserCmdLine
     result = UserCmdLine.run(args)
     print(result)
 
 def reportmain(args):
+    from qds_sdk.report import ReportCmdLine
     result = ReportCmdLine.run(args)
     print(result)
 
 
 def actionmain(args):
+    from qds_sdk.actions import ActionCmdLine
     result = ActionCmdLine.run(args)
     print(result)
 
 def schedulermain(args):
+    from qds_sdk.scheduler import SchedulerCmdLine
     result = SchedulerCmdLine.run(args)
     print(result)
 
 def dbtapmain(args):
+    from qds_sdk.dbtaps import DbTapCmdLine
     result = DbTapCmdLine.run(args)
     print(result)
 
 def rolemain(args):
+    from qds_sdk.role import RoleCmdLine
     result = RoleCmdLine.run(args)
     print(result)
 
 def groupmain(args):
+    from qds_sdk.group import GroupCmdLine
     result = GroupCmdLine.run(args)
     print(result)
 
 def appmain(args):
+    from qds_sdk.app import AppCmdLine
     result = AppCmdLine.run(args)
     print(result)
 
 def nezhamain(args):
+    from qds_sdk.nezha import NezhaCmdLine
     result = NezhaCmdLine.run(args)
     print(result)
 
 def templatemain(args):
+    from qds_sdk.template import TemplateCmdLine
     result = TemplateCmdLine.run(args)
     print(result)
 
 def questmain(args):
+    from qds_sdk.pipelines import PipelinesCmdLine
     result = PipelinesCmdLine.run(args)
     print(result)
 
 
-def main():
+def batchmain(args):
+    from qds_sdk.batch import OPERATIONS, run_batch
+    parser = OptionParser(usage="qds.py [options] batch [--parallel N] [--unordered] < operations.jsonl",
+                          description="Runs the operations read from stdin, one JSON object per line "
+                                      "with an \"op\" among <%s>, and prints their outcomes as JSON "
+                                      "lines" % "|".join(sorted(OPERATIONS)))
+    parser.add_option("--parallel", dest="parallel", type=int, default=10,
+                      help="number of operations run at once. defaults to 10")
+    parser.add_option("--unordered", dest="ordered", action="store_false", default=True,
+                      help="print outcomes as operations finish, instead of in input order")
+    (options, _) = parser.parse_args(args)
+    # keep a pooled connection per worker. agents are created on first use
+    Qubole.pool_maxsize = max(Qubole.pool_maxsize, options.parallel)
+    failures = run_batch(sys.stdin, sys.stdout, options.parallel, options.ordered)
+    return 1 if failures else 0
+
+
+# Global options which must match those of the daemon for it to run a command
+DAEMON_SETTINGS = ("api_token", "api_url", "api_version", "poll_interval",
+                   "poll_policy", "skip_ssl_cert_check", "cloud_name",
+                   "base_retry_delay", "max_retries", "result_cache_dir",
+                   "result_cache_size")
+
+
+def _exit_status(code):
+    """
+    Returns:
+        the exit status of the process for sys.exit(code)
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write("%s\n" % code)
+    return 1
+
+
+def _relative_paths(args, cwd):
+    """
+    Returns:
+        the arguments, or values of --option=value arguments, naming files
+        relative to `cwd`
+    """
+    paths = []
+    for arg in args:
+        if arg.startswith("-") and "=" in arg:
+            arg = arg.split("=", 1)[1]
+        if arg and not os.path.isabs(arg) and os.path.exists(os.path.join(cwd, arg)):
+            paths.append(arg)
+    return paths
+
+
+def daemonmain(args, options):
+    from qds_sdk.daemon import Daemon, socket_path
+    parser = OptionParser(usage="qds.py [options] daemon [--socket PATH] [--idle-timeout SECS]")
+    parser.add_option("--socket", dest="socket", default=socket_path(),
+                      help="Unix socket to listen on. defaults to "
+                           "$QDS_DAEMON_SOCKET or ~/.qds/daemon.sock")
+    parser.add_option("--idle-timeout", dest="idle_timeout", type=int,
+                      help="exit after this many secs without commands. "
+                           "runs until killed by default")
+    (daemon_options, _) = parser.parse_args(args)
+    settings = [getattr(options, name) for name in DAEMON_SETTINGS]
+
+    def run(argv, environ, cwd):
+        try:
+            optparser, command_options, command_args = _parse_options(argv, environ)
+        except SystemExit as e:
+            return _exit_status(e.code)
+        if ([getattr(command_options, name) for name in DAEMON_SETTINGS] != settings
+                or not command_args or command_args[0] in ("daemon", "batch")
+                or (cwd and cwd != os.getcwd() and _relative_paths(command_args, cwd))):
+            # run by the client instead, with its own configuration, stdin
+            # or current directory
+            return None
+        try:
+            return _exit_status(_dispatch(optparser, command_options, command_args))
+        except SystemExit as e:
+            return _exit_status(e.code)
+        except Exception as e:
+            return _report_error(e)
+
+    def cancel(thread):
+        from qds_sdk.commands import SignalHandler
+        SignalHandler.interrupt(thread)
+
+    daemon = Daemon(daemon_options.socket, run, daemon_options.idle_timeout, cancel)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _parse_options(argv, environ):
+    """
+    Returns:
+        the option parser, the parsed global options and the remaining
+        arguments of a command line
+    """
     optparser = OptionParser(usage=usage_str)
     optparser.add_option("--token", dest="api_token",
-                         default=os.getenv('QDS_API_TOKEN'),
+                         default=environ.get('QDS_API_TOKEN'),
                          help="api token for accessing Qubole. must be specified via command line or passed in via environment variable QDS_API_TOKEN")
 
     optparser.add_option("--url", dest="api_url",
-                         default=os.getenv('QDS_API_URL'),
+                         default=environ.get('QDS_API_URL'),
                          help="base url for QDS REST API. defaults to https://api.qubole.com/api ")
 
     optparser.add_option("--version", dest="api_version",
-                         default=os.getenv('QDS_API_VERSION'),
+                         default=environ.get('QDS_API_VERSION'),
                          help="version of REST API to access. defaults to v1.2")
 
     optparser.add_option("--poll_interval", dest="poll_interval",
                          type=int,
-                         default=os.getenv('QDS_POLL_INTERVAL'),
+                         default=environ.get('QDS_POLL_INTERVAL'),
                          help="interval for polling API for completion and other events. defaults to 5s")
 
+    optparser.add_option("--poll_policy", dest="poll_policy",
+                         default=environ.get('QDS_POLL_POLICY', "fixed"),
+                         choices=["fixed", "adaptive"],
+                         help="fixed: poll every poll_interval secs. adaptive: poll "
+                              "frequently at first, then back off exponentially. "
+                              "defaults to fixed")
+
     optparser.add_option("--skip_ssl_cert_check", dest="skip_ssl_cert_check", action="store_true",
                          default=False,
                          help="skip verification of server SSL certificate. Insecure: use with caution.")
 
     optparser.add_option("--cloud_name", dest="cloud_name",
-                         default=os.getenv('CLOUD_PROVIDER', "AWS"),
+                         default=environ.get('CLOUD_PROVIDER', "AWS"),
                          help="cloud", choices=["AWS", "AZURE", "ORACLE_BMC", "ORACLE_OPC", "GCP"])
 
     optparser.add_option("--base_retry_delay", dest="base_retry_delay",
                          type=int,
-                         default=os.getenv('QDS_BASE_RETRY_DELAY'),
+                         default=environ.get('QDS_BASE_RETRY_DELAY'),
                          help="base sleep interval for exponential backoff in case of "
                               "retryable exceptions.Defaults to 10s.")
 
     optparser.add_option("--max_retries", dest="max_retries",
                          type=int,
-                         default=os.getenv('QDS_MAX_RETRIES'),
+                         default=environ.get('QDS_MAX_RETRIES'),
                          help="Number of re-attempts for an api-call in case of "
                               " retryable exceptions. Defaults to 7.")
 
+    optparser.add_option("--result_cache_dir", dest="result_cache_dir",
+                         default=environ.get('QDS_RESULT_CACHE_DIR'),
+                         help="directory in which results of successful commands are "
+                              "cached for later getresult calls. caching is disabled by default")
+
+    optparser.add_option("--result_cache_size", dest="result_cache_size",
+                         type=int,
+                         default=environ.get('QDS_RESULT_CACHE_SIZE', 1024),
+                         help="size limit of the result cache in MB. Defaults to 1024.")
+
     optparser.add_option("-v", dest="verbose", action="store_true",
                          default=False,
                          help="verbose mode - info level logging")
@@ -611,18 +768,7 @@ def main():
                          help="very verbose mode - debug level logging")
 
     optparser.disable_interspersed_args()
-    (options, args) = optparser.parse_args()
-
-    if options.chatty:
-        logging.basicConfig(level=logging.DEBUG)
-    elif options.verbose:
-        logging.basicConfig(level=logging.INFO)
-    else:
-        logging.basicConfig(level=logging.WARN)
-
-    if options.api_token is None:
-        sys.stderr.write("No API Token provided\n")
-        usage(optparser)
+    (options, args) = optparser.parse_args(argv)
 
     if options.api_url is None:
         options.api_url = "https://api.qubole.com/api/"
@@ -644,9 +790,32 @@ def main():
 
     if options.skip_ssl_cert_check is None:
         options.skip_ssl_cert_check = False
-    elif options.skip_ssl_cert_check:
+
+    return optparser, options, args
+
+
+def main():
+    optparser, options, args = _parse_options(sys.argv[1:], os.environ)
+
+    if options.chatty:
+        logging.basicConfig(level=logging.DEBUG)
+    elif options.verbose:
+        logging.basicConfig(level=logging.INFO)
+    else:
+        logging.basicConfig(level=logging.WARN)
+
+    if options.api_token is None:
+        sys.stderr.write("No API Token provided\n")
+        usage(optparser)
+
+    if options.skip_ssl_cert_check:
         log.warn("Insecure mode enabled: skipping SSL cert verification\n")
 
+    poll_policy = None
+    if options.poll_policy == "adaptive":
+        from qds_sdk.poll_policy import AdaptivePollPolicy
+        poll_policy = AdaptivePollPolicy()
+
     Qubole.configure(api_token=options.api_token,
                      api_url=options.api_url,
                      version=options.api_version,
@@ -654,9 +823,16 @@ def main():
                      skip_ssl_cert_check=options.skip_ssl_cert_check,
                      cloud_name=options.cloud_name,
                      base_retry_delay=options.base_retry_delay,
-                     max_retries=options.max_retries
+                     max_retries=options.max_retries,
+                     poll_policy=poll_policy,
+                     result_cache_dir=options.result_cache_dir,
+                     result_cache_max_bytes=int(options.result_cache_size) * 1024 * 1024
                      )
 
+    return _dispatch(optparser, options, args)
+
+
+def _dispatch(optparser, options, args):
     if len(args) < 1:
         sys.stderr.write("Missing first argument containing subcommand\n")
         usage(optparser)
@@ -708,26 +884,41 @@ def main():
         return templatemain(args)
     if a0 == "pipelines":
         return questmain(args)
+    if a0 == "batch":
+        return batchmain(args)
+    if a0 == "daemon":
+        return daemonmain(args, options)
 
     cmdset = set(CommandClasses.keys())
     sys.stderr.write("First command must be one of <%s>\n" %
                      "|".join(cmdset.union(["cluster", "action", "scheduler", "report",
-                       "dbtap", "role", "group", "app", "account", "nezha", "user", "template", "pipelines"])))
+                       "dbtap", "role", "group", "app", "account", "nezha", "user", "template", "pipelines", "batch", "daemon"])))
     usage(optparser)
 
 
-if __name__ == '__main__':
-    try:
-        sys.exit(main())
-    except qds_sdk.exception.Error as e:
+def _report_error(e):
+    """
+    Prints an exception raised by a command
+
+    Returns:
+        the exit status of the command
+    """
+    if isinstance(e, qds_sdk.exception.Error):
         sys.stderr.write("Error: Status code %s (%s) from url %s\n" %
                          (e.request.status_code, e.__class__.__name__,
                           e.request.url))
-        sys.exit(1)
-    except qds_sdk.exception.ParseError as e:
+        return 1
+    elif isinstance(e, qds_sdk.exception.ParseError):
         sys.stderr.write("Error: %s\n" % str(e))
         sys.stderr.write("Usage: %s\n" % e.usage)
-        sys.exit(2)
-    except Exception:
+        return 2
+    else:
         traceback.print_exc(file=sys.stderr)
-        sys.exit(3)
+        return 3
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except Exception as e:
+        sys.exit(_report_error(e))
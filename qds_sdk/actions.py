@@ -6,7 +6,7 @@ from __future__ import print_function
 import json
 
 from qds_sdk.qubole import Qubole
-from qds_sdk.resource import Resource
+from qds_sdk.resource import Resource, iter_pages
 from argparse import ArgumentParser
 from qds_sdk.commands import *
 
@@ -134,12 +134,12 @@ class Action(Resource):
         if cmd is None:
             return None
         cmdclass = globals()[cmd["command_type"]]
-        obj = cmdclass(cmd)
+        obj = cmdclass(cmd, self._client)
         return obj
 
     @staticmethod
-    def list(page = None, per_page = None):
-        conn = Qubole.agent()
+    def list(page = None, per_page = None, client=None):
+        conn = (client or Qubole).agent()
         url_path = Action.rest_entity_path
         params = {}
         if page is not None:
@@ -151,15 +151,33 @@ class Action(Resource):
         actjson = conn.get(url_path, params)
         actlist = []
         for a in actjson["actions"]:
-            actlist.append(Action(a))
+            actlist.append(Action(a, client))
         return actlist
 
+    @staticmethod
+    def iter_all(per_page=None, prefetch=False, client=None):
+        """
+        Lists all the actions, one page at a time
+
+        Args:
+            `per_page`: number of actions fetched per request
+            `prefetch`: fetch the next page while the current one is consumed
+            `client`: QuboleClient to use instead of the Qubole singleton
+
+        Returns:
+            A generator of Action objects
+        """
+        conn = (client or Qubole).agent()
+        for actjson in iter_pages(conn, Action.rest_entity_path, per_page, prefetch):
+            for a in actjson["actions"]:
+                yield Action(a, client)
+
     def kill(self):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         return conn.put(self.element_path(self.id) + "/kill", data=None)
 
     def rerun(self):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         return conn.post(self.element_path(self.id) + "/rerun", data=None)
 
     def status(self):
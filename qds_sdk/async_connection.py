@@ -0,0 +1,120 @@
+"""
+The async_connection module provides an asyncio counterpart of
+qds_sdk.connection.Connection. Requires Python 3.5 or later.
+
+Requests are issued over the pooled `requests` sessions of a regular
+Connection, so HTTP error handling (`Connection._handle_error`) is shared.
+Blocking socket I/O runs on a bounded thread pool while waits between
+retries are handled on the event loop, which lets a single loop drive a
+large number of concurrent calls.
+"""
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from qds_sdk.connection import (Connection, RETRY_EXCEPTIONS,
+                                ALWAYS_RETRY_EXCEPTIONS)
+from qds_sdk.exception import Error
+from qds_sdk.instrumentation import notify
+
+log = logging.getLogger("qds_async_connection")
+
+
+class AsyncConnection(object):
+    """
+    Coroutine based client for the QDS REST API. Mirrors the
+    get/get_raw/post/put/delete methods of Connection.
+    """
+
+    def __init__(self, connection, max_concurrency=64):
+        """
+        Args:
+            `connection`: the Connection whose sessions are used for requests
+            `max_concurrency`: maximum number of requests in flight at once
+        """
+        self.connection = connection
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        if (getattr(connection, 'reuse', False) and
+                max_concurrency > connection.pool_maxsize):
+            # grow the keep-alive pools to the number of workers so that
+            # connections are not discarded under full load, keeping the
+            # other pool settings of the connection
+            connection.mount_adapters(connection.pool_connections,
+                                      max_concurrency, connection.pool_block)
+
+    async def get_raw(self, path, params=None):
+        return await self._call(RETRY_EXCEPTIONS, self.connection._api_call_raw,
+                                "GET", path, params=params)
+
+    async def get(self, path, params=None):
+        return await self._call(RETRY_EXCEPTIONS, self.connection._api_call,
+                                "GET", path, params=params)
+
+    async def put(self, path, data=None):
+        return await self._call(ALWAYS_RETRY_EXCEPTIONS,
+                                self.connection._api_call, "PUT", path, data)
+
+    async def post(self, path, data=None):
+        return await self._call(ALWAYS_RETRY_EXCEPTIONS,
+                                self.connection._api_call, "POST", path, data)
+
+    async def delete(self, path, data=None):
+        return await self._call(ALWAYS_RETRY_EXCEPTIONS,
+                                self.connection._api_call, "DELETE", path, data)
+
+    async def _call(self, exceptions, func, req_type, path, *args, **kwargs):
+        """
+        Run `func` on the worker pool, retrying on `exceptions` following the
+        retry policy of the connection, like Connection.retry
+        """
+        loop = asyncio.get_event_loop()
+        policy = Connection.get_retry_policy(self.connection)
+        endpoint = policy.endpoint(req_type, path)
+        call = functools.partial(func, req_type, path, *args, **kwargs)
+        started = time.time()
+        attempt = 0
+        while True:
+            try:
+                result = await loop.run_in_executor(
+                    self._executor, self._attempt, policy, endpoint, call)
+            except exceptions as e:
+                sleep_for = policy.on_failure(
+                    endpoint, e, attempt, started,
+                    Connection._get_retry_after(getattr(e, 'request', None)))
+                if sleep_for is None:
+                    raise
+                notify(getattr(self.connection, 'instrumentation', ()),
+                       'on_retry', endpoint, e, sleep_for)
+                log.info("%s, Retrying in %d seconds..." %
+                         (e.__class__.__name__, sleep_for))
+                await asyncio.sleep(sleep_for)
+                attempt += 1
+            except Error as e:
+                # the server answered, which closes a half open circuit
+                if not isinstance(e, RETRY_EXCEPTIONS):
+                    policy.on_success(endpoint)
+                raise
+            else:
+                policy.on_success(endpoint)
+                return result
+
+    @staticmethod
+    def _attempt(policy, endpoint, call):
+        # the policy may block (eg: waiting on its lock), keep it off the loop
+        policy.before_call(endpoint)
+        return call()
+
+    def close(self):
+        """
+        Release the worker threads. Pending calls are allowed to finish.
+        """
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,141 @@
+"""
+The batch module runs many independent operations (check a command, cancel
+it, get its results, show the status of a cluster, ...) concurrently over
+the shared connection pool. It backs `qds.py batch`, which reads operations
+as JSON Lines and writes one JSON line per result, eg:
+
+    {"op": "check", "id": 123}
+    {"op": "cluster_status", "cluster": "default"}
+
+gives:
+
+    {"line": 1, "request": {"op": "check", "id": 123}, "status": "ok", "result": {...}}
+    {"line": 2, "request": {...}, "status": "error", "error": "..."}
+"""
+import io
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+
+from qds_sdk.cluster import Cluster
+from qds_sdk.commands import Command
+from qds_sdk.exception import Error
+from qds_sdk.scheduler import Scheduler
+
+log = logging.getLogger("qds_batch")
+
+
+def _check(request, client):
+    return Command.find(request["id"], client=client).attributes
+
+
+def _cancel(request, client):
+    return Command.cancel_id(request["id"], client=client)
+
+
+def _getlog(request, client):
+    return Command.get_log_id(request["id"], client=client)
+
+
+def _getjobs(request, client):
+    return Command.get_jobs_id(request["id"], client=client)
+
+
+def _getresult(request, client):
+    cmd = Command.find(request["id"], client=client)
+    if not Command.is_success(cmd.status):
+        raise ValueError("Cannot fetch results - command Id: %s failed with status: %s"
+                         % (cmd.id, cmd.status))
+    fp = io.BytesIO()
+    include_header = "true" if request.get("include_header") else "false"
+    cmd.get_results(fp, delim=request.get("delim"), arguments=[include_header])
+    return fp.getvalue().decode("utf-8", "replace")
+
+
+def _cluster_status(request, client):
+    return Cluster.status(request["cluster"], client=client)
+
+
+def _cluster_show(request, client):
+    return Cluster.show(request["cluster"], client=client)
+
+
+def _scheduler_view(request, client):
+    return Scheduler.find(request["id"], client=client).attributes
+
+
+OPERATIONS = {
+    "check": _check,
+    "cancel": _cancel,
+    "getlog": _getlog,
+    "getjobs": _getjobs,
+    "getresult": _getresult,
+    "cluster_status": _cluster_status,
+    "cluster_show": _cluster_show,
+    "scheduler_view": _scheduler_view,
+}
+
+
+def _describe(e):
+    if isinstance(e, Error):
+        return "Status code %s (%s) from url %s" % (
+            e.request.status_code, e.__class__.__name__, e.request.url)
+    if isinstance(e, KeyError):
+        return "missing field %s" % e
+    return "%s: %s" % (e.__class__.__name__, e)
+
+
+def run_operation(line_number, line, client=None):
+    """
+    Runs the operation of one JSON line
+
+    Returns:
+        a dict describing the outcome, never raises
+    """
+    outcome = {"line": line_number}
+    try:
+        request = json.loads(line)
+        outcome["request"] = request
+        operation = OPERATIONS.get(request.get("op")) if isinstance(request, dict) else None
+        if operation is None:
+            raise ValueError("op must be one of <%s>" % "|".join(sorted(OPERATIONS)))
+        outcome["result"] = operation(request, client)
+        outcome["status"] = "ok"
+    except Exception as e:
+        log.info("Operation on line %d failed" % line_number, exc_info=True)
+        outcome["status"] = "error"
+        outcome["error"] = _describe(e)
+    return outcome
+
+
+def run_batch(lines, out, parallel=10, ordered=True, client=None):
+    """
+    Runs the operations read from `lines` concurrently, writing their
+    outcomes to `out` as soon as they are known
+
+    Args:
+        `lines`: iterable of JSON lines, eg: sys.stdin. blank lines are skipped
+        `out`: file the outcomes are written to, one JSON line each
+        `parallel`: number of operations run at once. the connection pool
+                    should keep at least as many connections
+        `ordered`: write the outcomes in the order of the input lines,
+                   instead of the order in which operations finish
+        `client`: QuboleClient to use instead of the Qubole singleton
+
+    Returns:
+        the number of operations which failed
+    """
+    requests = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+    pool = ThreadPool(parallel)
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        failures = 0
+        for outcome in imap(lambda request: run_operation(request[0], request[1], client),
+                            requests):
+            if outcome["status"] != "ok":
+                failures += 1
+            out.write(json.dumps(outcome) + "\n")
+            out.flush()
+        return failures
+    finally:
+        pool.terminate()
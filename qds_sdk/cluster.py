@@ -5,11 +5,16 @@ cluster information.
 
 from qds_sdk.qubole import Qubole
 from qds_sdk.resource import Resource
+from qds_sdk.exception import WaitTimeoutError
 from argparse import ArgumentParser
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from qds_sdk import util
+from six import string_types
 
 import logging
 import json
+import time
 
 log = logging.getLogger("qds_cluster")
 
@@ -22,6 +27,9 @@ class Cluster(Resource):
     """
     qds_sdk.Cluster is the class for retrieving and manipulating cluster
     information.
+
+    All methods take an optional `client` (a qds_sdk.qubole.QuboleClient)
+    to use instead of the Qubole singleton.
     """
 
     rest_entity_path = "clusters"
@@ -62,7 +70,7 @@ class Cluster(Resource):
         return vars(arguments)
 
     @classmethod
-    def list(cls, state=None, page=None, per_page=None):
+    def list(cls, state=None, page=None, per_page=None, client=None):
         """
         List existing clusters present in your account.
 
@@ -72,13 +80,13 @@ class Cluster(Resource):
         Returns:
             List of clusters satisfying the given criteria
         """
-        conn = Qubole.agent()
+        conn = (client or Qubole).agent()
         params = {}
         if page:
             params['page'] = page
         if per_page:
             params['per_page'] = per_page
-        if (params.get('page') or params.get('per_page')) and Qubole.version == 'v1.2':
+        if (params.get('page') or params.get('per_page')) and (client or Qubole).version == 'v1.2':
             log.warn("Pagination is not supported with API v1.2. Fetching all clusters.")
         params = None if not params else params
         cluster_list = conn.get(cls.rest_entity_path, params=params)
@@ -86,11 +94,11 @@ class Cluster(Resource):
             return cluster_list
         elif state is not None:
             result = []
-            if Qubole.version == 'v1.2':
+            if (client or Qubole).version == 'v1.2':
                 for cluster in cluster_list:
                     if state.lower() == cluster['cluster']['state'].lower():
                         result.append(cluster)
-            elif Qubole.version == 'v1.3':
+            elif (client or Qubole).version == 'v1.3':
                 cluster_list = cluster_list['clusters']
                 for cluster in cluster_list:
                     if state.lower() == cluster['state'].lower():
@@ -98,47 +106,84 @@ class Cluster(Resource):
             return result
 
     @classmethod
-    def show(cls, cluster_id_label):
+    def show(cls, cluster_id_label, client=None):
         """
         Show information about the cluster with id/label `cluster_id_label`.
         """
-        conn = Qubole.agent()
+        conn = (client or Qubole).agent()
         return conn.get(cls.element_path(cluster_id_label))
 
     @classmethod
-    def status(cls, cluster_id_label):
+    def status(cls, cluster_id_label, client=None):
         """
         Show the status of the cluster with id/label `cluster_id_label`.
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         return conn.get(cls.element_path(cluster_id_label) + "/state")
 
     @classmethod
-    def master(cls, cluster_id_label):
+    def master(cls, cluster_id_label, client=None):
         """
         Show the details of the master of the cluster with id/label `cluster_id_label`.
         """
-        cluster_status = cls.status(cluster_id_label)
+        cluster_status = cls.status(cluster_id_label, client=client)
         if cluster_status.get("state") == 'UP':
             return list(filter(lambda x: x["role"] == "master", cluster_status.get("nodes")))[0]
         else:
             return cluster_status
 
     @classmethod
-    def start(cls, cluster_id_label, api_version=None):
+    def watch(cls, cluster_id_labels, until=None, timeout=None, max_workers=10, client=None):
+        """
+        Polls the states of several clusters in one loop.
+
+        Args:
+            `cluster_id_labels`: id/label, or list of ids/labels of clusters
+            `until`: state or list of states. stops once all the clusters are
+                     in one of them
+            `timeout`: secs after which WaitTimeoutError is raised, or the
+                       watch ends if `until` is None
+            `max_workers`: maximum number of requests in flight at once
+
+        Returns:
+            A generator yielding a ClusterStateChange for each transition
+            seen, eg: PENDING -> UP, starting with the initial states
+        """
+        return ClusterWatcher(cluster_id_labels, max_workers, client).watch(until, timeout)
+
+    @classmethod
+    def wait_for_state(cls, cluster_id_labels, target_states, timeout=None,
+                       max_workers=10, client=None):
+        """
+        Waits until the clusters with ids/labels `cluster_id_labels` are all
+        in one of `target_states`, eg: Cluster.wait_for_state(["etl", "adhoc"], "UP")
+
+        Returns:
+            A dict of id/label to the state of the cluster
+
+        Raises:
+            WaitTimeoutError: if they are not after `timeout` secs
+        """
+        watcher = ClusterWatcher(cluster_id_labels, max_workers, client)
+        for change in watcher.watch(target_states, timeout):
+            log.info("Cluster %s is %s" % (change.cluster_id_label, change.state))
+        return dict(watcher.states)
+
+    @classmethod
+    def start(cls, cluster_id_label, api_version=None, client=None):
         """
         Start the cluster with id/label `cluster_id_label`.
         """
-        conn = Qubole.agent(version=api_version)
+        conn = (client or Qubole).agent(version=api_version)
         data = {"state": "start"}
         return conn.put(cls.element_path(cluster_id_label) + "/state", data)
 
     @classmethod
-    def terminate(cls, cluster_id_label):
+    def terminate(cls, cluster_id_label, client=None):
         """
         Terminate the cluster with id/label `cluster_id_label`.
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         data = {"state": "terminate"}
         return conn.put(cls.element_path(cluster_id_label) + "/state", data)
 
@@ -492,18 +537,18 @@ class Cluster(Resource):
         return arguments
 
     @classmethod
-    def create(cls, cluster_info, version=None):
+    def create(cls, cluster_info, version=None, client=None):
         """
         Create a new cluster using information provided in `cluster_info`.
 
         Optionally provide the version (eg: v1.3) to use the new version of the
         API. If None we default to v1.2
         """
-        conn = Qubole.agent(version=version)
+        conn = (client or Qubole).agent(version=version)
         return conn.post(cls.rest_entity_path, data=cluster_info)
 
     @classmethod
-    def update(cls, cluster_id_label, cluster_info, version=None):
+    def update(cls, cluster_id_label, cluster_info, version=None, client=None):
         """
         Update the cluster with id/label `cluster_id_label` using information provided in
         `cluster_info`.
@@ -511,11 +556,11 @@ class Cluster(Resource):
         Optionally provide the version (eg: v1.3) to use the new version of the
         API. If None we default to v1.2
         """
-        conn = Qubole.agent(version=version)
+        conn = (client or Qubole).agent(version=version)
         return conn.put(cls.element_path(cluster_id_label), data=cluster_info)
 
     @classmethod
-    def clone(cls, cluster_id_label, cluster_info, version=None):
+    def clone(cls, cluster_id_label, cluster_info, version=None, client=None):
         """
         Update the cluster with id/label `cluster_id_label` using information provided in
         `cluster_info`.
@@ -523,7 +568,7 @@ class Cluster(Resource):
         Optionally provide the version (eg: v1.3) to use the new version of the
         API. If None we default to v1.2
         """
-        conn = Qubole.agent(version=version)
+        conn = (client or Qubole).agent(version=version)
         return conn.post(cls.element_path(cluster_id_label) + '/clone', data=cluster_info)
 
     @classmethod
@@ -570,7 +615,7 @@ class Cluster(Resource):
         return arguments
 
     @classmethod
-    def reassign_label(cls, destination_cluster, label):
+    def reassign_label(cls, destination_cluster, label, client=None):
         """
         Reassign a label from one cluster to another.
 
@@ -579,7 +624,7 @@ class Cluster(Resource):
 
             `label`: label to be moved from the source cluster
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         data = {
                     "destination_cluster": destination_cluster,
                     "label": label
@@ -587,11 +632,11 @@ class Cluster(Resource):
         return conn.put(cls.rest_entity_path + "/reassign-label", data)
 
     @classmethod
-    def delete(cls, cluster_id_label):
+    def delete(cls, cluster_id_label, client=None):
         """
         Delete the cluster with id/label `cluster_id_label`.
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         return conn.delete(cls.element_path(cluster_id_label))
 
     @classmethod
@@ -667,11 +712,11 @@ class Cluster(Resource):
         return arguments
 
     @classmethod
-    def snapshot(cls, cluster_id_label, s3_location, backup_type):
+    def snapshot(cls, cluster_id_label, s3_location, backup_type, client=None):
         """
         Create hbase snapshot full/incremental
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         parameters = {}
         parameters['s3_location'] = s3_location
         if backup_type:
@@ -679,11 +724,11 @@ class Cluster(Resource):
         return conn.post(cls.element_path(cluster_id_label) + "/snapshots", data=parameters)
 
     @classmethod
-    def restore_point(cls, cluster_id_label, s3_location, backup_id, table_names, overwrite=True, automatic=True):
+    def restore_point(cls, cluster_id_label, s3_location, backup_id, table_names, overwrite=True, automatic=True, client=None):
         """
         Restoring cluster from a given hbase snapshot id
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         parameters = {}
         parameters['s3_location'] = s3_location
         parameters['backup_id'] = backup_id
@@ -693,19 +738,19 @@ class Cluster(Resource):
         return conn.post(cls.element_path(cluster_id_label) + "/restore_point", data=parameters)
 
     @classmethod
-    def get_snapshot_schedule(cls, cluster_id_label):
+    def get_snapshot_schedule(cls, cluster_id_label, client=None):
         """
         Get details for snapshot schedule
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         return conn.get(cls.element_path(cluster_id_label) + "/snapshot_schedule")
 
     @classmethod
-    def update_snapshot_schedule(cls, cluster_id_label, s3_location=None, frequency_unit=None, frequency_num=None, status=None):
+    def update_snapshot_schedule(cls, cluster_id_label, s3_location=None, frequency_unit=None, frequency_num=None, status=None, client=None):
         """
         Update for snapshot schedule
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
 
         data = {}
         if s3_location is not None:
@@ -721,34 +766,145 @@ class Cluster(Resource):
 
 
     @classmethod
-    def add_node(cls, cluster_id_label, parameters=None):
+    def add_node(cls, cluster_id_label, parameters=None, client=None):
       """
       Add a node to an existing cluster
       """
-      conn = Qubole.agent(version=Cluster.api_version)
+      conn = (client or Qubole).agent(version=Cluster.api_version)
       parameters = {} if not parameters else parameters
       return conn.post(cls.element_path(cluster_id_label) + "/nodes", data={"parameters" : parameters})
 
     @classmethod
-    def remove_node(cls, cluster_id_label, private_dns, parameters=None):
+    def remove_node(cls, cluster_id_label, private_dns, parameters=None, client=None):
         """
         Add a node to an existing cluster
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         parameters = {} if not parameters else parameters
         data = {"private_dns" : private_dns, "parameters" : parameters}
         return conn.delete(cls.element_path(cluster_id_label) + "/nodes", data)
 
     @classmethod
-    def update_node(cls, cluster_id_label, command, private_dns, parameters=None):
+    def update_node(cls, cluster_id_label, command, private_dns, parameters=None, client=None):
         """
         Add a node to an existing cluster
         """
-        conn = Qubole.agent(version=Cluster.api_version)
+        conn = (client or Qubole).agent(version=Cluster.api_version)
         parameters = {} if not parameters else parameters
         data = {"command" : command, "private_dns" : private_dns, "parameters" : parameters}
         return conn.put(cls.element_path(cluster_id_label) + "/nodes", data)
 
+
+class ClusterStateChange(object):
+    """
+    A transition of a cluster from one state to another, seen by a
+    ClusterWatcher. `previous_state` is None on the first poll
+    """
+
+    def __init__(self, cluster_id_label, previous_state, state, status):
+        self.cluster_id_label = cluster_id_label
+        self.previous_state = previous_state
+        self.state = state
+        # the response of Cluster.status, eg: with the nodes of the cluster
+        self.status = status
+        self.time = time.time()
+
+    def __repr__(self):
+        return "<ClusterStateChange %s: %s -> %s>" % (
+            self.cluster_id_label, self.previous_state, self.state)
+
+
+class ClusterWatcher(object):
+    """
+    Polls the states of several clusters in one loop, fetching them
+    concurrently over the shared connection pool. Waits between polls follow
+    the configured poll policy (see Qubole.configure), and start over from
+    its first interval after each transition: with an AdaptivePollPolicy,
+    clusters changing state are polled often and stable ones less and less.
+    """
+
+    def __init__(self, cluster_id_labels, max_workers=10, client=None):
+        """
+        Args:
+            `cluster_id_labels`: id/label, or list of ids/labels of clusters
+            `max_workers`: maximum number of requests in flight at once
+            `client`: QuboleClient to use instead of the Qubole singleton
+        """
+        if isinstance(cluster_id_labels, string_types + (int,)):
+            cluster_id_labels = [cluster_id_labels]
+        # last known state of each cluster, None until polled
+        self.states = OrderedDict((id, None) for id in cluster_id_labels)
+        self.max_workers = max_workers
+        self._client = client
+
+    def _status(self, cluster_id_label):
+        return cluster_id_label, Cluster.status(cluster_id_label, client=self._client)
+
+    def poll(self, pool=None):
+        """
+        Fetches the states of the clusters
+
+        Returns:
+            A list of ClusterStateChange, one per cluster whose state changed
+        """
+        if pool is None or len(self.states) == 1:
+            statuses = [self._status(id) for id in self.states]
+        else:
+            statuses = pool.map(self._status, list(self.states))
+        changes = []
+        for id, status in statuses:
+            state = (status.get("state") or "").upper() or None
+            if state != self.states[id]:
+                changes.append(ClusterStateChange(id, self.states[id], state, status))
+                self.states[id] = state
+        return changes
+
+    def watch(self, until=None, timeout=None):
+        """
+        Returns:
+            A generator yielding a ClusterStateChange for each transition
+            seen, until all the clusters are in one of the states `until`,
+            if given, or for `timeout` secs otherwise
+
+        Raises:
+            WaitTimeoutError: if they are not in one of `until` after
+            `timeout` secs
+        """
+        if isinstance(until, string_types):
+            until = [until]
+        targets = set(state.upper() for state in until) if until is not None else None
+        deadline = time.time() + timeout if timeout is not None else None
+        qubole = self._client or Qubole
+        qubole.agent()
+        pool = ThreadPool(min(self.max_workers, len(self.states))) if len(self.states) > 1 else None
+        try:
+            poller = qubole.poller()
+            while True:
+                changes = self.poll(pool)
+                for change in changes:
+                    yield change
+                if targets is not None and all(state in targets for state in self.states.values()):
+                    return
+                if changes:
+                    poller = qubole.poller()
+                max_delay = None
+                if deadline is not None:
+                    max_delay = deadline - time.time()
+                    if max_delay <= 0 and targets is None:
+                        return
+                    if max_delay <= 0:
+                        raise WaitTimeoutError(
+                            "Clusters did not reach %s within %s seconds: %s" % (
+                                "|".join(sorted(targets or [])), timeout,
+                                ", ".join("%s is %s" % item for item in self.states.items())),
+                            dict(self.states))
+                poller.wait(max_delay)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+
 class ClusterInfo():
     """
     qds_sdk.ClusterInfo is the class which stores information about a cluster.
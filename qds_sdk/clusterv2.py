@@ -775,34 +775,34 @@ class ClusterV2(Resource):
     api_version = "v2"
 
     @classmethod
-    def create(cls, cluster_info):
+    def create(cls, cluster_info, client=None):
         """
         Create a new cluster using information provided in `cluster_info`.
         """
 
-        conn = Qubole.agent(version=cls.api_version)
+        conn = (client or Qubole).agent(version=cls.api_version)
         return conn.post(cls.rest_entity_path, data=cluster_info)
 
     @classmethod
-    def update(cls, cluster_id_label, cluster_info):
+    def update(cls, cluster_id_label, cluster_info, client=None):
         """
         Update the cluster with id/label `cluster_id_label` using information provided in
         `cluster_info`.
         """
-        conn = Qubole.agent(version=cls.api_version)
+        conn = (client or Qubole).agent(version=cls.api_version)
         return conn.put(cls.element_path(cluster_id_label), data=cluster_info)
 
     @classmethod
-    def clone(cls, cluster_id_label, cluster_info):
+    def clone(cls, cluster_id_label, cluster_info, client=None):
         """
         Update the cluster with id/label `cluster_id_label` using information provided in
         `cluster_info`.
         """
-        conn = Qubole.agent(version=cls.api_version)
+        conn = (client or Qubole).agent(version=cls.api_version)
         return conn.post(cls.element_path(cluster_id_label) + '/clone', data=cluster_info)
 
     @classmethod
-    def list(cls, label=None, cluster_id=None, state=None, page=None, per_page=None):
+    def list(cls, label=None, cluster_id=None, state=None, page=None, per_page=None, client=None):
         """
         List existing clusters present in your account.
 
@@ -815,16 +815,16 @@ class ClusterV2(Resource):
             List of clusters satisfying the given criteria
         """
         if cluster_id is not None:
-            return cls.show(cluster_id)
+            return cls.show(cluster_id, client=client)
         if label is not None:
-            return cls.show(label)
+            return cls.show(label, client=client)
         params = {}
         if page:
             params['page'] = page
         if per_page:
             params['per_page'] = per_page
         params = None if not params else params
-        conn = Qubole.agent(version=cls.api_version)
+        conn = (client or Qubole).agent(version=cls.api_version)
         cluster_list = conn.get(cls.rest_entity_path)
         if state is None:
             # return the complete list since state is None
@@ -838,9 +838,9 @@ class ClusterV2(Resource):
         return result
 
     @classmethod
-    def show(cls, cluster_id_label):
+    def show(cls, cluster_id_label, client=None):
         """
         Show information about the cluster with id/label `cluster_id_label`.
         """
-        conn = Qubole.agent(version=cls.api_version)
+        conn = (client or Qubole).agent(version=cls.api_version)
         return conn.get(cls.element_path(cluster_id_label))
@@ -0,0 +1,120 @@
+"""
+The columnar module converts batches of command result rows into typed
+columns, using the QBOL-QUERY-SCHEMA of the command to pick column types.
+
+NumPy and pyarrow are optional dependencies; they are imported only when
+the corresponding output format is requested.
+"""
+from collections import OrderedDict
+import re
+
+# Values the result files use to denote NULL
+NULL_VALUES = ('', 'NULL', '\\N')
+
+_INTEGER_TYPES = ('tinyint', 'smallint', 'int', 'integer', 'bigint')
+_FLOAT_TYPES = ('float', 'double', 'real', 'decimal')
+_BOOLEAN_TYPES = ('boolean',)
+
+
+def _base_type(column_type):
+    """
+    Strips type parameters, eg: decimal(10,2) -> decimal
+    """
+    return re.sub(r'\(.*\)$', '', (column_type or 'string').strip().lower())
+
+
+def column_names(schema, width):
+    """
+    Returns:
+        the column names of the schema, or c0, c1 .. if it is not known
+    """
+    if schema:
+        return [column["ColumnName"] for column in schema]
+    return ["c%d" % i for i in range(width)]
+
+
+def column_types(schema, width):
+    if schema:
+        return [_base_type(column.get("ColumnType")) for column in schema]
+    return ['string'] * width
+
+
+def to_numpy(rows, schema=None):
+    """
+    Converts a batch of rows into NumPy arrays. Integer columns become int64
+    arrays (float64 if they hold NULLs), floating point and decimal columns
+    float64, boolean columns bool and all other columns unicode strings.
+
+    Args:
+        `rows`: list of rows, each a list of column values (strings)
+        `schema`: list of column descriptions, see commands._result_schema
+
+    Returns:
+        An OrderedDict of column name to array
+    """
+    import numpy
+
+    width = len(schema) if schema else (len(rows[0]) if rows else 0)
+    columns = OrderedDict()
+    for name, column_type, values in zip(column_names(schema, width),
+                                         column_types(schema, width),
+                                         _transpose(rows, width)):
+        array = numpy.array(values, dtype=numpy.str_)
+        if column_type in _INTEGER_TYPES or column_type in _FLOAT_TYPES:
+            nulls = numpy.isin(array, NULL_VALUES)
+            if nulls.any():
+                array = numpy.where(nulls, 'nan', array).astype(numpy.float64)
+            elif column_type in _INTEGER_TYPES:
+                array = array.astype(numpy.int64)
+            else:
+                array = array.astype(numpy.float64)
+        elif column_type in _BOOLEAN_TYPES:
+            array = numpy.char.lower(array) == 'true'
+        columns[name] = array
+    return columns
+
+
+def to_arrow(rows, schema=None):
+    """
+    Converts a batch of rows into a pyarrow RecordBatch. NULL markers become
+    nulls and values are cast to the arrow type matching the column type.
+
+    Args:
+        `rows`: list of rows, each a list of column values (strings)
+        `schema`: list of column descriptions, see commands._result_schema
+
+    Returns:
+        A pyarrow.RecordBatch
+    """
+    import pyarrow
+
+    arrow_types = {}
+    arrow_types.update((t, pyarrow.int64()) for t in _INTEGER_TYPES)
+    arrow_types.update((t, pyarrow.float64()) for t in _FLOAT_TYPES)
+    arrow_types.update((t, pyarrow.bool_()) for t in _BOOLEAN_TYPES)
+
+    width = len(schema) if schema else (len(rows[0]) if rows else 0)
+    names = column_names(schema, width)
+    arrays = []
+    for column_type, values in zip(column_types(schema, width),
+                                   _transpose(rows, width)):
+        target = arrow_types.get(column_type)
+        if target is None:
+            arrays.append(pyarrow.array(values, type=pyarrow.string()))
+            continue
+        values = [None if value in NULL_VALUES else value for value in values]
+        if target == pyarrow.bool_():
+            values = [None if value is None else value.lower() for value in values]
+        arrays.append(pyarrow.array(values, type=pyarrow.string()).cast(target))
+    return pyarrow.RecordBatch.from_arrays(arrays, names=names)
+
+
+def _transpose(rows, width):
+    """
+    Returns the columns of rows, padding short rows with NULLs
+    """
+    if not rows:
+        return [[] for _ in range(width)]
+    padded = (row if len(row) >= width else row + [''] * (width - len(row))
+              for row in rows)
+    return [list(column) for column in zip(*padded)][:width]
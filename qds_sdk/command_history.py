@@ -0,0 +1,131 @@
+"""
+The command_history module exports the command history of an account over
+a date range. The range is split into shards whose pages are fetched
+concurrently; commands are de-duplicated by id (shards share their
+boundaries) and streamed out as they arrive, in no particular order.
+"""
+import json
+import logging
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+
+from six.moves import queue
+
+from qds_sdk.qubole import Qubole
+
+log = logging.getLogger("qds_command_history")
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+_INPUT_DATE_FORMATS = (DATE_FORMAT, "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+
+
+def parse_date(value):
+    """
+    Returns:
+        `value` as a datetime. It can be a datetime or a string such as
+        2019-01-22T15:11:00Z or 2019-01-22
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    for date_format in _INPUT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError("Invalid date '%s', expected a date like 2019-01-22T15:11:00Z" % value)
+
+
+def shards(start_date, end_date, shard_size=timedelta(days=1)):
+    """
+    Splits [start_date, end_date] into consecutive ranges of `shard_size`
+
+    Returns:
+        A list of (start_date, end_date) strings in the format of the API
+    """
+    start_date, end_date = parse_date(start_date), parse_date(end_date)
+    result = []
+    while start_date < end_date:
+        shard_end = min(start_date + shard_size, end_date)
+        result.append((start_date.strftime(DATE_FORMAT), shard_end.strftime(DATE_FORMAT)))
+        start_date = shard_end
+    return result
+
+
+def iter_history(start_date=None, end_date=None, parallel=4, per_page=100,
+                 shard_size=timedelta(days=1), client=None, **filters):
+    """
+    Fetches all the commands created between `start_date` and `end_date`
+
+    Args:
+        `start_date`: beginning of the range. without it the history is not
+                      sharded and its pages are fetched one after the other
+        `end_date`: end of the range. defaults to now
+        `parallel`: maximum number of requests in flight at once
+        `per_page`: number of commands fetched per request
+        `shard_size`: timedelta covered by each shard
+        `client`: QuboleClient to use instead of the Qubole singleton
+        `**filters`: other parameters of Command.list, eg: all_users=1
+
+    Returns:
+        A generator of command dicts, each command appearing once
+    """
+    if start_date is not None:
+        ranges = shards(start_date, end_date or datetime.utcnow(), shard_size)
+    else:
+        ranges = [(None, end_date)]
+    if not ranges:
+        return
+
+    conn = (client or Qubole).agent()
+    results = queue.Queue()
+
+    def _fetch(shard, page):
+        params = dict((k, v) for k, v in filters.items() if v)
+        params.update(page=page, per_page=per_page)
+        if shard[0] is not None:
+            params["start_date"] = shard[0]
+        if shard[1] is not None:
+            params["end_date"] = shard[1]
+        try:
+            results.put((shard, conn.get("commands", params=params), None))
+        except Exception as e:
+            results.put((shard, None, e))
+
+    pool = ThreadPool(max(1, parallel))
+    try:
+        for shard in ranges:
+            pool.apply_async(_fetch, (shard, 1))
+        pending = len(ranges)
+        seen = set()
+        while pending:
+            shard, response, error = results.get()
+            pending -= 1
+            if error is not None:
+                raise error
+            next_page = (response.get("paging_info") or {}).get("next_page")
+            if next_page:
+                pool.apply_async(_fetch, (shard, next_page))
+                pending += 1
+            for command in response.get("commands") or []:
+                if command["id"] not in seen:
+                    seen.add(command["id"])
+                    yield command
+    finally:
+        pool.terminate()
+
+
+def export(fp, start_date=None, end_date=None, parallel=4, per_page=100,
+           shard_size=timedelta(days=1), client=None, **filters):
+    """
+    Writes the commands of iter_history to `fp` as JSON Lines
+
+    Returns:
+        the number of commands written
+    """
+    count = 0
+    for command in iter_history(start_date, end_date, parallel, per_page,
+                                shard_size, client, **filters):
+        fp.write(json.dumps(command, sort_keys=True) + "\n")
+        count += 1
+    log.info("Exported %d commands" % count)
+    return count
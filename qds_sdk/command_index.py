@@ -0,0 +1,214 @@
+"""
+The command_index module keeps a local SQLite index of command metadata, so
+that analytics over the command history (eg: which Hive commands tagged X
+failed on cluster Y last week) run locally instead of over the API.
+
+The index is synced incrementally: only commands newer than the newest one
+indexed are listed, and commands which were not done yet are refreshed.
+"""
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+from qds_sdk.command_history import parse_date, DATE_FORMAT
+from qds_sdk.commands import Command
+from qds_sdk.qubole import Qubole
+from qds_sdk.resource import iter_pages
+
+log = logging.getLogger("qds_command_index")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    status TEXT,
+    command_type TEXT,
+    label TEXT,
+    qbol_user_id INTEGER,
+    created_at TEXT,
+    updated_at TEXT,
+    attributes TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS commands_status ON commands (status);
+CREATE INDEX IF NOT EXISTS commands_command_type ON commands (command_type);
+CREATE INDEX IF NOT EXISTS commands_label ON commands (label);
+CREATE INDEX IF NOT EXISTS commands_created_at ON commands (created_at);
+CREATE INDEX IF NOT EXISTS commands_updated_at ON commands (updated_at);
+CREATE TABLE IF NOT EXISTS command_tags (
+    tag TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (tag, id)
+);
+"""
+
+_DONE_STATUSES = ("done", "error", "cancelled")
+
+
+class CommandIndex(object):
+
+    def __init__(self, path):
+        """
+        Args:
+            `path`: path of the SQLite database. created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, commands):
+        """
+        Adds or replaces commands in the index
+
+        Args:
+            `commands`: iterable of Command objects or command dicts, as
+                        returned by Command.find and Command.list
+        """
+        rows = []
+        tagged = []
+        tags = []
+        for command in commands:
+            attributes = getattr(command, "attributes", command)
+            rows.append((attributes["id"],
+                         attributes.get("status"),
+                         attributes.get("command_type"),
+                         attributes.get("label"),
+                         attributes.get("qbol_user_id"),
+                         attributes.get("created_at"),
+                         attributes.get("updated_at"),
+                         json.dumps(attributes, sort_keys=True)))
+            command_tags = _tags(attributes)
+            # payloads without tags, eg: from Command.find, keep those indexed
+            if command_tags is not None:
+                tagged.append((attributes["id"],))
+                tags.extend((tag, attributes["id"]) for tag in command_tags)
+        with self._lock:
+            with self._db:
+                self._db.executemany("DELETE FROM command_tags WHERE id = ?", tagged)
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO commands VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO command_tags VALUES (?, ?)", tags)
+        return len(rows)
+
+    def newest_id(self):
+        """
+        Returns:
+            the largest command id in the index, None if it is empty
+        """
+        with self._lock:
+            return self._db.execute("SELECT MAX(id) FROM commands").fetchone()[0]
+
+    def sync(self, per_page=100, client=None, **filters):
+        """
+        Indexes the commands created since the last sync, and refreshes the
+        commands which were not done at the time
+
+        Args:
+            `per_page`: number of commands listed per request
+            `client`: QuboleClient to use instead of the Qubole singleton
+            `**filters`: other parameters of Command.list, eg: all_users=1
+
+        Returns:
+            the number of commands added or updated
+        """
+        newest_id = self.newest_id()
+        conn = (client or Qubole).agent()
+        params = dict((k, v) for k, v in filters.items() if v)
+        # tags are only listed along with the query properties
+        params.setdefault("include_query_properties", True)
+        count = 0
+        # commands are listed newest first
+        for page in iter_pages(conn, Command.rest_entity_path, per_page, params=params):
+            commands = page.get("commands") or []
+            new = [c for c in commands if newest_id is None or c["id"] > newest_id]
+            count += self.add(new)
+            if len(new) < len(commands):
+                break
+
+        with self._lock:
+            pending = [row[0] for row in self._db.execute(
+                "SELECT id FROM commands WHERE status NOT IN (?, ?, ?)", _DONE_STATUSES)]
+        if pending:
+            count += self.add(Command.find_many(pending, client=client))
+        log.info("Indexed %d commands" % count)
+        return count
+
+    def query(self, status=None, command_type=None, label=None, tag=None,
+              since=None, until=None, qbol_user_id=None, limit=None):
+        """
+        Finds indexed commands, newest first. All criteria are optional
+
+        Args:
+            `status`: eg: error
+            `command_type`: eg: HiveCommand
+            `label`: cluster label the commands ran on
+            `tag`: tag the commands have
+            `since`: only commands created at or after this date
+            `until`: only commands created before this date
+            `qbol_user_id`: id of the user who ran the commands
+            `limit`: maximum number of commands returned
+
+        Returns:
+            A list of command dicts
+        """
+        clauses = []
+        args = []
+        for column, value in (("status", status), ("command_type", command_type),
+                              ("label", label), ("qbol_user_id", qbol_user_id)):
+            if value is not None:
+                clauses.append("c.%s = ?" % column)
+                args.append(value)
+        if since is not None:
+            clauses.append("c.created_at >= ?")
+            args.append(_format_date(since))
+        if until is not None:
+            clauses.append("c.created_at < ?")
+            args.append(_format_date(until))
+        sql = "SELECT c.attributes FROM commands c"
+        if tag is not None:
+            sql += " JOIN command_tags t ON t.id = c.id AND t.tag = ?"
+            args.insert(0, tag)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY c.id DESC"
+        if limit is not None:
+            sql += " LIMIT %d" % int(limit)
+        with self._lock:
+            return [json.loads(row[0]) for row in self._db.execute(sql, args)]
+
+
+def _tags(attributes):
+    """
+    Returns:
+        the set of tags of a command, None if its payload has no tags
+    """
+    if "tags" in attributes:
+        tags = attributes["tags"]
+    elif "tags" in (attributes.get("query_properties") or {}):
+        tags = attributes["query_properties"]["tags"]
+    else:
+        return None
+    tags = tags or []
+    if not isinstance(tags, list):
+        tags = str(tags).split(",")
+    return set(tag.strip() for tag in tags if tag and tag.strip())
+
+
+def _format_date(value):
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    return parse_date(value).strftime(DATE_FORMAT)
@@ -7,12 +7,15 @@ the specific commands
 from __future__ import print_function
 from qds_sdk.qubole import Qubole
 from qds_sdk.resource import Resource
-from qds_sdk.exception import ParseError
+from qds_sdk.connection import Connection, RETRY_EXCEPTIONS, IDEMPOTENT_RETRY_EXCEPTIONS
+from qds_sdk.exception import ParseError, Error, AlwaysRetryWithDelay
+from qds_sdk.rate_limiter import TokenBucket
+from qds_sdk.instrumentation import notify
 from qds_sdk.account import Account
 from qds_sdk.util import GentleOptionParser, OptionParsingError, OptionParsingExit, _is_cloud_url
 from optparse import SUPPRESS_HELP
+from multiprocessing.pool import ThreadPool
 
-import boto
 import time
 import logging
 import sys
@@ -21,12 +24,31 @@ import pipes
 import os
 import json
 import signal
+import collections
+import io
+import threading
+import weakref
 
 log = logging.getLogger("qds_commands")
 
 # Pattern matcher for s3 path
 _URI_RE = re.compile(r's3://([^/]+)/?(.*)')
 
+# Size of the byte ranges fetched by parallel result downloads
+_RESULT_PART_SIZE = 8 * 1024 * 1024
+# Size of the reads when streaming a result object
+_READ_BUFFER_SIZE = 1024 * 1024
+
+# Seconds for which temporary storage credentials are reused
+_S3_CREDENTIALS_TTL = 10 * 60
+# Header and tag carrying the idempotency key of a command creation
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TAG_PREFIX = "idempotency-key-"
+
+# boto S3 connections cached by _connect_s3, per account
+_s3_connections = {}
+_s3_connections_lock = threading.Lock()
+
 
 class Command(Resource):
 
@@ -53,6 +75,18 @@ class Command(Resource):
                           help="the date from which you want the command history")
     listparser.add_option("-e", "--end-date", dest="end_date",
                           help="the date until which you want the command history")
+    listparser.add_option("--all-pages", action="store_true", dest="all_pages", default=False,
+                          help="fetch all the pages of the command history and print them "
+                               "as JSON Lines, one command per line")
+    listparser.add_option("--parallel", dest="parallel", type="int", default=4,
+                          help="with --all-pages, number of pages fetched concurrently. "
+                               "the date range is split into one day shards. default: 4")
+
+    getresultusage = "<subcommand> getresult <id> [include_header] [options]"
+    getresultparser = GentleOptionParser(usage=getresultusage)
+    getresultparser.add_option("-c", "--concurrency", dest="concurrency", type="int", default=1,
+                               help="number of parallel downloads used to fetch results "
+                                    "from the cloud store. default: 1")
 
     @staticmethod
     def is_done(status):
@@ -71,7 +105,7 @@ class Command(Resource):
         return status == "done"
 
     @classmethod
-    def list(cls, **kwargs):
+    def list(cls, client=None, **kwargs):
         """
         List a command by issuing a GET request to the /command endpoint
 
@@ -88,8 +122,10 @@ class Command(Resource):
                         * session_id, etc
 
             For example - Command.list(command_type = "HiveQuery", status = "success")
+
+            `client`: QuboleClient to use instead of the Qubole singleton
         """
-        conn = Qubole.agent()
+        conn = (client or Qubole).agent()
         params = {}
         for k in kwargs:
             if kwargs[k]:
@@ -109,81 +145,305 @@ class Command(Resource):
         return vars(options)
 
     @classmethod
-    def create(cls, **kwargs):
+    def getresultparse(cls, args):
+        """
+        Parse the arguments of the getresult action
+
+        Returns:
+            A tuple of the options dictionary and the remaining positional
+            arguments, or None if only help was requested
+        """
+        try:
+            (options, args) = cls.getresultparser.parse_args(args)
+        except OptionParsingError as e:
+            raise ParseError(e.msg, cls.getresultparser.format_help())
+        except OptionParsingExit:
+            return None
+
+        if options.concurrency < 1:
+            raise ParseError("concurrency should be a positive integer",
+                             cls.getresultparser.format_help())
+        return vars(options), args
+
+    @classmethod
+    def create(cls, client=None, idempotency_key=None, **kwargs):
         """
         Create a command object by issuing a POST request to the /command endpoint
         Note - this does not wait for the command to complete
 
         Args:
+            `client`: QuboleClient to use instead of the Qubole singleton
+            `idempotency_key`: unique string identifying this creation, eg:
+                               uuid.uuid4().hex. It is sent as a header and a
+                               tag of the command, which makes the creation
+                               safe to retry on timeouts and connection
+                               errors: before resubmitting, recent commands
+                               are searched for the tag
             `**kwargs`: keyword arguments specific to command type
 
         Returns:
             Command object
         """
 
-        conn = Qubole.agent()
+        conn = (client or Qubole).agent()
+        kwargs = cls._create_payload(kwargs)
+        if idempotency_key is not None:
+            return cls._create_idempotent(conn, kwargs, idempotency_key, client)
+        return cls(conn.post(cls.rest_entity_path, data=kwargs), client)
+
+    @classmethod
+    def _create_payload(cls, kwargs):
         if kwargs.get('command_type') is None:
             kwargs['command_type'] = cls.__name__
-        if kwargs.get('tags') is not None:
+        if kwargs.get('tags') is not None and not isinstance(kwargs['tags'], list):
             kwargs['tags'] = kwargs['tags'].split(',')
+        return kwargs
+
+    @classmethod
+    def _create_idempotent(cls, conn, payload, idempotency_key, client):
+        payload['tags'] = (payload.get('tags') or []) + [IDEMPOTENCY_TAG_PREFIX + idempotency_key]
+        headers = {IDEMPOTENCY_HEADER: idempotency_key}
+        policy = conn.get_retry_policy()
+        endpoint = policy.endpoint("POST", cls.rest_entity_path)
+        started = time.time()
+        attempt = 0
+        reconcile = False
+        while True:
+            policy.before_call(endpoint)
+            try:
+                if reconcile:
+                    # the previous attempt may have created the command. the
+                    # lookup is retried by this loop, not by conn.get
+                    existing = cls._find_by_idempotency_key(
+                        lambda path, params: conn._api_call("GET", path, params=params),
+                        idempotency_key, client=client)
+                    if existing is not None:
+                        log.info("Found command %s created by a previous attempt" % existing.id)
+                        return existing
+                    reconcile = False
+                response = conn._api_call("POST", cls.rest_entity_path, data=payload,
+                                          headers=headers)
+            except IDEMPOTENT_RETRY_EXCEPTIONS as e:
+                sleep_for = policy.on_failure(
+                    endpoint, e, attempt, started,
+                    Connection._get_retry_after(getattr(e, 'request', None)))
+                if sleep_for is None:
+                    raise
+                notify(conn.instrumentation, 'on_retry', endpoint, e, sleep_for)
+                log.info("%s, Retrying in %d seconds..." % (e.__class__.__name__, sleep_for))
+                time.sleep(sleep_for)
+                attempt += 1
+                # a throttled (429/503) POST was not accepted, no need to look
+                # for the command it would have created
+                if not isinstance(e, AlwaysRetryWithDelay):
+                    reconcile = True
+            except Error as e:
+                # the server answered, which closes a half open circuit
+                if not isinstance(e, RETRY_EXCEPTIONS):
+                    policy.on_success(endpoint)
+                raise
+            else:
+                policy.on_success(endpoint)
+                return cls(response, client)
+
+    @classmethod
+    def find_by_idempotency_key(cls, idempotency_key, lookback=100, client=None):
+        """
+        Finds a command created with an idempotency key
+
+        Args:
+            `idempotency_key`: the key given to create
+            `lookback`: number of most recent commands searched
 
-        return cls(conn.post(cls.rest_entity_path, data=kwargs))
+        Returns:
+            Command object, or None if no such command was found
+        """
+        conn = (client or Qubole).agent()
+        return cls._find_by_idempotency_key(conn.get, idempotency_key, lookback, client)
 
     @classmethod
-    def run(cls, **kwargs):
+    def _find_by_idempotency_key(cls, get, idempotency_key, lookback=100, client=None):
+        tag = IDEMPOTENCY_TAG_PREFIX + idempotency_key
+        # tags are only listed along with the query properties
+        response = get(cls.rest_entity_path,
+                       params={"per_page": lookback, "include_query_properties": True})
+        for command in response.get("commands") or []:
+            tags = command.get("tags") or (command.get("query_properties") or {}).get("tags")
+            if tags and tag in tags:
+                return cls(command, client)
+        return None
+
+    @classmethod
+    def create_many(cls, specs, max_workers=10, rate=10, burst=None,
+                    max_retries=7, rate_limiter=None, client=None):
+        """
+        Creates many commands concurrently, without exceeding a request rate.
+        Throttling responses (429/503) from any worker slow all of them down
+        and the throttled creations are retried.
+
+        Args:
+            `specs`: iterable of dicts of keyword arguments to create
+            `max_workers`: maximum number of requests in flight at once
+            `rate`: maximum number of creations per second
+            `burst`: number of creations sent at once at the start
+            `max_retries`: number of retries of a throttled creation
+            `rate_limiter`: a qds_sdk.rate_limiter.TokenBucket, to share the
+                            rate between several calls. overrides rate/burst
+            `client`: QuboleClient to use instead of the Qubole singleton
+
+        Returns:
+            A list, in the order of `specs`, holding for each spec either
+            the created Command object or the exception raised creating it
+        """
+        specs = list(specs)
+        if not specs:
+            return []
+        limiter = rate_limiter or TokenBucket(rate, burst)
+        conn = (client or Qubole).agent()
+
+        def _create(spec):
+            payload = cls._create_payload(dict(spec))
+            retries = 0
+            while True:
+                limiter.acquire()
+                try:
+                    # not conn.post, whose retries would sleep per call
+                    response = conn._api_call("POST", cls.rest_entity_path, data=payload)
+                except AlwaysRetryWithDelay as e:
+                    limiter.throttled(Connection._get_retry_after(e.request))
+                    retries += 1
+                    if retries > max_retries:
+                        return e
+                    continue
+                except Exception as e:
+                    return e
+                limiter.succeeded()
+                return cls(response, client)
+
+        pool = ThreadPool(min(max_workers, len(specs)))
+        try:
+            return pool.map(_create, specs)
+        finally:
+            pool.close()
+            pool.join()
+
+    @classmethod
+    def run(cls, client=None, **kwargs):
         """
         Create a command object by issuing a POST request to the /command endpoint
         Waits until the command is complete. Repeatedly polls to check status
 
         Args:
+            `client`: QuboleClient to use instead of the Qubole singleton
             `**kwargs`: keyword arguments specific to command type
 
         Returns:
             Command object
         """
 
-        # vars to keep track of actual logs bytes (err, tmp) and new bytes seen in each iteration
-        err_pointer, tmp_pointer, new_bytes = 0, 0, 0
+        # keeps track of the log bytes (err, tmp) seen so far
+        log_tail = _LogTail()
         print_logs_live = kwargs.pop("print_logs_live", None) # We don't want to send this to the API.
 
-        cmd = cls.create(**kwargs)
+        cmd = cls.create(client=client, **kwargs)
 
         sighandler = SignalHandler()
+        poller = (client or Qubole).poller()
 
         while not Command.is_done(cmd.status):
             if sighandler.received_term_signal:
                 logging.warning("Received signal {}. Canceling Qubole Command ID: {}".format(sighandler.last_signal, cmd.id))
                 cls.cancel(cmd)
                 exit()
-            time.sleep(Qubole.poll_interval)
-            cmd = cls.find(cmd.id)
+            poller.wait()
+            cmd = cls.find(cmd.id, client=client)
             if print_logs_live is True:
-                log, err_length, tmp_length = cmd.get_log_partial(err_pointer, tmp_pointer)
-
-                # if err length is non zero, then tmp_pointer needs to be reset to the current tmp_length as the
-                # err_length will contain the full set of logs from last seen non-zero err_length.
-                if err_length != "0":
-                    err_pointer += int(err_length)
-                    new_bytes = int(err_length) + int(tmp_length) - tmp_pointer
-                    tmp_pointer = int(tmp_length)
-                else:
-                    tmp_pointer += int(tmp_length)
-                    new_bytes = int(tmp_length)
-
-                if len(log) > 0 and new_bytes > 0:
-                    print(log[-new_bytes:], file=sys.stderr)
+                log = b"".join(cmd._read_new_log(log_tail))
+                if log:
+                    print(log.decode('utf-8', 'replace'), file=sys.stderr)
 
         return cmd
 
     @classmethod
-    def cancel_id(cls, id):
+    def find_many(cls, ids, max_workers=10, client=None):
+        """
+        Fetches several commands concurrently over the shared connection pool
+
+        Args:
+            `ids`: iterable of command ids
+            `max_workers`: maximum number of requests in flight at once
+            `client`: QuboleClient to use instead of the Qubole singleton
+
+        Returns:
+            List of Command objects, in the order of `ids`
+        """
+        ids = list(ids)
+        if not ids:
+            return []
+        # create the cached agent before the workers share it
+        (client or Qubole).agent()
+        pool = ThreadPool(min(max_workers, len(ids)))
+        try:
+            return pool.map(lambda id: cls.find(id, client=client), ids)
+        finally:
+            pool.close()
+            pool.join()
+
+    @classmethod
+    def wait_all(cls, ids, max_workers=10, client=None):
+        """
+        Polls a set of commands until all of them are done. Each poll fetches
+        the pending commands concurrently, at most `max_workers` at a time.
+
+        Args:
+            `ids`: iterable of command ids
+            `max_workers`: maximum number of requests in flight at once
+            `client`: QuboleClient to use instead of the Qubole singleton
+
+        Returns:
+            A generator yielding each Command object as soon as it reaches a
+            terminal state (see `is_done`), in order of completion
+        """
+        pending = []
+        for id in ids:
+            if id not in pending:
+                pending.append(id)
+        if not pending:
+            return
+
+        (client or Qubole).agent()
+        pool = ThreadPool(min(max_workers, len(pending)))
+        poller = (client or Qubole).poller()
+
+        def _find(id):
+            return id, cls.find(id, client=client)
+
+        try:
+            while True:
+                running = []
+                for id, cmd in pool.imap_unordered(_find, pending):
+                    if Command.is_done(cmd.status):
+                        yield cmd
+                    else:
+                        running.append(id)
+                if not running:
+                    return
+                pending = running
+                poller.wait()
+        finally:
+            pool.close()
+            pool.join()
+
+    @classmethod
+    def cancel_id(cls, id, client=None):
         """
         Cancels command denoted by this id
 
         Args:
             `id`: command id
+            `client`: QuboleClient to use instead of the Qubole singleton
         """
-        conn = Qubole.agent()
+        conn = (client or Qubole).agent()
         data = {"status": "kill"}
         return conn.put(cls.element_path(id), data)
 
@@ -191,17 +451,18 @@ class Command(Resource):
         """
         Cancels command represented by this object
         """
-        self.__class__.cancel_id(self.id)
+        self.__class__.cancel_id(self.id, client=self._client)
 
     @classmethod
-    def get_log_id(cls, id):
+    def get_log_id(cls, id, client=None):
         """
         Fetches log for the command represented by this id
 
         Args:
             `id`: command id
+            `client`: QuboleClient to use instead of the Qubole singleton
         """
-        conn = Qubole.agent()
+        conn = (client or Qubole).agent()
         r = conn.get_raw(cls.element_path(id) + "/logs")
         return r.text
 
@@ -213,7 +474,7 @@ class Command(Resource):
             The log as a string
         """
         log_path = self.meta_data['logs_resource']
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         r = conn.get_raw(log_path)
         return r.text
 
@@ -229,14 +490,70 @@ class Command(Resource):
                 which have been returned by api in addition to the given pointers.
         """
         log_path = self.meta_data['logs_resource']
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         r = conn.get_raw(log_path, params={'err_file_processed':err_pointer, 'tmp_file_processed':tmp_pointer})
         if 'err_length' in r.headers.keys() and 'tmp_length' in r.headers.keys():
             return [r.text, r.headers['err_length'], r.headers['tmp_length']]
         return [r.text, 0, 0]
 
+    def tail_logs(self, chunk_size=_READ_BUFFER_SIZE):
+        """
+        Follows the log of the command represented by this object until the
+        command is done, polling as configured by the poll policy. Each poll
+        transfers only the log bytes added since the previous one, and they
+        are streamed rather than held in memory. Generators of different
+        commands are independent and can be consumed from different threads.
+
+        Args:
+            `chunk_size`: maximum size of the yielded chunks
+
+        Returns:
+            A generator of byte strings, eg: to copy the log into a file
+                for chunk in cmd.tail_logs():
+                    fp.write(chunk)
+            The attributes of this object are refreshed on each poll.
+        """
+        log_tail = _LogTail()
+        poller = (self._client or Qubole).poller()
+        while True:
+            done = Command.is_done(self.status)
+            for chunk in self._read_new_log(log_tail, chunk_size):
+                yield chunk
+            if done:
+                return
+            poller.wait()
+            self.attributes = self.__class__.find(self.id, client=self._client).attributes
+
+    def _read_new_log(self, log_tail, chunk_size=_READ_BUFFER_SIZE):
+        """
+        Yields the log bytes not seen by `log_tail` yet and advances it.
+        complete lines are yielded as soon as they are received
+        """
+        log_path = self.meta_data['logs_resource']
+        conn = (self._client or Qubole).agent()
+        r = conn.get_raw(log_path, params={'err_file_processed': log_tail.err_pointer,
+                                           'tmp_file_processed': log_tail.tmp_pointer},
+                         stream=True)
+        try:
+            new_bytes = log_tail.advance(r.headers.get('err_length', 0),
+                                         r.headers.get('tmp_length', 0))
+            if new_bytes <= 0:
+                return
+            # the new bytes are at the end of the response
+            chunks = r.iter_content(chunk_size)
+            length = r.headers.get('Content-Length')
+            if length is not None and not r.headers.get('Content-Encoding'):
+                chunks = _skip_bytes(chunks, max(0, int(length) - new_bytes))
+            else:
+                # the length of the body is not known up front
+                chunks = _last_bytes(chunks, new_bytes)
+            for chunk in _complete_lines(chunks, chunk_size):
+                yield chunk
+        finally:
+            r.close()
+
     @classmethod
-    def get_jobs_id(cls, id):
+    def get_jobs_id(cls, id, client=None):
         """
         Fetches information about the hadoop jobs which were started by this
         command id. This information is only available for commands which have
@@ -246,13 +563,15 @@ class Command(Resource):
 
         Args:
             `id`: command id
+            `client`: QuboleClient to use instead of the Qubole singleton
         """
-        conn = Qubole.agent()
+        conn = (client or Qubole).agent()
         r = conn.get_raw(cls.element_path(id) + "/jobs")
         return r.text
 
 
-    def get_results(self, fp=sys.stdout, inline=True, delim=None, fetch=True, qlog=None, arguments=[]):
+    def get_results(self, fp=sys.stdout, inline=True, delim=None, fetch=True, qlog=None, arguments=[],
+                    concurrency=1):
         """
         Fetches the result for the command represented by this object
 
@@ -267,17 +586,34 @@ class Command(Resource):
             `inline`: whether or not results are returned inline as CRLF separated string
             `fetch`: True to fetch the result even if it is greater than 20MB, False to
                      only get the result location on s3
+            `concurrency`: number of parallel downloads used when fetching from s3.
+                     Large objects are fetched as byte ranges and reassembled in order
         """
-        result_path = self.meta_data['results_resource']
-
-        conn = Qubole.agent()
-
         include_header = "false"
         if len(arguments) == 1:
             include_header = arguments.pop(0)
             if include_header not in ('true', 'false'):
                 raise ParseError("incude_header can be either true or false")
 
+        # results of finished commands do not change and can be served from the local cache
+        qubole = self._client or Qubole
+        cache = qubole.result_cache
+        if cache is not None and fetch and Command.is_success(self.attributes.get('status')):
+            key = cache.key(qubole.baseurl, self.id, include_header, delim, inline)
+            if cache.read(key, _binary_writer(fp)):
+                return
+            # the results are written to fp and to the cache as they arrive
+            with cache.writer(key) as cache_fp:
+                self._write_results(_Tee(_binary_writer(fp), cache_fp), inline, delim, fetch,
+                                    qlog, include_header, concurrency)
+            return
+
+        self._write_results(fp, inline, delim, fetch, qlog, include_header, concurrency)
+
+    def _write_results(self, fp, inline, delim, fetch, qlog, include_header, concurrency):
+        result_path = self.meta_data['results_resource']
+
+        conn = (self._client or Qubole).agent()
 
         r = conn.get(result_path, {'inline': inline, 'include_headers': include_header})
         if r.get('inline'):
@@ -299,18 +635,9 @@ class Command(Resource):
                     pass
         else:
             if fetch:
-                if not boto.config.has_section('s3'):
-                    boto.config.add_section('s3')
-                boto.config.set('s3', 'use-sigv4', 'True')
-                storage_credentials = conn.get(Account.credentials_rest_entity_path)
-                host = storage_credentials['region_endpoint'] if storage_credentials['region_endpoint'] else "s3.amazonaws.com"
-                boto_conn = boto.connect_s3(aws_access_key_id=storage_credentials['storage_access_key'],
-                                            aws_secret_access_key=storage_credentials['storage_secret_key'],
-                                            security_token=storage_credentials['session_token'],
-                                            host=host)
+                boto_conn = _connect_s3(conn, self._client or Qubole)
                 log.info("Starting download from result locations: [%s]" % ",".join(r['result_location']))
-                # fetch latest value of num_result_dir
-                num_result_dir = Command.find(self.id).num_result_dir
+                num_result_dir = self.attributes.get('num_result_dir')
 
                 # If column/header names are not able to fetch then use include header as true
                 if include_header.lower() == "true" and qlog is not None:
@@ -324,10 +651,83 @@ class Command(Resource):
                     # If the delim is not None, then both text and binary modes
                     # work.
 
-                    _download_to_local(boto_conn, s3_path, fp, num_result_dir, delim=delim)
+                    _download_to_local(boto_conn, s3_path, fp, num_result_dir, delim=delim,
+                                       concurrency=concurrency)
             else:
                 fp.write(",".join(r['result_location']))
 
+    def iter_results(self, include_header=False, batch_size=None, inline=True):
+        """
+        Iterates over the rows of the result of the command represented by
+        this object. Rows are parsed lazily, whether the results are returned
+        inline or read from their s3 result locations, so memory use does not
+        grow with the size of the result.
+
+        Args:
+            `include_header`: True to yield the column names from the query
+                     schema in `qlog` first, if they are known
+            `batch_size`: if set, yield lists of up to `batch_size` rows
+                     instead of single rows
+            `inline`: whether or not results may be returned inline
+
+        Returns:
+            A generator of rows, each a list of column values (strings)
+        """
+        rows = self._iter_rows(include_header, inline)
+        if batch_size is None:
+            return rows
+        return _batched(rows, batch_size)
+
+    def iter_column_batches(self, batch_size=65536, format="numpy", inline=True):
+        """
+        Iterates over the result of the command represented by this object in
+        batches of typed columns. Column names and types are taken from the
+        query schema in `qlog`. Requires NumPy or pyarrow, see qds_sdk.columnar
+
+        Args:
+            `batch_size`: maximum number of rows per batch
+            `format`: "numpy" to yield an OrderedDict of column name to NumPy
+                     array, or "arrow" to yield a pyarrow.RecordBatch
+            `inline`: whether or not results may be returned inline
+
+        Returns:
+            A generator of column batches
+        """
+        from qds_sdk import columnar
+        converters = {"numpy": columnar.to_numpy, "arrow": columnar.to_arrow}
+        if format not in converters:
+            raise ValueError("format should be one of %s" % ", ".join(sorted(converters)))
+        convert = converters[format]
+        schema = _result_schema(self.attributes.get('qlog'))
+        return (convert(rows, schema)
+                for rows in self.iter_results(batch_size=batch_size, inline=inline))
+
+    def _iter_rows(self, include_header, inline):
+        conn = (self._client or Qubole).agent()
+        r = conn.get(self.meta_data['results_resource'],
+                     {'inline': inline, 'include_headers': 'false'})
+
+        if include_header:
+            schema = _result_schema(self.attributes.get('qlog'))
+            if schema:
+                yield [column["ColumnName"] for column in schema]
+
+        if r.get('inline'):
+            # split like results from s3, on \n only: values may hold other
+            # characters str.splitlines() breaks lines at
+            lines = r['results'].split('\n')
+            if not lines[-1]:
+                lines.pop()
+            for line in lines:
+                if line.endswith('\r'):
+                    line = line[:-1]
+                yield line.split('\t')
+        else:
+            boto_conn = _connect_s3(conn, self._client or Qubole)
+            for s3_path in r['result_location']:
+                for key_instance in _iter_result_keys(boto_conn, s3_path):
+                    for line in _iter_lines(key_instance):
+                        yield line.decode('utf8').split('\x01')
 
 
 class HiveCommand(Command):
@@ -1437,11 +1837,88 @@ class JupyterNotebookCommand(Command):
         params["command_type"] = "JupyterNotebookCommand"
         return params
 
+class _LogTail(object):
+    """
+    Tracks how much of the err and tmp logs of a command has been seen
+    """
+
+    def __init__(self):
+        self.err_pointer = 0
+        self.tmp_pointer = 0
+
+    def advance(self, err_length, tmp_length):
+        """
+        Moves past the err_length and tmp_length bytes reported by the server
+
+        Returns:
+            the number of new log bytes at the end of the response
+        """
+        err_length, tmp_length = int(err_length), int(tmp_length)
+        # if err length is non zero, then tmp_pointer needs to be reset to the current tmp_length as the
+        # err_length will contain the full set of logs from last seen non-zero err_length.
+        if err_length != 0:
+            self.err_pointer += err_length
+            new_bytes = err_length + tmp_length - self.tmp_pointer
+            self.tmp_pointer = tmp_length
+        else:
+            self.tmp_pointer += tmp_length
+            new_bytes = tmp_length
+        return new_bytes
+
+
+def _skip_bytes(chunks, count):
+    """
+    Yields the chunks of bytes `chunks`, without their first `count` bytes
+    """
+    for data in chunks:
+        if count >= len(data):
+            count -= len(data)
+            continue
+        yield data[count:]
+        count = 0
+
+
+def _last_bytes(chunks, count):
+    """
+    Yields the last `count` bytes of the chunks of bytes `chunks`, once
+    all of them have been read
+    """
+    window = bytearray()
+    for data in chunks:
+        window += data
+        if len(window) > count:
+            del window[:len(window) - count]
+    yield bytes(window)
+
+
+def _complete_lines(chunks, chunk_size):
+    """
+    Yields the complete lines of the chunks of bytes `chunks` as soon as
+    they are read, in chunks of at most `chunk_size` bytes. Only a partial
+    last line is held back, unless it grows longer than `chunk_size`
+    """
+    pending = bytearray()
+    for data in chunks:
+        pending += data
+        end = pending.rfind(b"\n") + 1
+        if len(pending) - end > chunk_size:
+            end = len(pending)
+        for i in range(0, end, chunk_size):
+            yield bytes(pending[i:min(i + chunk_size, end)])
+        del pending[:end]
+    for i in range(0, len(pending), chunk_size):
+        yield bytes(pending[i:i + chunk_size])
+
+
 class SignalHandler:
     """
     Catch terminate signals to allow graceful termination of run()
     """
 
+    # handlers of run() calls on other threads than the main one, which
+    # cannot receive signals, by thread. see interrupt()
+    _threads = weakref.WeakValueDictionary()
+
     def __init__(self):
         self.last_signal = None
         self.received_term_signal = False
@@ -1449,8 +1926,23 @@ class SignalHandler:
             self.term_signals = [signal.SIGINT, signal.SIGTERM]
         else:
             self.term_signals = [signal.SIGINT, signal.SIGQUIT, signal.SIGTERM]
-        for signum in self.term_signals:
-            signal.signal(signum, self.handler)
+        # signal handlers can only be installed from the main thread, eg:
+        # not when run() is called by a worker thread of qds.py daemon
+        if isinstance(threading.current_thread(), threading._MainThread):
+            for signum in self.term_signals:
+                signal.signal(signum, self.handler)
+        else:
+            SignalHandler._threads[threading.current_thread().ident] = self
+
+    @classmethod
+    def interrupt(cls, thread, signum=signal.SIGTERM):
+        """
+        Delivers `signum` to the run() in progress on `thread`, if any, when
+        it is not the main thread
+        """
+        handler = cls._threads.get(thread.ident)
+        if handler is not None:
+            handler.handler(signum, None)
 
     def handler(self, signum, frame):
         self.last_signal = signum
@@ -1467,41 +1959,265 @@ def validate_json_input(string, option_type, cls):
         raise ParseError("Given %s is not valid JSON: %s" % (option_type, str(e)),
                          cls.optparser.format_help())
 
-def _read_iteratively(key_instance, fp, delim):
-    key_instance.open_read()
-    while True:
-        try:
-            # Default buffer size is 8192 bytes
-            data = next(key_instance)
+class _ResultTranscoder(object):
+    """
+    Writes raw result data to a file object, replacing the ^A column
+    separator with `delim`. The output sink and the replacement are resolved
+    once per download rather than for every chunk.
+    """
+
+    def __init__(self, fp, delim=None):
+        self._write = _binary_writer(fp)
+        self._convert = None
+        if delim is not None:
             if sys.version_info < (3, 0, 0):
-                fp.write(str(data).replace(chr(1), delim))
+                import string
+                delim_bytes = str(delim)
+                maketrans = string.maketrans
             else:
-                import io
-                if isinstance(fp, io.TextIOBase):
-                    fp.buffer.write(data.replace(bytes([1]), delim.encode('utf8')))
-                elif isinstance(fp, io.BufferedIOBase) or isinstance(fp, io.RawIOBase):
-                    fp.write(data.replace(bytes([1]), delim.encode('utf8')))
-                else:
-                    raise ValueError('Only subclasses of io.TextIOBase or io.BufferedIOBase supported')
-        except StopIteration:
-            # Stream closes itself when the exception is raised
-            return
+                delim_bytes = delim.encode('utf8')
+                maketrans = bytes.maketrans
+            if len(delim_bytes) == 1:
+                table = maketrans(b'\x01', delim_bytes)
+                self._convert = lambda data: data.translate(table)
+            else:
+                self._convert = lambda data: data.replace(b'\x01', delim_bytes)
 
-def write_headers(qlog,fp):
-    col_names = []
-    qlog = json.loads(qlog)
-    if qlog["QBOL-QUERY-SCHEMA"] is not None:
-        qlog_hash = qlog["QBOL-QUERY-SCHEMA"].get("-1") or qlog["QBOL-QUERY-SCHEMA"][list(qlog["QBOL-QUERY-SCHEMA"].keys())[0]]
+    def write(self, data):
+        if self._convert is not None:
+            data = self._convert(data)
+        self._write(data)
+
+    def copy(self, key_instance):
+        """
+        Streams the contents of an s3 object through the transcoder
+        """
+        key_instance.open_read()
+        resp = key_instance.resp
+        try:
+            if sys.version_info < (3, 0, 0) or not hasattr(resp, 'readinto'):
+                while True:
+                    data = resp.read(_READ_BUFFER_SIZE)
+                    if not data:
+                        return
+                    self.write(data)
+
+            # read into a single preallocated buffer; only a trailing
+            # partial chunk is copied out of it
+            buf = bytearray(_READ_BUFFER_SIZE)
+            view = memoryview(buf)
+            while True:
+                n = resp.readinto(view)
+                if not n:
+                    return
+                self.write(buf if n == len(buf) else view[:n].tobytes())
+        finally:
+            key_instance.close()
+
+
+class _Tee(io.BufferedIOBase):
+    """
+    Binary file copying what is written to it to the `write` function and
+    to the binary file `fp`
+    """
 
-        for qlog_item in qlog_hash:
-            col_names.append(qlog_item["ColumnName"])
+    def __init__(self, write, fp):
+        io.BufferedIOBase.__init__(self)
+        self._write = write
+        self._fp = fp
 
-        col_names = "\t".join(col_names)
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._write(data)
+        self._fp.write(data)
+        return len(data)
+
+
+def _binary_writer(fp):
+    """
+    Returns:
+        a function writing utf8 encoded bytes to fp
+    """
+    if sys.version_info < (3, 0, 0):
+        return fp.write
+    import io
+    if isinstance(fp, io.TextIOBase):
+        if hasattr(fp, 'buffer'):
+            fp.flush()
+            return fp.buffer.write
+        import codecs
+        decoder = codecs.getincrementaldecoder('utf8')()
+        return lambda data: fp.write(decoder.decode(bytes(data)))
+    elif isinstance(fp, io.BufferedIOBase) or isinstance(fp, io.RawIOBase):
+        return fp.write
+    else:
+        raise ValueError('Only subclasses of io.TextIOBase or io.BufferedIOBase supported')
+
+
+def _fetch_part(bucket, part):
+    """
+    Fetches the byte range [start, end] of an s3 object
+    """
+    key_name, start, end = part
+    # every part uses its own Key, as a Key holds the state of a single response
+    key_instance = bucket.new_key(key_name)
+    return key_instance.get_contents_as_string(
+        headers={'Range': 'bytes=%d-%d' % (start, end)})
+
+
+def _download_in_parallel(bucket, keys, transcoder, concurrency):
+    """
+    Downloads the contents of the s3 objects `keys` through transcoder, in
+    order, fetching up to `concurrency` byte ranges at a time.
+    Objects larger than _RESULT_PART_SIZE are split into several ranges.
+    """
+    def _parts():
+        for key_instance in keys:
+            log.info("Downloading file from %s" % key_instance.name)
+            for start in range(0, key_instance.size, _RESULT_PART_SIZE):
+                end = min(start + _RESULT_PART_SIZE, key_instance.size) - 1
+                yield key_instance.name, start, end
+
+    pool = ThreadPool(concurrency)
+    in_flight = collections.deque()
+    try:
+        for part in _parts():
+            in_flight.append(pool.apply_async(_fetch_part, (bucket, part)))
+            # bound the memory held by fetched but unwritten parts
+            if len(in_flight) >= 2 * concurrency:
+                transcoder.write(in_flight.popleft().get())
+        while in_flight:
+            transcoder.write(in_flight.popleft().get())
+    finally:
+        pool.terminate()
+        pool.join()
+
+def write_headers(qlog,fp):
+    col_names = ""
+    schema = _result_schema(qlog)
+    if schema is not None:
+        col_names = "\t".join(qlog_item["ColumnName"] for qlog_item in schema)
         col_names += "\n"
     fp.write(col_names.encode())
 
 
-def _download_to_local(boto_conn, s3_path, fp, num_result_dir, delim=None):
+def _result_schema(qlog):
+    """
+    Returns:
+        the list of column descriptions (dicts with ColumnName and ColumnType)
+        of the QBOL-QUERY-SCHEMA in qlog, or None if it is not known
+    """
+    if not qlog:
+        return None
+    qlog = json.loads(qlog)
+    if qlog.get("QBOL-QUERY-SCHEMA") is None:
+        return None
+    return qlog["QBOL-QUERY-SCHEMA"].get("-1") or qlog["QBOL-QUERY-SCHEMA"][list(qlog["QBOL-QUERY-SCHEMA"].keys())[0]]
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _connect_s3(conn, qubole=Qubole):
+    """
+    Returns:
+        a boto S3 connection using the storage credentials of the account
+        `qubole` (the Qubole singleton or a QuboleClient) is configured for.
+        Connections, along with their pool of HTTP connections, are cached per
+        account and shared across threads. Temporary credentials (with a
+        session token) are refreshed after _S3_CREDENTIALS_TTL seconds.
+    """
+    # boto is slow to import and only needed to download results
+    import boto
+    account = (qubole.baseurl, qubole.api_token)
+    with _s3_connections_lock:
+        cached = _s3_connections.get(account)
+        if cached is not None:
+            boto_conn, expires_at = cached
+            if expires_at is None or time.time() < expires_at:
+                return boto_conn
+
+        if not boto.config.has_section('s3'):
+            boto.config.add_section('s3')
+        boto.config.set('s3', 'use-sigv4', 'True')
+        storage_credentials = conn.get(Account.credentials_rest_entity_path)
+        host = storage_credentials['region_endpoint'] if storage_credentials['region_endpoint'] else "s3.amazonaws.com"
+        boto_conn = boto.connect_s3(aws_access_key_id=storage_credentials['storage_access_key'],
+                                    aws_secret_access_key=storage_credentials['storage_secret_key'],
+                                    security_token=storage_credentials['session_token'],
+                                    host=host)
+        expires_at = None
+        if storage_credentials['session_token']:
+            expires_at = time.time() + _S3_CREDENTIALS_TTL
+        _s3_connections[account] = (boto_conn, expires_at)
+        return boto_conn
+
+
+def _get_result_key(bucket, key_name):
+    """
+    Returns the s3 result object key_name, waiting for it to become visible
+    """
+    retries = 6
+    key_instance = bucket.get_key(key_name)
+    while key_instance is None and retries > 0:
+        retries = retries - 1
+        log.info("Results file is not available on s3. Retry: " + str(6-retries))
+        time.sleep(10)
+        key_instance = bucket.get_key(key_name)
+    if key_instance is None:
+        raise Exception("Results file not available on s3 yet. This can be because of s3 eventual consistency issues.")
+    return key_instance
+
+
+def _iter_result_keys(boto_conn, s3_path):
+    """
+    Yields the s3 objects holding the results under s3_path, which is either
+    a single file or a folder
+    """
+    m = _URI_RE.match(s3_path)
+    bucket = boto_conn.get_bucket(m.group(1))
+    if s3_path.endswith('/') is False:
+        yield _get_result_key(bucket, m.group(2))
+    else:
+        for one_path in bucket.list(m.group(2)):
+            # Eliminate _tmp_ files which ends with $folder$
+            if not one_path.name.endswith('$folder$'):
+                yield one_path
+
+
+def _iter_lines(key_instance):
+    """
+    Yields the lines of an s3 object, without their \n or \r\n terminators,
+    reading it in chunks of _READ_BUFFER_SIZE bytes
+    """
+    key_instance.open_read()
+    try:
+        pending = b''
+        while True:
+            data = key_instance.resp.read(_READ_BUFFER_SIZE)
+            if not data:
+                break
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line[:-1] if line.endswith(b'\r') else line
+        if pending:
+            yield pending[:-1] if pending.endswith(b'\r') else pending
+    finally:
+        key_instance.close()
+
+
+def _download_to_local(boto_conn, s3_path, fp, num_result_dir, delim=None, concurrency=1):
     '''
     Downloads the contents of all objects in s3_path into fp
 
@@ -1511,7 +2227,10 @@ def _download_to_local(boto_conn, s3_path, fp, num_result_dir, delim=None):
         `s3_path`: S3 path to be downloaded
 
         `fp`: The file object where data is to be downloaded
+
+        `concurrency`: Number of byte ranges fetched in parallel
     '''
+    import boto.exception
     #Progress bar to display download progress
     def _callback(downloaded, total):
         '''
@@ -1527,21 +2246,19 @@ def _download_to_local(boto_conn, s3_path, fp, num_result_dir, delim=None):
         sys.stderr.write('\r[{0}] {1}%'.format('#'*progress, progress))
         sys.stderr.flush()
         
+    transcoder = None
+    if delim is not None or concurrency > 1:
+        transcoder = _ResultTranscoder(fp, delim)
     m = _URI_RE.match(s3_path)
     bucket_name = m.group(1)
     bucket = boto_conn.get_bucket(bucket_name)
-    retries = 6
     if s3_path.endswith('/') is False:
         #It is a file
         key_name = m.group(2)
-        key_instance = bucket.get_key(key_name)
-        while key_instance is None and retries > 0:
-            retries = retries - 1
-            log.info("Results file is not available on s3. Retry: " + str(6-retries))
-            time.sleep(10)
-            key_instance = bucket.get_key(key_name)
-        if key_instance is None:
-            raise Exception("Results file not available on s3 yet. This can be because of s3 eventual consistency issues.")
+        key_instance = _get_result_key(bucket, key_name)
+        if concurrency > 1:
+            _download_in_parallel(bucket, [key_instance], transcoder, concurrency)
+            return
         log.info("Downloading file from %s" % s3_path)
         if delim is None:
             try:
@@ -1558,12 +2275,18 @@ def _download_to_local(boto_conn, s3_path, fp, num_result_dir, delim=None):
                     raise
         else:
             # Get contents as string. Replace parameters and write to file.
-            _read_iteratively(key_instance, fp, delim=delim)
+            transcoder.copy(key_instance)
 
     else:
         #It is a folder
         key_prefix = m.group(2)
         bucket_paths = bucket.list(key_prefix)
+        if concurrency > 1:
+            # Eliminate _tmp_ files which ends with $folder$
+            keys = (one_path for one_path in bucket_paths
+                    if not one_path.name.endswith('$folder$'))
+            _download_in_parallel(bucket, keys, transcoder, concurrency)
+            return
         for one_path in bucket_paths:
             name = one_path.name
 
@@ -1575,4 +2298,4 @@ def _download_to_local(boto_conn, s3_path, fp, num_result_dir, delim=None):
             if delim is None:
                 one_path.get_contents_to_file(fp)  # cb=_callback
             else:
-                _read_iteratively(one_path, fp, delim=delim)
+                transcoder.copy(one_path)
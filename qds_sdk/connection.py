@@ -4,7 +4,9 @@ import logging
 import ssl
 import json
 import time
-import pkg_resources
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_tz, mktime_tz
 from requests.adapters import HTTPAdapter
 from datetime import datetime
 try:
@@ -12,11 +14,48 @@ try:
 except ImportError:
     from urllib3.poolmanager import PoolManager
 from qds_sdk.exception import *
+from qds_sdk.retry_policy import RetryPolicy
+from qds_sdk.instrumentation import RequestEvent, notify
 from functools import wraps
 
 
 log = logging.getLogger("qds_connection")
 
+# Exceptions on which idempotent (GET) calls are retried
+RETRY_EXCEPTIONS = (RetryWithDelay, requests.Timeout, ServerError,
+                    AlwaysRetryWithDelay)
+# Exceptions on which every call, including POST/PUT/DELETE, is retried
+ALWAYS_RETRY_EXCEPTIONS = (AlwaysRetryWithDelay,)
+# Exceptions on which calls carrying an idempotency key, which can be
+# reconciled with the server before they are resent, are retried
+IDEMPOTENT_RETRY_EXCEPTIONS = RETRY_EXCEPTIONS + (requests.exceptions.ConnectionError,)
+
+# Number of GET responses per connection remembered for conditional requests
+CONDITIONAL_CACHE_SIZE = 256
+# total size of the bodies kept for conditional requests, and size of the
+# largest one: big bodies (eg: inline results, list pages) are not cached
+CONDITIONAL_CACHE_MAX_BYTES = 4 * 1024 * 1024
+CONDITIONAL_CACHE_MAX_ENTRY_BYTES = 256 * 1024
+
+_version = None
+
+
+def _sdk_version():
+    """
+    Returns:
+        the installed version of qds-sdk. looked up once, as
+        pkg_resources takes a long time to import
+    """
+    global _version
+    if _version is None:
+        try:
+            from importlib.metadata import version
+        except ImportError:
+            from pkg_resources import get_distribution
+            version = lambda name: get_distribution(name).version
+        _version = version("qds-sdk")
+    return _version
+
 """
 see http://stackoverflow.com/questions/14102416/python-requests-requests-exceptions-sslerror-errno-8-ssl-c504-eof-occurred
 """
@@ -33,72 +72,195 @@ class RequestAdapter(HTTPAdapter):
                                        ssl_version=ssl.PROTOCOL_SSLv23)
 
 
+class _ConditionalCache(object):
+    """
+    A bounded, least recently used map of GET request to the validators
+    (ETag, Last-Modified) and body of its last response. Bounded by
+    number of entries and by total size of the response bodies
+    """
+
+    def __init__(self, max_entries=CONDITIONAL_CACHE_SIZE,
+                 max_bytes=CONDITIONAL_CACHE_MAX_BYTES,
+                 max_entry_bytes=CONDITIONAL_CACHE_MAX_ENTRY_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, params):
+        return url, tuple(sorted((params or {}).items()))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                return entry[:3]
+            return None
+
+    def put(self, key, etag, last_modified, value, size):
+        """
+        Args:
+            `size`: size of the response body in bytes. responses larger
+                    than `max_entry_bytes` are not cached
+        """
+        with self._lock:
+            self._pop(key)
+            if (self.max_entries <= 0 or size > self.max_entry_bytes or
+                    size > self.max_bytes):
+                return
+            self._entries[key] = (etag, last_modified, value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self.size -= self._entries.popitem(last=False)[1][3]
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[3]
+
+    def discard(self, key):
+        with self._lock:
+            self._pop(key)
+
+
 class Connection:
 
+    # module or object with json-compatible dumps/loads functions used to
+    # encode requests and decode responses, eg: simplejson or ujson
+    json_codec = json
+    # qds_sdk.retry_policy.RetryPolicy of the calls. when None, calls are
+    # retried max_retries times with an exponential backoff from
+    # base_retry_delay
+    retry_policy = None
+    # qds_sdk.instrumentation.Instrumentation hooks told about each request
+    instrumentation = ()
+    # sizes of the keep-alive connection pools, see mount_adapters
+    pool_connections = 10
+    pool_maxsize = 10
+    pool_block = False
+
     def __init__(self, auth, rest_url, skip_ssl_cert_check,
                  reuse=True, max_retries=7,
-                 base_retry_delay=10):
+                 base_retry_delay=10, pool_connections=10,
+                 pool_maxsize=10, pool_block=False,
+                 conditional_cache_size=CONDITIONAL_CACHE_SIZE):
         self.auth = auth
         self.rest_url = rest_url
         self.skip_ssl_cert_check = skip_ssl_cert_check
-        self._headers = {'User-Agent': 'qds-sdk-py-%s' % pkg_resources.get_distribution("qds-sdk").version,
+        self._headers = {'User-Agent': 'qds-sdk-py-%s' % _sdk_version(),
                          'Content-Type': 'application/json'}
 
         self.reuse = reuse
         self.max_retries = max_retries
         self.base_retry_delay = base_retry_delay
+        # responses of GET calls are revalidated with If-None-Match and
+        # If-Modified-Since, so that unchanged resources are not re-sent
+        self.conditional_cache = _ConditionalCache(conditional_cache_size)
         if reuse:
             self.session = requests.Session()
-            self.session.mount('https://', RequestAdapter())
-
             # retries for get requests
             self.session_with_retries = requests.Session()
-            self.session_with_retries.mount('https://', RequestAdapter(max_retries=3))
+            self.mount_adapters(pool_connections, pool_maxsize, pool_block)
 
-    def retry(ExceptionToCheck, tries=7, delay=10, backoff=2):
+    def mount_adapters(self, pool_connections=10, pool_maxsize=10, pool_block=False):
+        """
+        Sizes the keep-alive connection pools of the sessions of this connection
+        Args:
+            `pool_connections`: number of host connection pools to keep
+            `pool_maxsize`: maximum number of connections kept per host
+            `pool_block`: whether to wait for a free connection when all of
+                          them are in use, instead of opening a one-off connection
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        pool_args = {'pool_connections': pool_connections,
+                     'pool_maxsize': pool_maxsize,
+                     'pool_block': pool_block}
+        self.session.mount('https://', RequestAdapter(**pool_args))
+        self.session_with_retries.mount('https://', RequestAdapter(max_retries=3, **pool_args))
+
+    def get_retry_policy(self):
+        """
+        Returns:
+            the RetryPolicy of this connection
+        """
+        if self.retry_policy is not None:
+            return self.retry_policy
+        policy = getattr(self, '_default_retry_policy', None)
+        if policy is None:
+            policy = RetryPolicy(getattr(self, 'max_retries', 7),
+                                 getattr(self, 'base_retry_delay', 10))
+            self._default_retry_policy = policy
+        return policy
+
+    def retry(ExceptionToCheck):
         def deco_retry(f):
+            method = f.__name__.split('_')[0]
+
             @wraps(f)
             def f_retry(self, *args, **kwargs):
-                if hasattr(self, 'max_retries'):
-                    mtries, mdelay = self.max_retries, self.base_retry_delay
-                else:
-                    mtries, mdelay = tries, delay
-                while mtries >= 1:
+                policy = self.get_retry_policy()
+                endpoint = policy.endpoint(method, args[0] if args else kwargs.get('path'))
+                started = time.time()
+                attempt = 0
+                while True:
+                    policy.before_call(endpoint)
                     try:
-                        return f(self, *args, **kwargs)
+                        result = f(self, *args, **kwargs)
                     except ExceptionToCheck as e:
+                        # honour the server's Retry-After hint if it asks for more
+                        sleep_for = policy.on_failure(
+                            endpoint, e, attempt, started,
+                            Connection._get_retry_after(getattr(e, 'request', None)))
+                        if sleep_for is None:
+                            raise
+                        notify(self.instrumentation, 'on_retry', endpoint, e, sleep_for)
                         logger = logging.getLogger("retry")
                         msg = "%s, Retrying in %d seconds..." % (e.__class__.__name__,
-                                                                 mdelay)
+                                                                 sleep_for)
                         logger.info(msg)
-                        time.sleep(mdelay)
-                        mtries -= 1
-                        mdelay *= backoff
-                return f(self, *args, **kwargs)
+                        time.sleep(sleep_for)
+                        attempt += 1
+                    except Error as e:
+                        # the server answered, which closes a half open circuit
+                        if not isinstance(e, RETRY_EXCEPTIONS):
+                            policy.on_success(endpoint)
+                        raise
+                    else:
+                        policy.on_success(endpoint)
+                        return result
             return f_retry  # true decorator
         return deco_retry
 
-    @retry((RetryWithDelay, requests.Timeout, ServerError, AlwaysRetryWithDelay))
-    def get_raw(self, path, params=None):
+    @retry(RETRY_EXCEPTIONS)
+    def get_raw(self, path, params=None, stream=False):
+        if stream:
+            return self._api_call_raw("GET", path, params=params, stream=True)
         return self._api_call_raw("GET", path, params=params)
 
-    @retry((RetryWithDelay, requests.Timeout, ServerError, AlwaysRetryWithDelay))
+    @retry(RETRY_EXCEPTIONS)
     def get(self, path, params=None):
         return self._api_call("GET", path, params=params)
 
-    @retry(AlwaysRetryWithDelay)
+    @retry(ALWAYS_RETRY_EXCEPTIONS)
     def put(self, path, data=None):
         return self._api_call("PUT", path, data)
 
-    @retry(AlwaysRetryWithDelay)
+    @retry(ALWAYS_RETRY_EXCEPTIONS)
     def post(self, path, data=None):
         return self._api_call("POST", path, data)
 
-    @retry(AlwaysRetryWithDelay)
+    @retry(ALWAYS_RETRY_EXCEPTIONS)
     def delete(self, path, data=None):
         return self._api_call("DELETE", path, data)
 
-    def _api_call_raw(self, req_type, path, data=None, params=None):
+    def _api_call_raw(self, req_type, path, data=None, params=None, stream=False,
+                      headers=None):
         url = self.rest_url.rstrip('/') + '/' + path
 
         if self.reuse:
@@ -110,34 +272,84 @@ class Connection:
             x_with_retries.mount('https://', RequestAdapter(max_retries=3))
 
         kwargs = {'headers': self._headers, 'auth': self.auth, 'verify': not self.skip_ssl_cert_check}
+        if headers:
+            kwargs['headers'] = dict(self._headers, **headers)
 
         if data:
-            kwargs['data'] = json.dumps(data)
+            kwargs['data'] = self.json_codec.dumps(data)
         if params:
             kwargs['params'] = params
+        if stream:
+            kwargs['stream'] = True
 
         log.info("[%s] %s" % (req_type, url))
-        log.info("Payload: %s" % json.dumps(data, indent=4))
+        if log.isEnabledFor(logging.INFO):
+            log.info("Payload: %s" % json.dumps(data, indent=4))
         log.info("Params: %s" % params)
 
-        if req_type == 'GET':
-            r = x_with_retries.get(url, timeout=300, **kwargs)
-        elif req_type == 'POST':
-            r = x.post(url, timeout=300, **kwargs)
-        elif req_type == 'PUT':
-            r = x.put(url, timeout=300, **kwargs)
-        elif req_type == 'DELETE':
-            r = x.delete(url, timeout=300, **kwargs)
-        else:
-            raise NotImplemented
+        event = None
+        if self.instrumentation:
+            event = RequestEvent(req_type, path, url, kwargs.get('data'))
+            notify(self.instrumentation, 'before_request', event)
+        try:
+            if req_type == 'GET':
+                r = x_with_retries.get(url, timeout=300, **kwargs)
+            elif req_type == 'POST':
+                r = x.post(url, timeout=300, **kwargs)
+            elif req_type == 'PUT':
+                r = x.put(url, timeout=300, **kwargs)
+            elif req_type == 'DELETE':
+                r = x.delete(url, timeout=300, **kwargs)
+            else:
+                raise NotImplemented
+        except Exception as e:
+            if event is not None:
+                event.finish(exception=e)
+                notify(self.instrumentation, 'after_request', event)
+            raise
+        if event is not None:
+            event.finish(response=r)
+            notify(self.instrumentation, 'after_request', event)
 
         self._handle_error(r)
         return r
 
-    def _api_call(self, req_type, path, data=None, params=None):
-        response = self._api_call_raw(req_type, path, data=data, params=params)
-        self._validate_json(response)
-        return response.json()
+    def _api_call(self, req_type, path, data=None, params=None, headers=None):
+        cache = getattr(self, 'conditional_cache', None)
+        if req_type != "GET" or cache is None:
+            if headers:
+                response = self._api_call_raw(req_type, path, data=data, params=params,
+                                              headers=headers)
+            else:
+                response = self._api_call_raw(req_type, path, data=data, params=params)
+            return self._parse_json(response)
+
+        key = cache.key(self.rest_url.rstrip('/') + '/' + path, params)
+        cached = cache.get(key)
+        headers = dict(headers or {})
+        if cached is not None:
+            etag, last_modified, content = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = self._api_call_raw(req_type, path, data=data, params=params,
+                                      headers=headers)
+        if response.status_code == 304 and cached is not None:
+            # decoded again, so that callers modifying the returned object
+            # do not change later responses
+            log.info("Not modified, using the cached response")
+            return self._loads(content)
+
+        value = self._parse_json(response)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            content = response.content or b''
+            cache.put(key, etag, last_modified, content, len(content))
+        elif cached is not None:
+            cache.discard(key)
+        return value
 
     @staticmethod
     def _handle_error(response):
@@ -206,15 +418,41 @@ class Connection:
         else:
             raise ConnectionError(response)
 
-    @staticmethod
-    def _validate_json(response):
-        # checks if the repose received is json decode-able
+    def _parse_json(self, response):
+        # decodes the response once, with the configured codec. JSON is
+        # always UTF-8, which spares requests from guessing the charset
         try:
-            response.json()
+            return self._loads(response.content)
         except Exception as e:
             sys.stderr.write("Error: {0}\nInvalid Response from Server, please contact Qubole Support".format(str(e)))
             raise ServerError(response)
     
+    def _loads(self, content):
+        if not isinstance(content, str):
+            content = content.decode('utf-8')
+        return self.json_codec.loads(content)
+
+    @staticmethod
+    def _get_retry_after(response):
+        """
+        Parses the Retry-After header of a 429/503 response. The header holds
+        either a number of seconds or an HTTP date.
+        Returns:
+            seconds to wait, or None if there is no usable hint
+        """
+        if getattr(response, 'status_code', None) not in (429, 503):
+            return None
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(int(value), 0)
+        except ValueError:
+            parsed = parsedate_tz(value)
+            if parsed is None:
+                return None
+            return max(mktime_tz(parsed) - time.time(), 0)
+
     @staticmethod
     def _get_error_message(code):
         if code == 429:
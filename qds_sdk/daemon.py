@@ -0,0 +1,372 @@
+"""
+The daemon module lets qds.py run commands in a long lived process
+(`qds.py daemon`) which keeps the SDK imported, configured and connected to
+the API. qds.py forwards its arguments and QDS environment variables to a
+daemon listening on a Unix socket, and relays the output and exit status of
+the command, instead of paying for interpreter startup, imports and a TLS
+handshake on every invocation.
+
+If the client goes away (eg: on Ctrl-C), a forwarded `run` cancels its
+command like a local one would. Other commands run to completion, and
+their output is discarded.
+
+This module only imports the standard library, so that forwarding a command
+stays cheap.
+"""
+import io
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+log = logging.getLogger("qds_daemon")
+
+DEFAULT_SOCKET = os.path.join("~", ".qds", "daemon.sock")
+
+# Environment variables read by qds.py, sent along with the arguments
+FORWARDED_ENV = ("QDS_", "CLOUD_PROVIDER")
+
+# A response is a sequence of frames: kind, length of the payload, payload
+_FRAME_HEADER = struct.Struct(">cI")
+_STDOUT = b"o"
+_STDERR = b"e"
+_EXIT = b"x"
+_FALLBACK = b"f"
+
+
+def socket_path(environ=os.environ):
+    """
+    Returns:
+        the path of the daemon socket, $QDS_DAEMON_SOCKET or ~/.qds/daemon.sock
+    """
+    return os.path.expanduser(environ.get("QDS_DAEMON_SOCKET") or DEFAULT_SOCKET)
+
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _recv_frame(sock):
+    header = _recv_exactly(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None, None
+    kind, length = _FRAME_HEADER.unpack(header)
+    data = _recv_exactly(sock, length) if length else b""
+    if data is None:
+        return None, None
+    return kind, data
+
+
+def forward(argv, environ=os.environ, stdout=None, stderr=None, cwd=None):
+    """
+    Runs a qds.py command in the daemon listening on socket_path(), if any
+
+    Args:
+        `argv`: the arguments of qds.py
+        `environ`: environment whose QDS variables are sent to the daemon
+        `stdout`, `stderr`: binary files the output of the command is
+                            written to. default to those of the process
+        `cwd`: directory relative paths in `argv` are relative to.
+               defaults to the current directory
+
+    Returns:
+        the exit status of the command, or None if no daemon ran it and
+        it should be run locally
+    """
+    if environ.get("QDS_NO_DAEMON"):
+        return None
+    path = socket_path(environ)
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error:
+            # the daemon is gone, leaving its socket behind
+            return None
+        env = dict((k, v) for k, v in environ.items() if k.startswith(FORWARDED_ENV))
+        request = {"argv": list(argv), "env": env, "cwd": cwd or os.getcwd()}
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        outputs = {_STDOUT: stdout or getattr(sys.stdout, "buffer", sys.stdout),
+                   _STDERR: stderr or getattr(sys.stderr, "buffer", sys.stderr)}
+        while True:
+            try:
+                kind, data = _recv_frame(sock)
+            except KeyboardInterrupt:
+                # closing the connection tells the daemon to stop the command
+                outputs[_STDERR].write(b"Interrupted, stopping the command in the qds daemon\n")
+                return 130
+            if kind == _FALLBACK:
+                return None
+            elif kind == _EXIT:
+                return int(data)
+            elif kind in outputs:
+                outputs[kind].write(data)
+                outputs[kind].flush()
+            else:
+                # the command may have run, it is not safe to run it again
+                outputs[_STDERR].write(b"Lost connection to the qds daemon\n")
+                return 3
+    finally:
+        sock.close()
+
+
+_local = threading.local()
+
+
+class _Sink(object):
+    """
+    Sends the output of a command to the client which forwarded it
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def send(self, kind, data):
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._sock.sendall(_FRAME_HEADER.pack(kind, len(data)) + data)
+            except socket.error:
+                # the client went away, let the command finish silently
+                self._closed = True
+
+
+class _SinkBuffer(io.RawIOBase):
+
+    def __init__(self, sink, kind):
+        io.RawIOBase.__init__(self)
+        self._sink = sink
+        self._kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._sink.send(self._kind, data)
+        return len(data)
+
+
+class _RedirectedStream(io.TextIOBase):
+    """
+    Replaces sys.stdout or sys.stderr in the daemon. Writes from a thread
+    running a forwarded command go to its client, others to `stream`.
+    Like sys.stdout, it is a text stream with a binary `buffer`, which the
+    results of commands are written to
+    """
+
+    def __init__(self, stream, kind):
+        io.TextIOBase.__init__(self)
+        self.stream = stream
+        self._kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        sink = getattr(_local, "sink", None)
+        if sink is None:
+            return self.stream.write(data)
+        encoded = data if isinstance(data, bytes) else data.encode("utf-8")
+        sink.send(self._kind, encoded)
+        return len(data)
+
+    def flush(self):
+        if getattr(_local, "sink", None) is None:
+            self.stream.flush()
+
+    def isatty(self):
+        return getattr(_local, "sink", None) is None and self.stream.isatty()
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    @property
+    def encoding(self):
+        if getattr(_local, "sink", None) is None:
+            return getattr(self.stream, "encoding", None)
+        return "utf-8"
+
+    @property
+    def buffer(self):
+        # bound to the client when accessed, so that writers handed to
+        # worker threads of the command still reach it
+        sink = getattr(_local, "sink", None)
+        if sink is None:
+            return getattr(self.stream, "buffer", self.stream)
+        return _SinkBuffer(sink, self._kind)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        self.server.daemon._handle(json.loads(line.decode("utf-8")), _Sink(self.connection))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        # counted before the worker thread starts, so that the daemon is
+        # not seen idle while a command is on its way
+        self.daemon._begin()
+        socketserver.ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        socketserver.UnixStreamServer.shutdown_request(self, request)
+        self.daemon._end()
+
+
+class Daemon(object):
+
+    def __init__(self, path, run, idle_timeout=None, cancel=None):
+        """
+        Args:
+            `path`: path of the Unix socket to listen on
+            `run`: function(argv, environ, cwd) running a command and
+                   returning its exit status, or None if the command should
+                   rather be run by the client. called concurrently
+            `idle_timeout`: secs without any command after which the
+                            daemon exits. runs until stopped if None
+            `cancel`: function(thread) called when the client of the
+                      command running on `thread` goes away
+        """
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self._run = run
+        self._cancel = cancel
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_activity = time.time()
+        self._stopped = False
+        self._server = None
+
+    def _bind(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                os.unlink(self.path)
+            else:
+                raise RuntimeError("A qds daemon is already listening on %s" % self.path)
+            finally:
+                probe.close()
+        # the socket gives access to the configured account: owner only
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.daemon = self
+        self._server.timeout = 1
+
+    def _begin(self):
+        with self._lock:
+            self._active += 1
+
+    def _end(self):
+        with self._lock:
+            self._active -= 1
+            self._last_activity = time.time()
+
+    def _watch_client(self, sock, sink, thread, done):
+        """
+        Cancels the command running on `thread` if its client goes away
+        before it is done. clients send nothing after their request
+        """
+        try:
+            sock.recv(1)
+        except socket.error:
+            pass
+        with sink._lock:
+            if done.is_set():
+                return
+            sink._closed = True
+        log.info("Client of %s went away" % thread.name)
+        if self._cancel is not None:
+            self._cancel(thread)
+
+    def _handle(self, request, sink):
+        done = threading.Event()
+        watcher = threading.Thread(target=self._watch_client,
+                                   args=(sink._sock, sink, threading.current_thread(), done))
+        watcher.daemon = True
+        watcher.start()
+        _local.sink = sink
+        try:
+            status = self._run(request["argv"], request.get("env", {}), request.get("cwd"))
+        except Exception:
+            log.error("Command %s failed" % request["argv"], exc_info=True)
+            status = 3
+        finally:
+            _local.sink = None
+            with sink._lock:
+                done.set()
+        if status is None:
+            sink.send(_FALLBACK, b"")
+        else:
+            sink.send(_EXIT, str(status).encode("ascii"))
+
+    def _idle(self):
+        with self._lock:
+            return (self.idle_timeout is not None and self._active == 0 and
+                    time.time() - self._last_activity > self.idle_timeout)
+
+    def serve_forever(self):
+        """
+        Runs the commands sent to the socket until stop() is called or the
+        daemon is idle for `idle_timeout` secs
+        """
+        self._bind()
+        log.info("Listening on %s" % self.path)
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = _RedirectedStream(stdout, _STDOUT)
+        sys.stderr = _RedirectedStream(stderr, _STDERR)
+        # log messages of a command go to its client as well
+        handlers = [h for h in logging.getLogger().handlers
+                    if getattr(h, "stream", None) is stderr]
+        for handler in handlers:
+            handler.stream = sys.stderr
+        try:
+            while not self._stopped and not self._idle():
+                self._server.handle_request()
+        finally:
+            for handler in handlers:
+                handler.stream = stderr
+            sys.stdout, sys.stderr = stdout, stderr
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            log.info("Stopped listening on %s" % self.path)
+
+    def stop(self):
+        self._stopped = True
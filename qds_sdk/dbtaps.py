@@ -1,7 +1,7 @@
 import json
 
 from qds_sdk.qubole import Qubole
-from qds_sdk.resource import Resource
+from qds_sdk.resource import Resource, iter_pages
 from argparse import ArgumentParser
 from qds_sdk.commands import *
 
@@ -168,8 +168,8 @@ class DbTap(Resource):
     rest_entity_path = "db_taps"
 
     @staticmethod
-    def list(page = None, per_page = None):
-        conn = Qubole.agent()
+    def list(page = None, per_page = None, client=None):
+        conn = (client or Qubole).agent()
         url_path = DbTap.rest_entity_path
         page_attr = []
         if page is not None:
@@ -183,17 +183,35 @@ class DbTap(Resource):
         tapjson = conn.get(url_path)
         taplist = []
         for s in tapjson["db_taps"]:
-            taplist.append(DbTap(s))
+            taplist.append(DbTap(s, client))
         return taplist
 
+    @staticmethod
+    def iter_all(per_page=None, prefetch=False, client=None):
+        """
+        Lists all the DbTaps, one page at a time
+
+        Args:
+            `per_page`: number of DbTaps fetched per request
+            `prefetch`: fetch the next page while the current one is consumed
+            `client`: QuboleClient to use instead of the Qubole singleton
+
+        Returns:
+            A generator of DbTap objects
+        """
+        conn = (client or Qubole).agent()
+        for tapjson in iter_pages(conn, DbTap.rest_entity_path, per_page, prefetch):
+            for s in tapjson["db_taps"]:
+                yield DbTap(s, client)
+
     def tables(self):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         return conn.get("%s/tables" % self.element_path(self.id))
 
     def edit(self, **kwargs):
-        conn = Qubole.agent()
-        return DbTap(conn.put(self.element_path(self.id), data=kwargs))
+        conn = (self._client or Qubole).agent()
+        return DbTap(conn.put(self.element_path(self.id), data=kwargs), self._client)
 
     def delete(self):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         return conn.delete(self.element_path(self.id))
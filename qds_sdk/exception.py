@@ -2,6 +2,21 @@ class ConfigError(Exception):
     pass
 
 
+class CircuitOpenError(Exception):
+    """An error raised when calls to an endpoint which keeps failing are
+    rejected without being sent, see qds_sdk.retry_policy"""
+    pass
+
+
+class WaitTimeoutError(Exception):
+    """An error raised when a wait for QDS resources to reach some states
+    times out. `states` maps each resource to its last known state"""
+
+    def __init__(self, message, states=None):
+        Exception.__init__(self, message)
+        self.states = states
+
+
 class ParseError(Exception):
     def __init__(self, message, usage):
         Exception.__init__(self, message)
@@ -0,0 +1,219 @@
+"""
+The instrumentation module lets callers observe the API calls made by the
+SDK. Hooks registered with Qubole.configure(instrumentation=[...]) are told
+about each request before it is sent and once its response (or error) is
+in, and about each retry. MetricsRegistry is a hook that aggregates these
+into per-endpoint latency histograms and counters, and exports them in the
+Prometheus text format.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from qds_sdk.retry_policy import RetryPolicy
+
+log = logging.getLogger("qds_instrumentation")
+
+# Upper bounds, in secs, of the buckets of the latency histograms
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class RequestEvent(object):
+    """
+    Describes one HTTP request to the QDS API. The response fields are set
+    when after_request is called.
+    """
+
+    def __init__(self, method, path, url, body=None):
+        self.method = method
+        self.path = path
+        self.url = url
+        self.endpoint = RetryPolicy.endpoint(method, path)
+        self.bytes_sent = len(body) if body else 0
+        self.started = time.time()
+        self.elapsed = None
+        self.status_code = None
+        self.bytes_received = None
+        self.trace_id = None
+        self.exception = None
+
+    def finish(self, response=None, exception=None):
+        self.elapsed = time.time() - self.started
+        self.exception = exception
+        if response is not None:
+            self.status_code = response.status_code
+            self.trace_id = response.headers.get('X-Qubole-Trace-Id')
+            length = response.headers.get('Content-Length')
+            if length is not None:
+                self.bytes_received = int(length)
+            elif getattr(response, '_content_consumed', True):
+                # the body was read, unless the response is streamed
+                self.bytes_received = len(response.content or b'')
+
+
+class Instrumentation(object):
+    """
+    Base class of instrumentation hooks. Subclasses override the methods
+    for the events they are interested in. Hooks are called on the thread
+    making the request and should be fast; their exceptions are logged
+    and otherwise ignored.
+    """
+
+    def before_request(self, event):
+        pass
+
+    def after_request(self, event):
+        pass
+
+    def on_retry(self, endpoint, exception, delay):
+        pass
+
+
+class CallbackHook(Instrumentation):
+    """
+    Instrumentation calling the given functions, eg:
+        CallbackHook(after_request=lambda event: print(event.endpoint, event.elapsed))
+    """
+
+    def __init__(self, before_request=None, after_request=None, on_retry=None):
+        self._before_request = before_request
+        self._after_request = after_request
+        self._on_retry = on_retry
+
+    def before_request(self, event):
+        if self._before_request is not None:
+            self._before_request(event)
+
+    def after_request(self, event):
+        if self._after_request is not None:
+            self._after_request(event)
+
+    def on_retry(self, endpoint, exception, delay):
+        if self._on_retry is not None:
+            self._on_retry(endpoint, exception, delay)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        Returns:
+            a list of (upper bound, number of observations <= it), ending
+            with (float('inf'), count)
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsRegistry(Instrumentation):
+    """
+    Aggregates the requests of the connections it is registered with
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, trace_ids=100):
+        """
+        Args:
+            `buckets`: upper bounds of the buckets of the latency histograms
+            `trace_ids`: number of recent X-Qubole-Trace-Id values kept
+        """
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.latency = {}
+        self.requests = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.bytes_sent = defaultdict(int)
+        self.bytes_received = defaultdict(int)
+        self.recent_trace_ids = deque(maxlen=trace_ids)
+
+    def after_request(self, event):
+        status = str(event.status_code) if event.status_code is not None else "error"
+        with self._lock:
+            histogram = self.latency.get(event.endpoint)
+            if histogram is None:
+                histogram = self.latency[event.endpoint] = Histogram(self._buckets)
+            histogram.observe(event.elapsed)
+            self.requests[(event.endpoint, status)] += 1
+            self.bytes_sent[event.endpoint] += event.bytes_sent
+            if event.bytes_received:
+                self.bytes_received[event.endpoint] += event.bytes_received
+            if event.trace_id:
+                self.recent_trace_ids.append((event.endpoint, status, event.trace_id))
+
+    def on_retry(self, endpoint, exception, delay):
+        with self._lock:
+            self.retries[endpoint] += 1
+
+    def to_prometheus(self, prefix="qds_sdk"):
+        """
+        Returns:
+            the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            name = prefix + "_request_duration_seconds"
+            lines.append("# HELP %s Latency of QDS API requests" % name)
+            lines.append("# TYPE %s histogram" % name)
+            for endpoint in sorted(self.latency):
+                histogram = self.latency[endpoint]
+                labels = 'endpoint="%s"' % _escape(endpoint)
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('%s_bucket{%s,le="%s"} %d'
+                                 % (name, labels, _format_bound(bound), count))
+                lines.append("%s_sum{%s} %s" % (name, labels, repr(histogram.sum)))
+                lines.append("%s_count{%s} %d" % (name, labels, histogram.count))
+
+            name = prefix + "_requests_total"
+            lines.append("# HELP %s QDS API requests by response status" % name)
+            lines.append("# TYPE %s counter" % name)
+            for (endpoint, status), count in sorted(self.requests.items()):
+                lines.append('%s{endpoint="%s",status="%s"} %d'
+                             % (name, _escape(endpoint), status, count))
+
+            for suffix, help, counters in (
+                    ("retries_total", "Retries of QDS API calls", self.retries),
+                    ("sent_bytes_total", "Bytes of request bodies", self.bytes_sent),
+                    ("received_bytes_total", "Bytes of response bodies", self.bytes_received)):
+                name = "%s_%s" % (prefix, suffix)
+                lines.append("# HELP %s %s" % (name, help))
+                lines.append("# TYPE %s counter" % name)
+                for endpoint, count in sorted(counters.items()):
+                    lines.append('%s{endpoint="%s"} %d' % (name, _escape(endpoint), count))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    if bound == float('inf'):
+        return "+Inf"
+    return repr(float(bound))
+
+
+def notify(hooks, name, *args):
+    """
+    Calls method `name` of each of `hooks`, logging their exceptions
+    """
+    for hook in hooks:
+        try:
+            getattr(hook, name)(*args)
+        except Exception:
+            log.warning("Instrumentation hook %r failed in %s" % (hook, name), exc_info=True)
@@ -0,0 +1,90 @@
+"""
+The poll_policy module decides how long to wait between successive status
+checks when waiting on QDS for an event, e.g. for a command to complete.
+"""
+import random
+import time
+
+
+class PollPolicy(object):
+    """
+    Waits a fixed interval between polls.
+    """
+
+    def __init__(self, interval=5):
+        """
+        Args:
+            `interval`: seconds to wait between polls
+        """
+        self.interval = interval
+
+    def intervals(self):
+        """
+        Returns:
+            A generator of successive wait times in seconds, for a single
+            wait loop
+        """
+        while True:
+            yield self.interval
+
+    def poller(self):
+        """
+        Returns:
+            a Poller for a new wait loop
+        """
+        return Poller(self)
+
+
+class AdaptivePollPolicy(PollPolicy):
+    """
+    Polls every `initial_interval` seconds for the first `fast_path`
+    seconds, then increases the wait exponentially up to `max_interval`.
+    Ramped intervals are randomized by +/- `jitter` (a fraction) so that
+    many waiters do not poll in lockstep.
+    """
+
+    def __init__(self, initial_interval=1, fast_path=10, backoff=1.5,
+                 max_interval=60, jitter=0.2):
+        super(AdaptivePollPolicy, self).__init__(initial_interval)
+        self.initial_interval = initial_interval
+        self.fast_path = fast_path
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.jitter = jitter
+
+    def intervals(self):
+        start = time.time()
+        interval = self.initial_interval
+        while True:
+            if time.time() - start < self.fast_path:
+                yield self.initial_interval
+                continue
+            interval = min(interval * self.backoff, self.max_interval)
+            spread = interval * self.jitter
+            yield min(interval + random.uniform(-spread, spread),
+                      self.max_interval)
+
+
+class Poller(object):
+    """
+    State of a single wait loop driven by a PollPolicy.
+    """
+
+    def __init__(self, policy):
+        self._intervals = policy.intervals()
+
+    def wait(self, max_delay=None):
+        """
+        Sleep until the next poll is due.
+
+        Args:
+            `max_delay`: sleep at most this many seconds, eg: until a deadline
+
+        Returns:
+            The number of seconds slept
+        """
+        delay = next(self._intervals)
+        if max_delay is not None:
+            delay = max(0, min(delay, max_delay))
+        time.sleep(delay)
+        return delay
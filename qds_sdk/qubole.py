@@ -1,7 +1,10 @@
 import requests
 import logging
+import threading
 from qds_sdk.connection import Connection
 from qds_sdk.exception import ConfigError
+from qds_sdk.poll_policy import PollPolicy
+from qds_sdk.result_cache import ResultCache
 
 log = logging.getLogger("qds_qubole")
 
@@ -29,9 +32,21 @@ class Qubole:
     baseurl = None
     version = None
     poll_interval = None
+    poll_policy = None
+    result_cache = None
     skip_ssl_cert_check = None
     cloud_name = None
     cached_agent = None
+    cached_async_agent = None
+    pool_connections = None
+    pool_maxsize = None
+    pool_block = None
+    json_codec = None
+    retry_policy = None
+    instrumentation = None
+    _agents = {}
+    _async_agents = {}
+    _agents_lock = threading.Lock()
     cloud = None
     base_retry_delay = None
     max_retries = None
@@ -40,7 +55,10 @@ class Qubole:
     def configure(cls, api_token,
                   api_url="https://api.qubole.com/api/", version="v1.2",
                   poll_interval=5, skip_ssl_cert_check=False, cloud_name="AWS",
-                  base_retry_delay=10, max_retries=7):
+                  base_retry_delay=10, max_retries=7, poll_policy=None,
+                  result_cache_dir=None, result_cache_max_bytes=1024 * 1024 * 1024,
+                  pool_connections=10, pool_maxsize=10, pool_block=False,
+                  json_codec=None, retry_policy=None, instrumentation=None):
         """
         Set parameters governing interaction with QDS
         Args:
@@ -51,6 +69,26 @@ class Qubole:
             `delay` : interval in secs to sleep in between successive retries
             `retries` : maximum number of time to retry an api call in case
                         of retryable exception.
+            `poll_policy`: a qds_sdk.poll_policy.PollPolicy deciding the wait
+                           between polls, eg: AdaptivePollPolicy(). defaults
+                           to polling every `poll_interval` secs
+            `result_cache_dir`: directory in which results of successful
+                                commands are cached. caching is disabled if None
+            `result_cache_max_bytes`: size limit of the result cache
+            `pool_connections`: number of host connection pools kept by an agent
+            `pool_maxsize`: maximum number of keep-alive connections kept per host.
+                            should be at least the number of threads sharing an agent
+            `pool_block`: whether to wait for a free connection when all of them
+                          are in use, instead of opening a connection that is not kept
+            `json_codec`: module with json-compatible dumps and loads functions
+                          used to encode requests and decode responses, eg:
+                          simplejson. defaults to the json module
+            `retry_policy`: a qds_sdk.retry_policy.RetryPolicy, eg: with jitter,
+                            a deadline or a circuit breaker. overrides
+                            `delay` and `retries`
+            `instrumentation`: list of qds_sdk.instrumentation.Instrumentation
+                               hooks observing the API calls, eg: a
+                               MetricsRegistry
         """
 
         cls._auth = QuboleAuth(api_token)
@@ -62,9 +100,24 @@ class Qubole:
             cls.poll_interval = Qubole.MIN_POLL_INTERVAL
         else:
             cls.poll_interval = poll_interval
+        cls.poll_policy = poll_policy or PollPolicy(cls.poll_interval)
+        if result_cache_dir is not None:
+            cls.result_cache = ResultCache(result_cache_dir, result_cache_max_bytes)
+        else:
+            cls.result_cache = None
         cls.skip_ssl_cert_check = skip_ssl_cert_check
         cls.cloud_name = cloud_name.lower()
         cls.cached_agent = None
+        cls.cached_async_agent = None
+        cls.pool_connections = pool_connections
+        cls.pool_maxsize = pool_maxsize
+        cls.pool_block = pool_block
+        cls.json_codec = json_codec
+        cls.retry_policy = retry_policy
+        cls.instrumentation = instrumentation
+        with cls._agents_lock:
+            cls._agents = {}
+            cls._async_agents = {}
         if base_retry_delay > Qubole.MAX_RETRY_DELAY:
             log.warn("Sleep between successive retries cannot be greater than"
                      " %s seconds."
@@ -92,27 +145,75 @@ class Qubole:
            for certain resource end points eg: /v1.3/cluster. When version is
            None we default to v1.2
         """
-        reuse_cached_agent = True
         if version:
             log.debug("api version changed to %s" % version)
-            cls.rest_url = '/'.join([cls.baseurl.rstrip('/'), version])
-            reuse_cached_agent = False
-        else:
-            cls.rest_url = '/'.join([cls.baseurl.rstrip('/'), cls.version])
+        rest_url = '/'.join([cls.baseurl.rstrip('/'), version or cls.version])
+        if cls.api_token is None:
+            raise ConfigError("No API Token specified - please supply one via Qubole.configure()")
+
+        # agents are shared by all threads, one per REST endpoint, so that
+        # callers reuse warm keep-alive connections
+        with cls._agents_lock:
+            cls.rest_url = rest_url
+            agent = cls._agents.get(rest_url)
+            if agent is None:
+                agent = cls._new_connection(rest_url)
+                cls._agents[rest_url] = agent
+            if not version:
+                cls.cached_agent = agent
+
+        return agent
+
+    @classmethod
+    def _new_connection(cls, rest_url):
+        connection = Connection(cls._auth, rest_url,
+                                cls.skip_ssl_cert_check,
+                                True, cls.max_retries, cls.base_retry_delay,
+                                pool_connections=cls.pool_connections,
+                                pool_maxsize=cls.pool_maxsize,
+                                pool_block=cls.pool_block)
+        if cls.json_codec is not None:
+            connection.json_codec = cls.json_codec
+        if cls.retry_policy is not None:
+            connection.retry_policy = cls.retry_policy
+        if cls.instrumentation:
+            connection.instrumentation = list(cls.instrumentation)
+        return connection
+
+    @classmethod
+    def async_agent(cls, version=None, max_concurrency=64):
+        """
+        Returns:
+           an asyncio connection object (qds_sdk.async_connection.AsyncConnection)
+           exposing coroutine versions of the REST calls of `agent`. It owns a
+           separate connection pool, sized for `max_concurrency` requests in
+           flight. Like agents, async agents are shared, one per REST
+           endpoint: `max_concurrency` applies to the first call for an
+           endpoint. Requires Python 3.5 or later.
+        """
+        from qds_sdk.async_connection import AsyncConnection
+
         if cls.api_token is None:
             raise ConfigError("No API Token specified - please supply one via Qubole.configure()")
 
-        if not reuse_cached_agent:
-            uncached_agent = Connection(cls._auth, cls.rest_url,
-                                        cls.skip_ssl_cert_check,
-                                        True, cls.max_retries, cls.base_retry_delay)
-            return uncached_agent
-        if cls.cached_agent is None:
-            cls.cached_agent = Connection(cls._auth, cls.rest_url,
-                                          cls.skip_ssl_cert_check,
-                                          True, cls.max_retries, cls.base_retry_delay)
+        rest_url = '/'.join([cls.baseurl.rstrip('/'), version or cls.version])
+        with cls._agents_lock:
+            async_agent = cls._async_agents.get(rest_url)
+            if async_agent is None:
+                async_agent = AsyncConnection(cls._new_connection(rest_url), max_concurrency)
+                cls._async_agents[rest_url] = async_agent
+            if version is None:
+                cls.cached_async_agent = async_agent
+        return async_agent
 
-        return cls.cached_agent
+    @classmethod
+    def poller(cls):
+        """
+        Returns:
+           a qds_sdk.poll_policy.Poller for a new wait loop following the
+           configured poll policy
+        """
+        return cls.poll_policy.poller()
 
     @classmethod
     def get_cloud(cls, cloud_name=None):
@@ -147,3 +248,46 @@ class Qubole:
     @classmethod
     def get_cloud_name(cls):
         return Qubole.cloud_name
+
+
+class QuboleClient(object):
+    """
+    Authorization credentials and configuration parameters for one QDS
+    account and API endpoint. Unlike the Qubole singleton, any number of
+    clients can be used side by side, eg: one per tenant, each with its own
+    connection pool and poll policy. Pass a client as the `client` argument
+    of Resource, Command and Cluster methods; they use the Qubole singleton
+    when it is omitted.
+    """
+
+    def __init__(self, api_token, **kwargs):
+        """
+        Takes the same arguments as Qubole.configure
+        """
+        self._agents = {}
+        self._agents_lock = threading.Lock()
+        self.cloud = None
+        # The Qubole classmethods only use configuration reached through their
+        # first argument, so they also implement the methods of a client
+        Qubole.configure.__func__(self, api_token, **kwargs)
+
+    def agent(self, version=None):
+        return Qubole.agent.__func__(self, version)
+
+    def async_agent(self, version=None, max_concurrency=64):
+        return Qubole.async_agent.__func__(self, version, max_concurrency)
+
+    def poller(self):
+        return Qubole.poller.__func__(self)
+
+    def get_cloud(self, cloud_name=None):
+        return Qubole.get_cloud.__func__(self, cloud_name)
+
+    def get_cloud_object(self, cloud_name):
+        return Qubole.get_cloud_object(cloud_name)
+
+    def get_cloud_name(self):
+        return self.cloud_name
+
+    def _new_connection(self, rest_url):
+        return Qubole._new_connection.__func__(self, rest_url)
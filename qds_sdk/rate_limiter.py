@@ -0,0 +1,72 @@
+"""
+The rate_limiter module paces requests which are sent concurrently, so that
+a burst of them stays just under the rate the account is allowed.
+"""
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    A token bucket shared by several threads. Its rate adapts to throttling:
+    it is halved each time the server answers 429/503, and grows back
+    linearly as requests succeed (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.1):
+        """
+        Args:
+            `rate`: maximum number of requests per second
+            `burst`: number of requests that can be sent at once after a
+                     quiet period. defaults to `rate`
+            `min_rate`: the rate is never lowered below this
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.burst = max(1.0, float(burst or rate))
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def throttled(self, retry_after=None):
+        """
+        Slows down after a 429/503 response. Nothing is sent until
+        `retry_after` seconds have passed, if the server gave a hint
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+                # no burst once the pause is over
+                self._updated = self._paused_until
+
+    def succeeded(self):
+        """
+        Speeds back up after a successful request
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
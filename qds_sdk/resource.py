@@ -4,11 +4,55 @@ create/find etc.
 """
 import inflection
 import json
+from multiprocessing.pool import ThreadPool
 from six import add_metaclass
 from qds_sdk import util
 from qds_sdk.qubole import Qubole
 
 
+def iter_pages(conn, path, per_page=None, prefetch=False, params=None):
+    """
+    Follows the next_page links of a paginated list endpoint. The page
+    numbers are read from the paging_info of the response, or from its top
+    level (eg: {nezha_data_sources:[], page:1, prev_page:nil, next_page:2}).
+
+    Args:
+        `conn`: connection to fetch the pages with
+        `path`: path of the list endpoint
+        `per_page`: number of entries fetched per request
+        `prefetch`: whether to fetch the next page in the background while
+                    the caller processes the current one
+        `params`: other query parameters of the requests
+
+    Returns:
+        A generator of the decoded responses of all pages
+    """
+    extra_params = params
+
+    def get_page(page):
+        params = dict(extra_params or {}, page=page)
+        if per_page is not None:
+            params["per_page"] = per_page
+        return conn.get(path, params)
+
+    pool = ThreadPool(1) if prefetch else None
+    try:
+        response = get_page(1)
+        while True:
+            paging_info = response.get("paging_info") or response
+            next_page = paging_info.get("next_page")
+            pending = None
+            if next_page and pool is not None:
+                pending = pool.apply_async(get_page, (next_page,))
+            yield response
+            if not next_page:
+                return
+            response = pending.get() if pending is not None else get_page(next_page)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
 class ResourceMeta(type):
     """
     A metaclass for Resource objects.
@@ -57,10 +101,19 @@ class ResourceMetaSingleton(type):
 
 class BaseResource(object):
 
-    def __init__(self, attributes=None):
+    _client = None
+
+    def __init__(self, attributes=None, client=None):
+        """
+        Args:
+            `attributes`: the resource's fields, as returned by QDS
+            `client`: the qds_sdk.qubole.QuboleClient the resource was fetched
+                      with. None for the Qubole singleton
+        """
         if attributes is None:
             attributes = {}
         self.attributes = attributes
+        self._client = client
 
     def __getattr__(self, name):
         """Retrieve the requested attribute if it exists.
@@ -93,23 +146,23 @@ class Resource(BaseResource):
         return "%s/%s" % (cls.rest_entity_path, str(id))
 
     @classmethod
-    def find(cls, id, **kwargs):
-        conn = Qubole.agent()
+    def find(cls, id, client=None, **kwargs):
+        conn = (client or Qubole).agent()
         if id is not None:
-            return cls(conn.get(cls.element_path(id)))
+            return cls(conn.get(cls.element_path(id)), client)
 
     @classmethod
-    def create(cls, **kwargs):
-        conn = Qubole.agent()
-        return cls(conn.post(cls.rest_entity_path, data=kwargs))
+    def create(cls, client=None, **kwargs):
+        conn = (client or Qubole).agent()
+        return cls(conn.post(cls.rest_entity_path, data=kwargs), client)
 
     @property
     def my_element_path(self):
         return self.__class__.element_path(self.id)
 
     @classmethod
-    def list(cls, page = None, per_page = None):
-        conn = Qubole.agent()
+    def list(cls, page = None, per_page = None, client=None):
+        conn = (client or Qubole).agent()
         url_path = cls.rest_entity_path
         page_attr = []
         if page is not None:
@@ -126,17 +179,35 @@ class Resource(BaseResource):
         resource_json = conn.get(url_path)
         resource_list = []
         for s in resource_json[inflection.pluralize(inflection.underscore(cls.__name__))]:
-            resource_list.append(cls(s))
+            resource_list.append(cls(s, client))
         return resource_list
 
     @classmethod
-    def update(cls, id, **kwargs):
-        conn = Qubole.agent()
+    def iter_all(cls, per_page=None, prefetch=False, client=None):
+        """
+        Lists all the resources, one page at a time
+
+        Args:
+            `per_page`: number of resources fetched per request
+            `prefetch`: fetch the next page while the current one is consumed
+
+        Returns:
+            A generator of resource objects
+        """
+        conn = (client or Qubole).agent()
+        key = inflection.pluralize(inflection.underscore(cls.__name__))
+        for resource_json in iter_pages(conn, cls.rest_entity_path, per_page, prefetch):
+            for s in resource_json[key]:
+                yield cls(s, client)
+
+    @classmethod
+    def update(cls, id, client=None, **kwargs):
+        conn = (client or Qubole).agent()
         return conn.put(cls.element_path(id), data=kwargs)
 
     @classmethod
-    def delete(cls, id):
-        conn = Qubole.agent()
+    def delete(cls, id, client=None):
+        conn = (client or Qubole).agent()
         return conn.delete(cls.element_path(id))
 
 
@@ -146,7 +217,11 @@ class SingletonResource(BaseResource):
     cached_resource = None
 
     @classmethod
-    def find(cls, **kwargs):
+    def find(cls, client=None, **kwargs):
+        if client is not None:
+            # only resources of the Qubole singleton are cached
+            return cls(client.agent().get(cls.rest_entity_path), client)
+
         if cls.cached_resource is None:
             conn = Qubole.agent()
             cls.cached_resource = cls(conn.get(cls.rest_entity_path))
@@ -0,0 +1,158 @@
+"""
+The result_cache module stores the results of finished commands on local
+disk, so that repeated reads of the same result do not go back to QDS and
+the cloud store. Results of finished commands never change, so entries do
+not expire; the least recently used ones are evicted once the cache grows
+beyond its size limit.
+"""
+import errno
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+log = logging.getLogger("qds_result_cache")
+
+_TMP_SUFFIX = ".tmp"
+
+
+class _EntryFile(io.BufferedIOBase):
+    """
+    Binary file of an entry being written. Data past `max_bytes` is
+    dropped, and the entry marked too large to be stored
+    """
+
+    def __init__(self, f, max_bytes):
+        io.BufferedIOBase.__init__(self)
+        self._f = f
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.too_large = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.too_large = True
+        if not self.too_large:
+            self._f.write(data)
+        return len(data)
+
+
+class ResultCache(object):
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        """
+        Args:
+            `directory`: directory holding the cached results. created if
+                         it does not exist
+            `max_bytes`: size limit of the cache in bytes
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    @staticmethod
+    def key(*parts):
+        """
+        Returns:
+            the cache key of an entry identified by `parts`
+        """
+        return hashlib.sha1(json.dumps([str(part) for part in parts])
+                            .encode('utf8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def read(self, key, write, chunk_size=1024 * 1024):
+        """
+        Copies the entry `key` to the `write` function
+
+        Returns:
+            True if the entry was found, False otherwise
+        """
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        log.info("Reading results from cache %s" % path)
+        with f:
+            # mark the entry as recently used
+            os.utime(path, None)
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    return True
+                write(data)
+
+    @contextmanager
+    def writer(self, key):
+        """
+        Returns:
+            a context manager yielding a binary file object. The entry `key`
+            is stored only if the block completes without an exception, and
+            if it is no larger than the cache
+        """
+        fd, tmp_path = tempfile.mkstemp(suffix=_TMP_SUFFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                entry = _EntryFile(f, self.max_bytes)
+                yield entry
+            if entry.too_large:
+                log.info("Not caching results of %d bytes, larger than the cache" % entry.size)
+                os.remove(tmp_path)
+                return
+            getattr(os, "replace", os.rename)(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Removes least recently used entries until the cache fits in max_bytes
+
+        Args:
+            `keep`: key of an entry which is not removed, eg: the one just written
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(_TMP_SUFFIX):
+                continue
+            path = self._path(name)
+            if name == keep:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if keep is not None:
+            try:
+                total += os.stat(self._path(keep)).st_size
+            except OSError:
+                pass
+
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            log.info("Evicting cached results %s" % path)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,181 @@
+"""
+The retry_policy module decides how failed API calls are retried: how long
+to wait between attempts, when to give up, and when to stop calling an
+endpoint which keeps failing (circuit breaker). It also counts retries.
+"""
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+from qds_sdk.exception import CircuitOpenError
+
+# Ids in paths are replaced so that commands/1 and commands/2 share a circuit
+_ID_RE = re.compile(r'/\d+(?=/|$)')
+
+
+class RetryMetrics(object):
+    """
+    Thread safe counters of the retries of a RetryPolicy
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.giveups = 0
+        self.circuit_rejections = 0
+        self.sleep_seconds = 0.0
+        self.retries_by_endpoint = defaultdict(int)
+        self.retries_by_exception = defaultdict(int)
+
+    def record_retry(self, endpoint, exception, delay):
+        with self._lock:
+            self.retries += 1
+            self.sleep_seconds += delay
+            self.retries_by_endpoint[endpoint] += 1
+            self.retries_by_exception[exception.__class__.__name__] += 1
+
+    def record_giveup(self):
+        with self._lock:
+            self.giveups += 1
+
+    def record_circuit_rejection(self):
+        with self._lock:
+            self.circuit_rejections += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            a dict of the current values of the counters
+        """
+        with self._lock:
+            return {"retries": self.retries,
+                    "giveups": self.giveups,
+                    "circuit_rejections": self.circuit_rejections,
+                    "sleep_seconds": self.sleep_seconds,
+                    "retries_by_endpoint": dict(self.retries_by_endpoint),
+                    "retries_by_exception": dict(self.retries_by_exception)}
+
+
+class _Circuit(object):
+
+    def __init__(self):
+        self.failures = 0
+        self.open_until = None
+
+
+class RetryPolicy(object):
+
+    def __init__(self, max_retries=7, base_delay=10, backoff=2, max_delay=None,
+                 jitter=False, deadline=None, failure_threshold=None,
+                 reset_timeout=60):
+        """
+        Args:
+            `max_retries`: maximum number of retries of a call
+            `base_delay`: wait in secs before the first retry
+            `backoff`: factor by which the wait grows after each retry
+            `max_delay`: cap on the wait between two attempts
+            `jitter`: wait a random time between 0 and the computed delay
+                      ("full jitter"), so that clients failing together do
+                      not retry together
+            `deadline`: secs after the first attempt past which a call is no
+                        longer retried
+            `failure_threshold`: number of consecutive retryable failures of
+                                 an endpoint after which calls to it fail
+                                 fast with CircuitOpenError. disabled if None
+            `reset_timeout`: secs after which an open circuit lets a trial
+                             call through
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = RetryMetrics()
+        self._circuits = defaultdict(_Circuit)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(method, path):
+        """
+        Returns:
+            the name of the endpoint of a call, eg: GET commands/:id
+        """
+        path = (path or '').split('?')[0].strip('/')
+        return "%s %s" % (method.upper(), _ID_RE.sub('/:id', '/' + path)[1:])
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Returns:
+            the wait in secs before retry number `attempt` (from 0), at
+            least the server's Retry-After hint if given
+        """
+        delay = self.base_delay * (self.backoff ** attempt)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return max(delay, retry_after or 0)
+
+    def before_call(self, endpoint):
+        """
+        Raises:
+            CircuitOpenError: if calls to `endpoint` are failing fast
+        """
+        if self.failure_threshold is None:
+            return
+        with self._lock:
+            circuit = self._circuits[endpoint]
+            if circuit.open_until is None:
+                return
+            now = time.time()
+            if now < circuit.open_until:
+                self.metrics.record_circuit_rejection()
+                raise CircuitOpenError("Too many failures of %s, not calling it for "
+                                       "%d more seconds" % (endpoint, circuit.open_until - now))
+            # half open: let this call through, and fail fast meanwhile
+            circuit.open_until = now + self.reset_timeout
+
+    def on_success(self, endpoint):
+        if self.failure_threshold is None:
+            return
+        with self._lock:
+            self._circuits.pop(endpoint, None)
+
+    def on_failure(self, endpoint, exception, attempt, started, retry_after=None):
+        """
+        Records a retryable failure of a call
+
+        Args:
+            `attempt`: number of retries of the call so far
+            `started`: time.time() of the first attempt of the call
+            `retry_after`: the server's Retry-After hint, if any
+
+        Returns:
+            the wait in secs before retrying, or None to give up
+
+        Raises:
+            CircuitOpenError: if this failure opens the circuit of
+                              `endpoint`, as a retry would be rejected
+        """
+        if self.failure_threshold is not None:
+            with self._lock:
+                circuit = self._circuits[endpoint]
+                circuit.failures += 1
+                if circuit.failures >= self.failure_threshold:
+                    circuit.open_until = time.time() + self.reset_timeout
+                    self.metrics.record_giveup()
+                    raise CircuitOpenError("Too many failures of %s, not calling it for "
+                                           "%d more seconds" % (endpoint, self.reset_timeout))
+        delay = self.delay(attempt, retry_after)
+        if attempt >= self.max_retries or (
+                self.deadline is not None and
+                time.time() + delay - started > self.deadline):
+            self.metrics.record_giveup()
+            return None
+        self.metrics.record_retry(endpoint, exception, delay)
+        return delay
@@ -1,10 +1,11 @@
 import json
 
 from qds_sdk.qubole import Qubole
-from qds_sdk.resource import Resource
+from qds_sdk.resource import Resource, iter_pages
 from argparse import ArgumentParser
 from qds_sdk.commands import *
 from qds_sdk.actions import *
+from qds_sdk.actions import Action, ActionCmdLine
 
 class SchedulerCmdLine:
     """
@@ -196,8 +197,8 @@ class Scheduler(Resource):
     rest_entity_path = "scheduler"
 
     @staticmethod
-    def list(page = None, per_page = None):
-        conn = Qubole.agent()
+    def list(page = None, per_page = None, client=None):
+        conn = (client or Qubole).agent()
         url_path = Scheduler.rest_entity_path
         page_attr = []
         if page is not None:
@@ -211,35 +212,53 @@ class Scheduler(Resource):
         schedjson = conn.get(url_path)
         schedlist = []
         for s in schedjson["schedules"]:
-            schedlist.append(Scheduler(s))
+            schedlist.append(Scheduler(s, client))
         return schedlist
 
     @staticmethod
-    def find_by_name(name):
-        conn = Qubole.agent()
+    def iter_all(per_page=None, prefetch=False, client=None):
+        """
+        Lists all the schedules, one page at a time
+
+        Args:
+            `per_page`: number of schedules fetched per request
+            `prefetch`: fetch the next page while the current one is consumed
+            `client`: QuboleClient to use instead of the Qubole singleton
+
+        Returns:
+            A generator of Scheduler objects
+        """
+        conn = (client or Qubole).agent()
+        for schedjson in iter_pages(conn, Scheduler.rest_entity_path, per_page, prefetch):
+            for s in schedjson["schedules"]:
+                yield Scheduler(s, client)
+
+    @staticmethod
+    def find_by_name(name, client=None):
+        conn = (client or Qubole).agent()
         if name is not None:
             schedjson = conn.get(Scheduler.rest_entity_path, params={"name":name})
             if schedjson["schedules"]:
-                return Scheduler(schedjson["schedules"][0])
+                return Scheduler(schedjson["schedules"][0], client)
         return None
 
     def suspend(self):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         data = {"status": "suspend"}
         return conn.put(self.element_path(self.id), data)
 
     def resume(self):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         data = {"status": "resume"}
         return conn.put(self.element_path(self.id), data)
 
     def kill(self):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         data = {"status": "kill"}
         return conn.put(self.element_path(self.id), data)
 
     def list_actions(self, sequence_id = None, page=None, per_page=None):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         url_path = self.element_path(self.id) + "/" + "actions"
         if sequence_id is not None:
             url_path = url_path + "/" +  str(sequence_id)
@@ -253,11 +272,31 @@ class Scheduler(Resource):
         actjson = conn.get(url_path, params)
         actlist = []
         for act in actjson["actions"]:
-            actlist.append(Action(act))
+            actlist.append(Action(act, self._client))
         return actlist
 
+    def iter_all_actions(self, sequence_id=None, per_page=None, prefetch=False):
+        """
+        Lists all the actions of this schedule, one page at a time
+
+        Args:
+            `sequence_id`: list only the actions of this sequence id
+            `per_page`: number of actions fetched per request
+            `prefetch`: fetch the next page while the current one is consumed
+
+        Returns:
+            A generator of Action objects
+        """
+        conn = (self._client or Qubole).agent()
+        url_path = self.element_path(self.id) + "/" + "actions"
+        if sequence_id is not None:
+            url_path = url_path + "/" +  str(sequence_id)
+        for actjson in iter_pages(conn, url_path, per_page, prefetch):
+            for act in actjson["actions"]:
+                yield Action(act, self._client)
+
     def list_instances(self, page=None, per_page=None):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         url_path = self.element_path(self.id) + "/" + "instances"
         page_attr = []
         if page is not None:
@@ -271,11 +310,29 @@ class Scheduler(Resource):
         cmdlist = []
         for cmd in cmdjson["commands"]:
             cmdclass = globals()[cmd["command_type"]]
-            onecmd = cmdclass(cmd)
+            onecmd = cmdclass(cmd, self._client)
             cmdlist.append(onecmd)
         return cmdlist
 
+    def iter_all_instances(self, per_page=None, prefetch=False):
+        """
+        Lists all the instances of this schedule, one page at a time
+
+        Args:
+            `per_page`: number of instances fetched per request
+            `prefetch`: fetch the next page while the current one is consumed
+
+        Returns:
+            A generator of Command objects
+        """
+        conn = (self._client or Qubole).agent()
+        url_path = self.element_path(self.id) + "/" + "instances"
+        for cmdjson in iter_pages(conn, url_path, per_page, prefetch):
+            for cmd in cmdjson["commands"]:
+                cmdclass = globals()[cmd["command_type"]]
+                yield cmdclass(cmd, self._client)
+
     def rerun(self, instance_id):
-        conn = Qubole.agent()
+        conn = (self._client or Qubole).agent()
         url_path = self.element_path(self.id) + "/instances/%s/rerun" % instance_id
         return conn.post(url_path)['status']
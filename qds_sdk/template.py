@@ -249,8 +249,9 @@ class Template(Resource):
         cmdId = res['id']
         cmdClass = eval(cmdType)
         cmd = cmdClass.find(cmdId)
+        poller = Qubole.poller()
         while not Command.is_done(cmd.status):
-            time.sleep(Qubole.poll_interval)
+            poller.wait()
             cmd = cmdClass.find(cmd.id)
         return Template.getResult(cmdClass, cmd)
     
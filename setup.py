@@ -27,6 +27,7 @@ setup(
     packages=['qds_sdk', 'qds_sdk/cloud'],
     scripts=['bin/qds.py'],
     install_requires=INSTALL_REQUIRES,
+    extras_require={'numpy': ['numpy'], 'arrow': ['pyarrow']},
     long_description=read('README.rst'),
     python_requires='>=2.7',
     classifiers=[
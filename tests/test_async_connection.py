@@ -0,0 +1,101 @@
+import sys
+import os
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+import qds_sdk
+from qds_sdk.qubole import Qubole
+from qds_sdk.connection import Connection
+from qds_sdk.exception import AlwaysRetryWithDelay, BadRequest
+from test_base import QdsCliTestCase
+
+
+@unittest.skipIf(sys.version_info < (3, 5), "asyncio transport requires python 3.5")
+class TestAsyncConnection(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestAsyncConnection, self).setUp()
+        Qubole.configure(api_token='dummy_token',
+                         api_url='https://qds.api.url/api')
+
+    def run_coroutine(self, coro):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_get(self):
+        Connection._api_call = Mock(return_value={'id': 123})
+        agent = Qubole.async_agent()
+        result = self.run_coroutine(agent.get("commands/123"))
+        Connection._api_call.assert_called_with("GET", "commands/123", params=None)
+        self.assertEqual(result, {'id': 123})
+
+    def test_post(self):
+        Connection._api_call = Mock(return_value={'id': 123})
+        agent = Qubole.async_agent()
+        self.run_coroutine(agent.post("commands", {'query': 'show tables'}))
+        Connection._api_call.assert_called_with("POST", "commands",
+                                                {'query': 'show tables'})
+
+    def test_agent_is_cached(self):
+        self.assertIs(Qubole.async_agent(), Qubole.async_agent())
+        self.assertIsNot(Qubole.async_agent(), Qubole.async_agent(version="v2"))
+        self.assertIs(Qubole.async_agent(version="v2"), Qubole.async_agent(version="v2"))
+        self.assertIs(Qubole.async_agent(version="v1.2"), Qubole.async_agent())
+
+    def test_retry_on_always_retryable_error(self):
+        Connection._api_call = Mock(side_effect=[AlwaysRetryWithDelay(Mock(), "throttled"),
+                                                 {'id': 123}])
+        agent = Qubole.async_agent()
+        with patch("asyncio.sleep", new=Mock(side_effect=self._no_sleep)) as sleep:
+            result = self.run_coroutine(agent.post("commands", {}))
+        self.assertEqual(result, {'id': 123})
+        self.assertEqual(Connection._api_call.call_count, 2)
+        sleep.assert_called_once_with(10)
+
+    def test_no_retry_on_bad_request(self):
+        Connection._api_call = Mock(side_effect=BadRequest(Mock(), "bad"))
+        agent = Qubole.async_agent()
+        with self.assertRaises(BadRequest):
+            self.run_coroutine(agent.get("commands/123"))
+        self.assertEqual(Connection._api_call.call_count, 1)
+
+    def test_pool_settings_kept(self):
+        from qds_sdk.async_connection import AsyncConnection
+        connection = Mock(reuse=True, pool_connections=20, pool_maxsize=10, pool_block=True)
+        AsyncConnection(connection, max_concurrency=64).close()
+        connection.mount_adapters.assert_called_once_with(20, 64, True)
+        connection = Mock(reuse=True, pool_connections=20, pool_maxsize=100, pool_block=True)
+        AsyncConnection(connection, max_concurrency=64).close()
+        self.assertFalse(connection.mount_adapters.called)
+
+    def test_retry_policy_runs_off_the_loop(self):
+        import threading
+        Connection._api_call = Mock(return_value={'id': 123})
+        agent = Qubole.async_agent()
+        threads = []
+        policy = Mock()
+        policy.before_call.side_effect = lambda endpoint: threads.append(threading.current_thread())
+        with patch.object(Connection, 'get_retry_policy', return_value=policy):
+            self.run_coroutine(agent.get("commands/123"))
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    @staticmethod
+    def _no_sleep(delay):
+        import asyncio
+        future = asyncio.Future()
+        future.set_result(None)
+        return future
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+from __future__ import print_function
+import sys
+import os
+import json
+import threading
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+from six import StringIO
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+import qds
+from qds_sdk.connection import Connection
+from qds_sdk.qubole import Qubole
+from qds_sdk.batch import run_batch
+from test_base import QdsCliTestCase
+
+
+def _api_call(req_type, path, data=None, params=None, headers=None):
+    if path == "commands/1":
+        return {"id": 1, "status": "done", "meta_data": {"results_resource": "commands/1/results"}}
+    if path == "commands/2" and req_type == "PUT":
+        return {"kill_succeeded": True}
+    if path == "commands/1/results":
+        return {"inline": True, "results": "a\tb\r\n"}
+    if path == "clusters/default/state":
+        return {"state": "UP"}
+    if path == "scheduler/3":
+        return {"id": 3, "status": "RUNNING"}
+    raise ValueError("unexpected call %s %s" % (req_type, path))
+
+
+class TestBatch(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.api_call = patch.object(Connection, "_api_call", side_effect=_api_call)
+        self.api_call.start()
+
+    def tearDown(self):
+        self.api_call.stop()
+
+    def _run(self, lines, *options):
+        sys.argv = ['qds.py', 'batch'] + list(options)
+        out = StringIO()
+        with patch("sys.stdin", StringIO("".join(line + "\n" for line in lines))), \
+                patch("sys.stdout", out):
+            status = qds.main()
+        return status, [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_operations(self):
+        status, outcomes = self._run([
+            '{"op": "check", "id": 1}',
+            '{"op": "cancel", "id": 2}',
+            '',
+            '{"op": "getresult", "id": 1}',
+            '{"op": "cluster_status", "cluster": "default"}',
+            '{"op": "scheduler_view", "id": 3}'])
+        self.assertEqual(status, 0)
+        self.assertEqual([o["line"] for o in outcomes], [1, 2, 4, 5, 6])
+        self.assertEqual([o["status"] for o in outcomes], ["ok"] * 5)
+        self.assertEqual(outcomes[0]["result"]["status"], "done")
+        self.assertEqual(outcomes[0]["request"], {"op": "check", "id": 1})
+        self.assertEqual(outcomes[1]["result"], {"kill_succeeded": True})
+        self.assertEqual(outcomes[2]["result"], "a\tb\r\n")
+        self.assertEqual(outcomes[3]["result"], {"state": "UP"})
+        self.assertEqual(outcomes[4]["result"], {"id": 3, "status": "RUNNING"})
+
+    def test_errors(self):
+        status, outcomes = self._run([
+            'not json',
+            '{"op": "explode", "id": 1}',
+            '{"op": "check"}',
+            '{"op": "check", "id": 4}',
+            '{"op": "check", "id": 1}'])
+        self.assertEqual(status, 1)
+        self.assertEqual([o["status"] for o in outcomes], ["error"] * 4 + ["ok"])
+        self.assertIn("op must be one of", outcomes[1]["error"])
+        self.assertEqual(outcomes[2]["error"], "missing field 'id'")
+        self.assertEqual(outcomes[3]["error"], "ValueError: unexpected call GET commands/4")
+
+    def test_pool_size(self):
+        self._run(['{"op": "check", "id": 1}'], '--parallel', '32')
+        self.assertEqual(Qubole.pool_maxsize, 32)
+
+    def test_completion_order(self):
+        # the first operation only finishes once the second one is written
+        second_written = threading.Event()
+
+        class Out(object):
+            def __init__(self):
+                self.lines = []
+
+            def write(self, line):
+                self.lines.append(json.loads(line))
+                second_written.set()
+
+            def flush(self):
+                pass
+
+        def slow_check(req_type, path, data=None, params=None, headers=None):
+            if path == "commands/1":
+                second_written.wait(10)
+            return {"id": int(path.split("/")[1]), "status": "done"}
+
+        Qubole.configure(api_token='dummy_token')
+        out = Out()
+        with patch.object(Connection, "_api_call", side_effect=slow_check):
+            failures = run_batch(['{"op": "check", "id": 1}', '{"op": "check", "id": 2}'],
+                                 out, parallel=2, ordered=False)
+        self.assertEqual(failures, 0)
+        self.assertEqual([o["line"] for o in out.lines], [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@ if sys.version_info > (2, 7, 0):
     import unittest
 else:
     import unittest2 as unittest
-from mock import Mock, ANY
+from mock import Mock, ANY, patch, call
 import tempfile
 sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
 import qds
@@ -13,6 +13,10 @@ from qds_sdk.connection import Connection
 from test_base import print_command
 from test_base import QdsCliTestCase
 from qds_sdk.cloud.cloud import Cloud
+from qds_sdk.cluster import Cluster
+from qds_sdk.exception import WaitTimeoutError
+from qds_sdk.poll_policy import PollPolicy
+from qds_sdk.qubole import Qubole
 
 
 class TestClusterList(QdsCliTestCase):
@@ -109,7 +113,8 @@ class TestClusterList(QdsCliTestCase):
         Connection.__init__ = Mock(return_value=None)
         Connection._api_call = Mock(return_value={})
         qds.main()
-        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v1.2', ANY, ANY, ANY, ANY)
+        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v1.2', ANY, ANY, ANY, ANY,
+                                               pool_connections=ANY, pool_maxsize=ANY, pool_block=ANY)
 
     def test_connection_v13(self):
         sys.argv = ['qds.py', '--version', 'v1.3', 'cluster', 'list']
@@ -117,7 +122,8 @@ class TestClusterList(QdsCliTestCase):
         Connection.__init__ = Mock(return_value=None)
         Connection._api_call = Mock(return_value={})
         qds.main()
-        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v1.3', ANY, ANY, ANY, ANY)
+        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v1.3', ANY, ANY, ANY, ANY,
+                                               pool_connections=ANY, pool_maxsize=ANY, pool_block=ANY)
 
 
 class TestClusterShow(QdsCliTestCase):
@@ -128,7 +134,8 @@ class TestClusterShow(QdsCliTestCase):
         Connection.__init__ = Mock(return_value=None)
         Connection._api_call = Mock(return_value={})
         qds.main()
-        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v1.2', ANY, ANY, ANY, ANY)
+        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v1.2', ANY, ANY, ANY, ANY,
+                                               pool_connections=ANY, pool_maxsize=ANY, pool_block=ANY)
 
     def test_connection_v13(self):
         sys.argv = ['qds.py', '--version', 'v1.3', 'cluster', 'list', '--label', 'test_label']
@@ -136,7 +143,8 @@ class TestClusterShow(QdsCliTestCase):
         Connection.__init__ = Mock(return_value=None)
         Connection._api_call = Mock(return_value={})
         qds.main()
-        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v1.3', ANY, ANY, ANY, ANY)
+        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v1.3', ANY, ANY, ANY, ANY,
+                                               pool_connections=ANY, pool_maxsize=ANY, pool_block=ANY)
 
 class TestClusterDelete(QdsCliTestCase):
     def test_success(self):
@@ -2753,5 +2761,60 @@ class TestClusterManageCommands(QdsCliTestCase):
         with self.assertRaises(SystemExit):
             qds.main()
 
+class TestClusterWatcher(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestClusterWatcher, self).setUp()
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api')
+        self.sleep = patch("time.sleep").start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _states(self, **states):
+        # successive states of each cluster, the last one repeats
+        states = dict((label, list(values)) for label, values in states.items())
+
+        def api_call(req_type, path, data=None, params=None, headers=None):
+            label = path.split("/")[1]
+            values = states[label]
+            return {"state": values.pop(0) if len(values) > 1 else values[0]}
+
+        return patch.object(Connection, "_api_call", side_effect=api_call).start()
+
+    def test_watch(self):
+        self._states(a=["PENDING", "PENDING", "UP"])
+        changes = list(Cluster.watch("a", until="up"))
+        self.assertEqual([(c.cluster_id_label, c.previous_state, c.state) for c in changes],
+                         [("a", None, "PENDING"), ("a", "PENDING", "UP")])
+        self.assertEqual(changes[1].status, {"state": "UP"})
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_wait_for_state(self):
+        api_call = self._states(a=["PENDING", "UP"], b=["DOWN", "PENDING", "PENDING", "UP"])
+        states = Cluster.wait_for_state(["a", "b"], ["UP"])
+        self.assertEqual(states, {"a": "UP", "b": "UP"})
+        api_call.assert_any_call("GET", "clusters/b/state", params=None)
+
+    def test_transitions_reset_poll_interval(self):
+        self._states(a=["PENDING", "PENDING", "PENDING", "UP"])
+        intervals = Mock(side_effect=lambda: iter([1, 2, 4, 8]))
+        with patch.object(PollPolicy, "intervals", intervals):
+            Cluster.wait_for_state("a", "UP")
+        self.sleep.assert_has_calls([call(1), call(2), call(4)])
+        self.assertEqual(intervals.call_count, 2)
+
+    def test_timeout(self):
+        self._states(a=["UP"], b=["PENDING"])
+        with self.assertRaises(WaitTimeoutError) as context:
+            Cluster.wait_for_state(["a", "b"], "UP", timeout=0)
+        self.assertEqual(context.exception.states, {"a": "UP", "b": "PENDING"})
+
+    def test_watch_for_a_while(self):
+        self._states(a=["UP", "TERMINATING", "DOWN"])
+        changes = list(Cluster.watch("a", timeout=0))
+        self.assertEqual([c.state for c in changes], ["UP"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1150,7 +1150,8 @@ class TestClusterShow(QdsCliTestCase):
         Connection.__init__ = Mock(return_value=None)
         Connection._api_call = Mock(return_value={})
         qds.main()
-        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v2', ANY, ANY, ANY, ANY)
+        Connection.__init__.assert_called_with(ANY, 'https://qds.api.url/api/v2', ANY, ANY, ANY, ANY,
+                                               pool_connections=ANY, pool_maxsize=ANY, pool_block=ANY)
 
 
 class TestClusterStatus(QdsCliTestCase):
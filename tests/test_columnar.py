@@ -0,0 +1,72 @@
+import sys
+import os
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+import pytest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+import qds_sdk
+from qds_sdk import columnar
+from qds_sdk.commands import HiveCommand
+from qds_sdk.connection import Connection
+from test_base import QdsCliTestCase
+
+SCHEMA = [{"ColumnName": "name", "ColumnType": "string"},
+          {"ColumnName": "age", "ColumnType": "int"},
+          {"ColumnName": "score", "ColumnType": "decimal(10,2)"},
+          {"ColumnName": "active", "ColumnType": "boolean"}]
+
+ROWS = [['a', '1', '1.5', 'true'],
+        ['b', '2', 'NULL', 'false']]
+
+
+class TestColumnar(QdsCliTestCase):
+
+    def test_to_numpy(self):
+        numpy = pytest.importorskip("numpy")
+        columns = columnar.to_numpy(ROWS, SCHEMA)
+        self.assertEqual(list(columns.keys()), ['name', 'age', 'score', 'active'])
+        self.assertEqual(columns['age'].dtype, numpy.int64)
+        self.assertEqual(columns['age'].tolist(), [1, 2])
+        self.assertEqual(columns['score'][0], 1.5)
+        self.assertTrue(numpy.isnan(columns['score'][1]))
+        self.assertEqual(columns['active'].tolist(), [True, False])
+        self.assertEqual(columns['name'].tolist(), ['a', 'b'])
+
+    def test_to_numpy_without_schema(self):
+        pytest.importorskip("numpy")
+        columns = columnar.to_numpy([['x', 'y'], ['z']])
+        self.assertEqual(list(columns.keys()), ['c0', 'c1'])
+        self.assertEqual(columns['c1'].tolist(), ['y', ''])
+
+    def test_to_arrow(self):
+        pyarrow = pytest.importorskip("pyarrow")
+        batch = columnar.to_arrow(ROWS, SCHEMA)
+        self.assertEqual(batch.schema.names, ['name', 'age', 'score', 'active'])
+        self.assertEqual(batch.column(1).type, pyarrow.int64())
+        self.assertEqual(batch.column(2).to_pylist(), [1.5, None])
+        self.assertEqual(batch.column(3).to_pylist(), [True, False])
+
+    def test_command_column_batches(self):
+        pytest.importorskip("numpy")
+        qds_sdk.qubole.Qubole.configure(api_token='dummy_token',
+                                        api_url='https://qds.api.url/api')
+        qlog = '{"QBOL-QUERY-SCHEMA": {"-1": [{"ColumnName": "n", "ColumnType": "bigint"}]}}'
+        cmd = HiveCommand({'id': 1, 'qlog': qlog,
+                           'meta_data': {'results_resource': 'commands/1/results'}})
+        Connection._api_call = Mock(return_value={'inline': True, 'results': '1\n2\n3\n'})
+        batches = list(cmd.iter_column_batches(batch_size=2))
+        self.assertEqual([batch['n'].tolist() for batch in batches], [[1, 2], [3]])
+
+    def test_unknown_format(self):
+        cmd = HiveCommand({'id': 1})
+        with self.assertRaises(ValueError):
+            cmd.iter_column_batches(format="csv")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,7 +11,10 @@ from tempfile import NamedTemporaryFile
 sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
 import qds
 import qds_sdk
+import qds_sdk.rate_limiter
+import requests
 from qds_sdk.connection import Connection
+from qds_sdk.exception import ServerError, AlwaysRetryWithDelay
 from test_base import print_command
 from test_base import QdsCliTestCase
 
@@ -262,6 +265,234 @@ class TestCommandGetJobs(QdsCliTestCase):
         Connection._api_call_raw.assert_called_with('GET', 'commands/123/jobs', params=None),
 
 
+class TestCommandWaitAll(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestCommandWaitAll, self).setUp()
+        qds_sdk.qubole.Qubole.configure(api_token='dummy_token',
+                                        api_url='https://qds.api.url/api')
+
+    def test_find_many(self):
+        Connection._api_call = Mock(side_effect=lambda req_type, path, **kwargs:
+                                    {'id': int(path.split('/')[1]), 'status': 'done'})
+        cmds = qds_sdk.commands.HiveCommand.find_many([3, 1, 2], max_workers=2)
+        self.assertEqual([cmd.id for cmd in cmds], [3, 1, 2])
+        self.assertEqual(Connection._api_call.call_count, 3)
+
+    def test_find_many_empty(self):
+        Connection._api_call = Mock()
+        self.assertEqual(qds_sdk.commands.HiveCommand.find_many([]), [])
+        Connection._api_call.assert_not_called()
+
+    @patch("time.sleep")
+    def test_wait_all(self, sleep):
+        statuses = {'1': ['running', 'done'], '2': ['error'], '3': ['waiting', 'running', 'cancelled']}
+
+        def _api_call(req_type, path, **kwargs):
+            id = path.split('/')[1]
+            return {'id': int(id), 'status': statuses[id].pop(0)}
+
+        Connection._api_call = Mock(side_effect=_api_call)
+        cmds = list(qds_sdk.commands.HiveCommand.wait_all(['1', '2', '3', '2']))
+        self.assertEqual([cmd.id for cmd in cmds], [2, 1, 3])
+        self.assertEqual([cmd.status for cmd in cmds], ['error', 'done', 'cancelled'])
+        self.assertEqual(Connection._api_call.call_count, 6)
+        self.assertEqual(sleep.call_count, 2)
+
+
+class TestCreateMany(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestCreateMany, self).setUp()
+        qds_sdk.qubole.Qubole.configure(api_token='dummy_token',
+                                        api_url='https://qds.api.url/api')
+
+    @patch("time.sleep")
+    def test_create_many(self, sleep):
+        throttled = Mock(status_code=429, headers={'Retry-After': '2'}, text='slow down')
+        outcomes = {'q1': [{'id': 1}],
+                    'q2': [qds_sdk.exception.AlwaysRetryWithDelay(throttled), {'id': 2}],
+                    'q3': [qds_sdk.exception.BadRequest(Mock(text='bad query'))]}
+
+        def _api_call(req_type, path, data=None, params=None):
+            outcome = outcomes[data['query']].pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        Connection._api_call = Mock(side_effect=_api_call)
+        limiter = qds_sdk.rate_limiter.TokenBucket(rate=100)
+        results = qds_sdk.commands.HiveCommand.create_many(
+            [{'query': 'q1'}, {'query': 'q2', 'tags': 'a,b'}, {'query': 'q3'}],
+            max_workers=2, rate_limiter=limiter)
+        self.assertEqual([r.id for r in results[:2]], [1, 2])
+        self.assertIsInstance(results[2], qds_sdk.exception.BadRequest)
+        self.assertEqual(Connection._api_call.call_count, 4)
+        Connection._api_call.assert_any_call(
+            "POST", "commands", data={'query': 'q2', 'tags': ['a', 'b'],
+                                      'command_type': 'HiveCommand'})
+        self.assertLess(limiter.rate, 100)
+        self.assertTrue(any(call[0][0] >= 1.9 for call in sleep.call_args_list))
+
+    def test_create_many_gives_up(self):
+        throttled = Mock(status_code=503, headers={}, text='unavailable')
+        Connection._api_call = Mock(
+            side_effect=qds_sdk.exception.AlwaysRetryWithDelay(throttled))
+        limiter = Mock()
+        results = qds_sdk.commands.HiveCommand.create_many(
+            [{'query': 'q'}], max_retries=2, rate_limiter=limiter)
+        self.assertIsInstance(results[0], qds_sdk.exception.AlwaysRetryWithDelay)
+        self.assertEqual(Connection._api_call.call_count, 3)
+        self.assertEqual(limiter.throttled.call_count, 3)
+
+
+class TestIdempotentCreate(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestIdempotentCreate, self).setUp()
+        qds_sdk.qubole.Qubole.configure(api_token='dummy_token',
+                                        api_url='https://qds.api.url/api')
+
+    @staticmethod
+    def _api_call(outcomes, listed):
+        def _api_call(req_type, path, data=None, params=None, headers=None):
+            if req_type == "GET":
+                return {"commands": listed}
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        return Mock(side_effect=_api_call)
+
+    @patch("time.sleep")
+    def test_reconciles_after_timeout(self, sleep):
+        created = {'id': 7, 'tags': ['etl', 'idempotency-key-abc']}
+        Connection._api_call = self._api_call([requests.Timeout()],
+                                              [{'id': 8, 'tags': []}, created])
+        cmd = qds_sdk.commands.HiveCommand.create(query='show tables', tags='etl',
+                                                  idempotency_key='abc')
+        self.assertEqual(cmd.id, 7)
+        Connection._api_call.assert_has_calls([
+            call("POST", "commands", data={'query': 'show tables', 'command_type': 'HiveCommand',
+                                           'tags': ['etl', 'idempotency-key-abc']},
+                 headers={'Idempotency-Key': 'abc'}),
+            call("GET", "commands", params={'per_page': 100, 'include_query_properties': True})])
+        self.assertEqual(Connection._api_call.call_count, 2)
+
+    @patch("time.sleep")
+    def test_resubmits_when_not_created(self, sleep):
+        Connection._api_call = self._api_call(
+            [requests.exceptions.ConnectionError(), {'id': 9}], [])
+        cmd = qds_sdk.commands.HiveCommand.create(query='show tables', idempotency_key='abc')
+        self.assertEqual(cmd.id, 9)
+        self.assertEqual(Connection._api_call.call_count, 3)
+        self.assertEqual(sleep.call_count, 1)
+
+    @patch("time.sleep")
+    def test_lookup_is_retried_by_the_create_loop(self, sleep):
+        from qds_sdk.retry_policy import RetryPolicy
+        qds_sdk.qubole.Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api',
+                                        retry_policy=RetryPolicy(max_retries=1))
+        outcomes = [requests.Timeout(), ServerError(Mock()), {'commands': []}, {'id': 9}]
+
+        def _api_call(req_type, path, data=None, params=None, headers=None):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        # the failed lookup uses up the only retry of the creation
+        Connection._api_call = Mock(side_effect=_api_call)
+        self.assertRaises(ServerError, qds_sdk.commands.HiveCommand.create,
+                          query='show tables', idempotency_key='abc')
+        self.assertEqual([c[0][0] for c in Connection._api_call.call_args_list],
+                         ["POST", "GET"])
+        self.assertEqual(sleep.call_count, 1)
+
+    @patch("time.sleep")
+    def test_no_lookup_after_throttling(self, sleep):
+        Connection._api_call = self._api_call(
+            [AlwaysRetryWithDelay(Mock(), "throttled"), {'id': 9}], [])
+        cmd = qds_sdk.commands.HiveCommand.create(query='show tables', idempotency_key='abc')
+        self.assertEqual(cmd.id, 9)
+        self.assertEqual([c[0][0] for c in Connection._api_call.call_args_list],
+                         ["POST", "POST"])
+
+    def test_without_key(self):
+        Connection._api_call = Mock(side_effect=requests.Timeout())
+        self.assertRaises(requests.Timeout, qds_sdk.commands.HiveCommand.create,
+                          query='show tables')
+        self.assertEqual(Connection._api_call.call_count, 1)
+
+
+class TestTailLogs(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestTailLogs, self).setUp()
+        qds_sdk.qubole.Qubole.configure(api_token='dummy_token',
+                                        api_url='https://qds.api.url/api')
+
+    @staticmethod
+    def _response(body, err_length, tmp_length):
+        response = Mock()
+        response.headers = {'err_length': str(err_length), 'tmp_length': str(tmp_length)}
+        response.iter_content = lambda size: (body[i:i + 2] for i in range(0, len(body), 2))
+        return response
+
+    @patch("time.sleep")
+    def test_tail_logs(self, sleep):
+        responses = [self._response(b"line1\n", 0, 6),
+                     self._response(b"line1\nline2\n", 0, 6)]
+        Connection._api_call = Mock(return_value={'id': 1, 'status': 'done',
+                                                  'meta_data': {'logs_resource': 'commands/1/logs'}})
+        cmd = qds_sdk.commands.HiveCommand({'id': 1, 'status': 'running',
+                                           'meta_data': {'logs_resource': 'commands/1/logs'}})
+        with patch.object(Connection, '_api_call_raw', side_effect=responses) as api_call_raw:
+            chunks = list(cmd.tail_logs(chunk_size=4))
+        self.assertEqual(b"".join(chunks), b"line1\nline2\n")
+        self.assertTrue(all(len(chunk) <= 4 for chunk in chunks))
+        self.assertEqual(cmd.status, 'done')
+        api_call_raw.assert_called_with(
+            "GET", 'commands/1/logs', params={'err_file_processed': 0, 'tmp_file_processed': 6},
+            stream=True)
+        self.assertEqual(sleep.call_count, 1)
+
+    def test_lines_are_streamed(self):
+        received = []
+
+        def iter_content(size):
+            for data in (b"old\nli", b"ne1\nline2", b"\nline3"):
+                received.append(data)
+                yield data
+
+        response = self._response(b"", 0, 17)
+        response.headers['Content-Length'] = '21'
+        response.iter_content = iter_content
+        cmd = qds_sdk.commands.HiveCommand({'id': 1, 'status': 'done',
+                                           'meta_data': {'logs_resource': 'commands/1/logs'}})
+        lines = []
+        with patch.object(Connection, '_api_call_raw', return_value=response):
+            for chunk in cmd._read_new_log(qds_sdk.commands._LogTail(), chunk_size=64):
+                lines.append((chunk, len(received)))
+        self.assertEqual(lines, [(b"line1\n", 2), (b"line2\n", 3), (b"line3", 3)])
+
+    def test_more_new_bytes_than_the_body(self):
+        response = self._response(b"", 0, 10)
+        response.headers['Content-Length'] = '6'
+        response.iter_content = lambda size: iter([b"line1\n"])
+        cmd = qds_sdk.commands.HiveCommand({'id': 1, 'status': 'done',
+                                           'meta_data': {'logs_resource': 'commands/1/logs'}})
+        with patch.object(Connection, '_api_call_raw', return_value=response):
+            log = b"".join(cmd._read_new_log(qds_sdk.commands._LogTail()))
+        self.assertEqual(log, b"line1\n")
+
+    def test_err_log_resets_tmp_pointer(self):
+        log_tail = qds_sdk.commands._LogTail()
+        self.assertEqual(log_tail.advance("0", "10"), 10)
+        self.assertEqual(log_tail.advance("5", "12"), 7)
+        self.assertEqual((log_tail.err_pointer, log_tail.tmp_pointer), (5, 12))
+
+
 class TestHiveCommand(QdsCliTestCase):
 
     def test_submit_query(self):
@@ -2376,6 +2607,26 @@ class TestGetResultsCommand(QdsCliTestCase):
             [call("GET", "commands/314591", params=None),
              call("GET", "commands/314591/results", params={'inline': True, 'include_headers': 'true'})])
 
+    def test_result_with_concurrency(self):
+        sys.argv = ['qds.py', 'hivecmd', 'getresult', '314591', 'true', '--concurrency', '4']
+        print_command()
+        Connection._api_call = Mock(return_value={'id': 314591,
+                                                  'results': '123',
+                                                  'inline': True,
+                                                  'qlog': "column names",
+                                                  'meta_data': {'results_resource': 'commands/314591/results'},
+                                                  'status': 'done'})
+        with patch.object(qds_sdk.commands.Command, 'get_results') as get_results:
+            qds.main()
+        get_results.assert_called_with(ANY, delim='\t', qlog="column names",
+                                       arguments=['true'], concurrency=4)
+
+    def test_result_with_invalid_concurrency(self):
+        sys.argv = ['qds.py', 'hivecmd', 'getresult', '314591', '--concurrency', '0']
+        print_command()
+        with self.assertRaises(qds_sdk.exception.ParseError):
+            qds.main()
+
     def test_result_failed_more_than_two_arguments(self):
         sys.argv = ['qds.py', 'hivecmd', 'getresult', '314591', 'true', "extra_arg"]
         print_command()
@@ -2384,6 +2635,153 @@ class TestGetResultsCommand(QdsCliTestCase):
             qds.main()
 
 
+class TestIterResults(QdsCliTestCase):
+
+    qlog = '{"QBOL-QUERY-SCHEMA": {"-1": [{"ColumnName": "name", "ColumnType": "string"}, ' \
+           '{"ColumnName": "age", "ColumnType": "int"}]}}'
+
+    def setUp(self):
+        super(TestIterResults, self).setUp()
+        qds_sdk.qubole.Qubole.configure(api_token='dummy_token',
+                                        api_url='https://qds.api.url/api')
+        self.cmd = qds_sdk.commands.HiveCommand({'id': 123, 'status': 'done', 'qlog': self.qlog,
+                                                 'meta_data': {'results_resource': 'commands/123/results'}})
+
+    def test_inline_rows(self):
+        Connection._api_call = Mock(return_value={'inline': True, 'results': 'a\t1\r\nb\t2\r\n'})
+        rows = list(self.cmd.iter_results(include_header=True))
+        self.assertEqual(rows, [['name', 'age'], ['a', '1'], ['b', '2']])
+        Connection._api_call.assert_called_with("GET", "commands/123/results",
+                                                params={'inline': True, 'include_headers': 'false'})
+
+    def test_inline_rows_split_on_newlines_only(self):
+        Connection._api_call = Mock(return_value={'inline': True,
+                                                  'results': u'a\x0bb\t1\r\nc\u2028d\t\x1c\r\n\t3'})
+        rows = list(self.cmd.iter_results())
+        self.assertEqual(rows, [[u'a\x0bb', u'1'], [u'c\u2028d', u'\x1c'], [u'', u'3']])
+
+    def test_s3_rows_in_batches(self):
+        from io import BytesIO
+        key = Mock()
+        key.name = 'res/000000'
+        key.resp = BytesIO(b'a\x011\nb\x012\nc\x013')
+        bucket = Mock()
+        bucket.list.return_value = [key]
+        boto_conn = Mock()
+        boto_conn.get_bucket.return_value = bucket
+        Connection._api_call = Mock(return_value={'inline': False, 'result_location': ['s3://bucket/res/']})
+        with patch("qds_sdk.commands._connect_s3", return_value=boto_conn), \
+                patch("qds_sdk.commands._READ_BUFFER_SIZE", 4):
+            batches = list(self.cmd.iter_results(batch_size=2))
+        self.assertEqual(batches, [[['a', '1'], ['b', '2']], [['c', '3']]])
+        bucket.list.assert_called_with('res/')
+
+
+class TestConnectS3(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestConnectS3, self).setUp()
+        qds_sdk.qubole.Qubole.configure(api_token='dummy_token',
+                                        api_url='https://qds.api.url/api')
+        qds_sdk.commands._s3_connections.clear()
+        self.conn = Mock()
+        self.conn.get.return_value = {'storage_access_key': 'key',
+                                      'storage_secret_key': 'secret',
+                                      'session_token': 'token',
+                                      'region_endpoint': None}
+
+    @patch("boto.connect_s3")
+    def test_connection_is_reused(self, connect_s3):
+        first = qds_sdk.commands._connect_s3(self.conn)
+        second = qds_sdk.commands._connect_s3(self.conn)
+        self.assertIs(first, second)
+        self.assertEqual(self.conn.get.call_count, 1)
+        connect_s3.assert_called_once_with(aws_access_key_id='key', aws_secret_access_key='secret',
+                                           security_token='token', host='s3.amazonaws.com')
+
+    @patch("boto.connect_s3")
+    def test_temporary_credentials_are_refreshed(self, connect_s3):
+        with patch("time.time", return_value=1000):
+            qds_sdk.commands._connect_s3(self.conn)
+        with patch("time.time", return_value=1000 + qds_sdk.commands._S3_CREDENTIALS_TTL):
+            qds_sdk.commands._connect_s3(self.conn)
+        self.assertEqual(self.conn.get.call_count, 2)
+        self.assertEqual(connect_s3.call_count, 2)
+
+    @patch("boto.connect_s3")
+    def test_connections_are_per_account(self, connect_s3):
+        qds_sdk.commands._connect_s3(self.conn)
+        qds_sdk.qubole.Qubole.configure(api_token='other_token',
+                                        api_url='https://qds.api.url/api')
+        qds_sdk.commands._connect_s3(self.conn)
+        self.assertEqual(connect_s3.call_count, 2)
+
+
+class TestDownloadToLocal(unittest.TestCase):
+
+    def setUp(self):
+        self.objects = {'res/000000': b'a\x01b\nc\x01d\n',
+                        'res/000000_$folder$': b'',
+                        'res/000001': b'e\x01f\n',
+                        'res/000002': b''}
+        self.bucket = Mock()
+        self.bucket.list.return_value = [self._key(name) for name in sorted(self.objects)]
+        self.bucket.new_key.side_effect = self._key
+        self.bucket.get_key.side_effect = self._key
+        self.boto_conn = Mock()
+        self.boto_conn.get_bucket.return_value = self.bucket
+
+    def _key(self, name):
+        data = self.objects[name]
+        key = Mock(size=len(data))
+        key.name = name
+
+        def _get_contents_as_string(headers):
+            start, end = headers['Range'][len('bytes='):].split('-')
+            return data[int(start):int(end) + 1]
+        key.get_contents_as_string.side_effect = _get_contents_as_string
+        return key
+
+    def _streaming_key(self, name):
+        from io import BytesIO
+        key = self._key(name)
+        key.resp = BytesIO(self.objects[name])
+        return key
+
+    @patch("qds_sdk.commands._READ_BUFFER_SIZE", 4)
+    def test_folder_download_with_delim(self):
+        from io import BytesIO
+        self.bucket.list.return_value = [self._streaming_key(name) for name in sorted(self.objects)]
+        fp = BytesIO()
+        qds_sdk.commands._download_to_local(self.boto_conn, 's3://bucket/res/', fp, 1, delim='\t')
+        self.assertEqual(fp.getvalue(), b'a\tb\nc\td\ne\tf\n')
+
+    @patch("qds_sdk.commands._READ_BUFFER_SIZE", 5)
+    def test_transcoder_multibyte_delim_to_text(self):
+        from io import StringIO
+        self.objects['res/000000'] = u'\u00e9\x01\u00e8\n'.encode('utf8')
+        fp = StringIO()
+        transcoder = qds_sdk.commands._ResultTranscoder(fp, delim=u'\u00a6')
+        transcoder.copy(self._streaming_key('res/000000'))
+        self.assertEqual(fp.getvalue(), u'\u00e9\u00a6\u00e8\n')
+
+    @patch("qds_sdk.commands._RESULT_PART_SIZE", 3)
+    def test_parallel_folder_download(self):
+        from io import BytesIO
+        fp = BytesIO()
+        qds_sdk.commands._download_to_local(self.boto_conn, 's3://bucket/res/', fp, 1,
+                                            delim='\t', concurrency=2)
+        self.assertEqual(fp.getvalue(), b'a\tb\nc\td\ne\tf\n')
+
+    @patch("qds_sdk.commands._RESULT_PART_SIZE", 4)
+    def test_parallel_file_download(self):
+        from io import BytesIO
+        fp = BytesIO()
+        qds_sdk.commands._download_to_local(self.boto_conn, 's3://bucket/res/000000', fp, 1,
+                                            concurrency=3)
+        self.assertEqual(fp.getvalue(), self.objects['res/000000'])
+
+
 @pytest.mark.parametrize("script_location", [
     'oci://some_path/file', 'oraclebmc://some_path/file', 'wasb://some_path/file',
     'gs://some_path/file', 's3://some_path/file', 's3n://some_path/file',
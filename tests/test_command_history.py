@@ -0,0 +1,73 @@
+import sys
+import os
+from datetime import timedelta
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+from six import StringIO
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+import qds
+from qds_sdk.connection import Connection
+from qds_sdk.qubole import Qubole
+from qds_sdk import command_history
+from test_base import print_command
+from test_base import QdsCliTestCase
+
+
+def _history(req_type, path, params=None):
+    # two commands per day, the ones at midnight are returned by both shards
+    # sharing that boundary. one command per page
+    day = int(params["start_date"][8:10])
+    ids = [day * 10, (day + 1) * 10]
+    page = params["page"]
+    return {"commands": [{"id": ids[page - 1]}],
+            "paging_info": {"next_page": 2 if page == 1 else None}}
+
+
+class TestCommandHistory(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestCommandHistory, self).setUp()
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api')
+
+    def test_shards(self):
+        self.assertEqual(command_history.shards("2019-01-01", "2019-01-02T12:00:00Z"),
+                         [("2019-01-01T00:00:00Z", "2019-01-02T00:00:00Z"),
+                          ("2019-01-02T00:00:00Z", "2019-01-02T12:00:00Z")])
+        self.assertEqual(command_history.shards("2019-01-01", "2019-01-01"), [])
+        self.assertRaises(ValueError, command_history.shards, "yesterday", "2019-01-01")
+
+    def test_iter_history_deduplicates(self):
+        Connection._api_call = Mock(side_effect=_history)
+        commands = command_history.iter_history("2019-01-01", "2019-01-04", parallel=3,
+                                                per_page=1, all_users=1)
+        self.assertEqual(sorted(c["id"] for c in commands), [10, 20, 30, 40])
+        self.assertEqual(Connection._api_call.call_count, 6)
+        Connection._api_call.assert_any_call(
+            "GET", "commands", params={"all_users": 1, "page": 2, "per_page": 1,
+                                       "start_date": "2019-01-02T00:00:00Z",
+                                       "end_date": "2019-01-03T00:00:00Z"})
+
+    def test_iter_history_raises_errors(self):
+        Connection._api_call = Mock(side_effect=ValueError("boom"))
+        commands = command_history.iter_history("2019-01-01", "2019-01-03",
+                                                shard_size=timedelta(hours=12))
+        self.assertRaises(ValueError, list, commands)
+
+    def test_list_all_pages(self):
+        sys.argv = ['qds.py', 'hivecmd', 'list', '--all-pages', '--parallel', '2',
+                    '--start-date', '2019-01-01', '--end-date', '2019-01-03']
+        print_command()
+        Connection._api_call = Mock(side_effect=_history)
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            self.assertEqual(qds.main(), 0)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(sorted(lines), ['{"id": 10}', '{"id": 20}', '{"id": 30}'])
+
+
+if __name__ == '__main__':
+    unittest.main()
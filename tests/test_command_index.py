@@ -0,0 +1,98 @@
+import sys
+import os
+import shutil
+import tempfile
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+from qds_sdk.connection import Connection
+from qds_sdk.qubole import Qubole
+from qds_sdk.command_index import CommandIndex
+from test_base import QdsCliTestCase
+
+
+def _command(id, status="done", command_type="HiveCommand", label="default",
+             tags=None, created_at="2019-01-22T15:11:00Z"):
+    return {"id": id, "status": status, "command_type": command_type, "label": label,
+            "tags": tags or [], "created_at": created_at}
+
+
+def _shown(command):
+    # commands are shown without their query properties, and so without tags
+    command = dict(command)
+    del command["tags"]
+    return command
+
+
+class TestCommandIndex(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestCommandIndex, self).setUp()
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api')
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = CommandIndex(os.path.join(self.tmpdir, "commands.db"))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_query(self):
+        self.index.add([_command(1, status="error", tags=["etl"]),
+                        _command(2, status="error", tags=["etl"], label="adhoc"),
+                        _command(3, status="error", tags=["report"]),
+                        _command(4, tags=["etl"], created_at="2019-01-15T00:00:00Z"),
+                        _command(5, status="error", command_type="PrestoCommand", tags="etl, x")])
+        ids = lambda commands: [c["id"] for c in commands]
+        self.assertEqual(ids(self.index.query(status="error", tag="etl", label="default",
+                                              command_type="HiveCommand")), [1])
+        self.assertEqual(ids(self.index.query(tag="etl")), [5, 4, 2, 1])
+        self.assertEqual(ids(self.index.query(since="2019-01-20", limit=2)), [5, 3])
+        self.assertEqual(ids(self.index.query(until="2019-01-20")), [4])
+        self.assertEqual(self.index.query(tag="x")[0]["tags"], "etl, x")
+
+    def test_sync_is_incremental(self):
+        self.index.add([_command(1), _command(2, status="running")])
+        pages = {1: {"commands": [_command(5), _command(4)], "paging_info": {"next_page": 2}},
+                 2: {"commands": [_command(3), _command(2, status="running")],
+                     "paging_info": {"next_page": 3}}}
+
+        def _api_call(req_type, path, params=None):
+            if path == "commands":
+                return pages[params["page"]]
+            return _command(int(path.split("/")[1]))
+
+        Connection._api_call = Mock(side_effect=_api_call)
+        self.assertEqual(self.index.sync(per_page=2, all_users=1), 4)
+        Connection._api_call.assert_any_call(
+            "GET", "commands", params={"all_users": 1, "page": 2, "per_page": 2,
+                                       "include_query_properties": True})
+        Connection._api_call.assert_called_with("GET", "commands/2", params=None)
+        self.assertEqual(Connection._api_call.call_count, 3)
+        self.assertEqual(self.index.newest_id(), 5)
+        self.assertEqual(self.index.query(status="running"), [])
+
+    def test_tags_survive_refresh(self):
+        listed = _command(2, status="running")
+        listed["query_properties"] = {"tags": ["etl"]}
+        del listed["tags"]
+        pages = {1: {"commands": [listed], "paging_info": {}}}
+
+        def _api_call(req_type, path, params=None):
+            if path == "commands":
+                return pages[params["page"]]
+            return _shown(_command(int(path.split("/")[1])))
+
+        Connection._api_call = Mock(side_effect=_api_call)
+        # the running command is listed with its tags, then refreshed with
+        # Command.find, without them
+        self.index.sync()
+        self.assertEqual([(c["id"], c["status"]) for c in self.index.query(tag="etl")],
+                         [(2, "done")])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import sys
 import os
+import json
+import requests
 
 if sys.version_info > (2, 7, 0):
     import unittest
@@ -10,10 +12,22 @@ from mock import *
 sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
 import qds
 from mock import Mock, ANY
+import qds_sdk.connection
 from qds_sdk.connection import Connection
+from qds_sdk.qubole import Qubole, QuboleClient
+from qds_sdk.retry_policy import RetryPolicy
+from qds_sdk.instrumentation import MetricsRegistry, CallbackHook
+from qds_sdk.exception import ServerError
+from qds_sdk.commands import HiveCommand
+from qds_sdk.cluster import Cluster
 from test_base import print_command
 from test_base import QdsCliTestCase
 
+# other tests replace these with mocks
+_connection_init = Connection.__init__
+_api_call = Connection._api_call
+_api_call_raw = Connection._api_call_raw
+
 
 class TestConnection(QdsCliTestCase):
 
@@ -24,7 +38,8 @@ class TestConnection(QdsCliTestCase):
         Connection.__init__ = Mock(return_value=None)
         Connection._api_call = Mock(return_value={})
         qds.main()
-        Connection.__init__.assert_called_with(ANY, ANY, ANY, ANY, 3, 2)
+        Connection.__init__.assert_called_with(ANY, ANY, ANY, ANY, 3, 2,
+                                               pool_connections=ANY, pool_maxsize=ANY, pool_block=ANY)
 
     #Test with incorrect values
     def test_connection_override(self):
@@ -33,7 +48,8 @@ class TestConnection(QdsCliTestCase):
         Connection.__init__ = Mock(return_value=None)
         Connection._api_call = Mock(return_value={})
         qds.main()
-        Connection.__init__.assert_called_with(ANY, ANY, ANY, ANY, 7, 10)
+        Connection.__init__.assert_called_with(ANY, ANY, ANY, ANY, 7, 10,
+                                               pool_connections=ANY, pool_maxsize=ANY, pool_block=ANY)
 
     #Test with no values given should set default
     def test_connection_default(self):
@@ -42,7 +58,186 @@ class TestConnection(QdsCliTestCase):
         Connection.__init__ = Mock(return_value=None)
         Connection._api_call = Mock(return_value={})
         qds.main()
-        Connection.__init__.assert_called_with(ANY, ANY, ANY, ANY, 7, 10)
+        Connection.__init__.assert_called_with(ANY, ANY, ANY, ANY, 7, 10,
+                                               pool_connections=ANY, pool_maxsize=ANY, pool_block=ANY)
+
+    def test_agents_are_cached_per_version(self):
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api')
+        versioned = Qubole.agent(version="v1.3")
+        self.assertIs(Qubole.agent(version="v1.3"), versioned)
+        default = Qubole.agent()
+        self.assertIsNot(default, versioned)
+        self.assertIs(Qubole.agent(), default)
+        self.assertIs(Qubole.cached_agent, default)
+
+    def test_agents_reset_on_configure(self):
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api')
+        versioned = Qubole.agent(version="v1.3")
+        Qubole.configure(api_token='other_token', api_url='https://qds.api.url/api')
+        self.assertIsNot(Qubole.agent(version="v1.3"), versioned)
+
+    def test_pool_options(self):
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api',
+                         pool_maxsize=50, pool_block=True)
+        with patch.object(Connection, '__init__', return_value=None) as init:
+            Qubole.agent(version="v2")
+        init.assert_called_once_with(ANY, 'https://qds.api.url/api/v2', False, True, 7, 10,
+                                     pool_connections=10, pool_maxsize=50, pool_block=True)
+
+
+class TestConditionalRequests(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestConditionalRequests, self).setUp()
+        patcher = patch.multiple(Connection, __init__=_connection_init,
+                                 _api_call=_api_call,
+                                 _api_call_raw=_api_call_raw)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conn = Connection(None, 'https://qds.api.url/api/v1.2', False)
+        self.conn.session_with_retries = Mock()
+
+    @staticmethod
+    def _response(status_code, body=None, headers=None):
+        response = Mock()
+        response.status_code = status_code
+        response.headers = headers or {}
+        response.content = json.dumps(body).encode('utf-8')
+        return response
+
+    def test_not_modified_returns_cached_object(self):
+        body = {'id': 1, 'status': 'done'}
+        self.conn.session_with_retries.get.side_effect = [
+            self._response(200, body, {'ETag': '"v1"'}),
+            self._response(304)]
+        first = self.conn.get('commands/1')
+        self.assertEqual(first, body)
+        first['status'] = 'modified'
+        self.assertEqual(self.conn.get('commands/1'), body)
+        headers = self.conn.session_with_retries.get.call_args[1]['headers']
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+
+    def test_cache_is_keyed_by_params_and_bounded(self):
+        self.conn.conditional_cache.max_entries = 1
+        self.conn.session_with_retries.get.side_effect = [
+            self._response(200, {'page': 1}, {'Last-Modified': 'Mon, 01 Jan 2018 00:00:00 GMT'}),
+            self._response(200, {'page': 2}, {'Last-Modified': 'Mon, 01 Jan 2018 00:00:00 GMT'}),
+            self._response(200, {'page': 1})]
+        self.conn.get('commands', params={'page': 1})
+        self.conn.get('commands', params={'page': 2})
+        self.conn.get('commands', params={'page': 1})
+        headers = self.conn.session_with_retries.get.call_args[1]['headers']
+        self.assertNotIn('If-Modified-Since', headers)
+
+    def test_large_bodies_are_not_cached(self):
+        self.conn.conditional_cache.max_entry_bytes = 20
+        self.conn.session_with_retries.get.side_effect = [
+            self._response(200, {'results': 'x' * 20}, {'ETag': '"v1"'}),
+            self._response(200, {'results': 'x' * 20}, {'ETag': '"v1"'})]
+        self.conn.get('commands/1/results')
+        self.conn.get('commands/1/results')
+        headers = self.conn.session_with_retries.get.call_args[1]['headers']
+        self.assertNotIn('If-None-Match', headers)
+        self.assertEqual(self.conn.conditional_cache.size, 0)
+
+    def test_cache_is_bounded_by_bytes(self):
+        cache = self.conn.conditional_cache
+        cache.max_bytes = 25
+        self.conn.session_with_retries.get.side_effect = [
+            self._response(200, {'id': 1}, {'ETag': '"v1"'}),
+            self._response(200, {'id': 2}, {'ETag': '"v1"'}),
+            self._response(200, {'id': 3}, {'ETag': '"v1"'})]
+        for id in (1, 2, 3):
+            self.conn.get('commands/%d' % id)
+        self.assertEqual(len(cache._entries), 2)
+        self.assertEqual(cache.size, 2 * len('{"id": 1}'))
+        self.assertIsNone(cache.get(cache.key('https://qds.api.url/api/v1.2/commands/1', None)))
+
+    @patch("time.sleep")
+    def test_retry_policy(self, sleep):
+        self.conn.retry_policy = RetryPolicy(max_retries=2, base_delay=1, jitter=True)
+        outcomes = [ServerError(Mock()), ServerError(Mock()), {"id": 1}]
+        with patch.object(Connection, '_api_call', side_effect=outcomes), \
+                patch("random.uniform", side_effect=lambda low, high: high / 4):
+            self.assertEqual(self.conn.get("commands/1"), {"id": 1})
+        self.assertEqual([c[0][0] for c in sleep.call_args_list], [0.25, 0.5])
+        self.assertEqual(self.conn.retry_policy.metrics.snapshot()["retries_by_endpoint"],
+                         {"GET commands/:id": 2})
+
+    @patch("time.sleep")
+    def test_default_retry_policy(self, sleep):
+        self.conn.max_retries, self.conn.base_retry_delay = 1, 3
+        with patch.object(Connection, '_api_call', side_effect=ServerError(Mock())):
+            self.assertRaises(ServerError, self.conn.get, "commands/1")
+        self.assertEqual([c[0][0] for c in sleep.call_args_list], [3])
+
+    @patch("time.sleep")
+    def test_instrumentation(self, sleep):
+        registry = MetricsRegistry()
+        events = []
+        self.conn.instrumentation = [registry, CallbackHook(before_request=events.append)]
+        response = self._response(200, {'id': 1}, {'X-Qubole-Trace-Id': 'trace'})
+        self.conn.session_with_retries.get.side_effect = [requests.Timeout(), response]
+        self.assertEqual(self.conn.get('commands/1'), {'id': 1})
+        self.assertEqual(len(events), 2)
+        self.assertEqual(registry.requests, {('GET commands/:id', 'error'): 1,
+                                             ('GET commands/:id', '200'): 1})
+        self.assertEqual(registry.retries, {'GET commands/:id': 1})
+        self.assertEqual(registry.bytes_received, {'GET commands/:id': len('{"id": 1}')})
+        self.assertEqual(list(registry.recent_trace_ids), [('GET commands/:id', '200', 'trace')])
+
+    def test_json_codec(self):
+        codec = Mock()
+        codec.loads.return_value = {'id': 1}
+        codec.dumps.return_value = '{"command_type": "HiveCommand"}'
+        self.conn.json_codec = codec
+        self.conn.session = Mock()
+        self.conn.session.post.return_value = self._response(200, {'id': 1})
+        self.assertEqual(self.conn.post('commands', {'command_type': 'HiveCommand'}),
+                         {'id': 1})
+        codec.loads.assert_called_once_with('{"id": 1}')
+        self.assertEqual(self.conn.session.post.call_args[1]['data'],
+                         '{"command_type": "HiveCommand"}')
+
+    def test_payload_is_not_formatted_without_logging(self):
+        self.conn.session = Mock()
+        self.conn.session.post.return_value = self._response(200, {'id': 1})
+        with patch('qds_sdk.connection.json.dumps') as dumps, \
+                patch.object(qds_sdk.connection.log, 'isEnabledFor', return_value=False):
+            self.conn.post('commands', {'command_type': 'HiveCommand'})
+        self.assertFalse(any(call[1].get('indent') for call in dumps.call_args_list))
+
+
+class TestQuboleClient(QdsCliTestCase):
+
+    def test_clients_are_independent(self):
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api')
+        client = QuboleClient(api_token='tenant_token',
+                              api_url='https://tenant.api.url/api', version='v1.3')
+        self.assertEqual(client.api_token, 'tenant_token')
+        self.assertEqual(Qubole.api_token, 'dummy_token')
+        agent = client.agent()
+        self.assertIs(client.agent(), agent)
+        self.assertIsNot(Qubole.agent(), agent)
+        self.assertEqual(client.rest_url, 'https://tenant.api.url/api/v1.3')
+        self.assertEqual(Qubole.rest_url, 'https://qds.api.url/api/v1.2')
+
+    def test_resources_use_client(self):
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api')
+        client = QuboleClient(api_token='tenant_token')
+        agent = Mock()
+        agent.get.return_value = {'id': 123, 'status': 'done'}
+        with patch.object(client, 'agent', return_value=agent), \
+                patch.object(Qubole, 'agent') as default_agent:
+            command = HiveCommand.find(123, client=client)
+            command.cancel()
+            Cluster.show(123, client=client)
+        self.assertEqual(command._client, client)
+        agent.get.assert_any_call('commands/123')
+        agent.put.assert_called_once_with('commands/123', {'status': 'kill'})
+        agent.get.assert_called_with('clusters/123')
+        self.assertFalse(default_agent.called)
+
 
 if __name__ == '__main__':
     unittest.main()
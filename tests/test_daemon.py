@@ -0,0 +1,237 @@
+from __future__ import print_function
+import sys
+import os
+import io
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+import qds
+from qds_sdk.connection import Connection
+from qds_sdk.daemon import Daemon, forward
+from test_base import QdsCliTestCase
+
+
+def _wait_for(path):
+    deadline = time.time() + 10
+    while not os.path.exists(path):
+        if time.time() > deadline:
+            raise AssertionError("%s was not created" % path)
+        time.sleep(0.01)
+
+
+class TestDaemon(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestDaemon, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "daemon.sock")
+        self.env = {"QDS_DAEMON_SOCKET": self.path, "QDS_API_TOKEN": "abc"}
+        self.stdout = io.BytesIO()
+        self.stderr = io.BytesIO()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _start(self, run):
+        daemon = Daemon(self.path, run)
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        _wait_for(self.path)
+        return daemon, thread
+
+    def _forward(self, argv, env=None):
+        return forward(argv, env or self.env, self.stdout, self.stderr)
+
+    def test_no_daemon(self):
+        self.assertIsNone(self._forward(["hivecmd", "check", "1"]))
+
+    def test_stale_socket(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        sock.close()
+        self.assertIsNone(self._forward(["hivecmd", "check", "1"]))
+
+    def test_forward(self):
+        calls = []
+
+        def run(argv, environ, cwd):
+            calls.append((argv, environ, cwd))
+            print("out")
+            sys.stdout.buffer.write(b"\x00\x01")
+            sys.stderr.write("err\n")
+            return 5
+
+        daemon, thread = self._start(run)
+        try:
+            env = dict(self.env, HOME="/home/qds", CLOUD_PROVIDER="AZURE")
+            self.assertEqual(self._forward(["hivecmd", "check", "1"], env), 5)
+        finally:
+            daemon.stop()
+            thread.join()
+        self.assertEqual(calls, [(["hivecmd", "check", "1"],
+                                  {"QDS_DAEMON_SOCKET": self.path, "QDS_API_TOKEN": "abc",
+                                   "CLOUD_PROVIDER": "AZURE"}, os.getcwd())])
+        self.assertEqual(self.stdout.getvalue(), b"out\n\x00\x01")
+        self.assertEqual(self.stderr.getvalue(), b"err\n")
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_fallback(self):
+        daemon, thread = self._start(lambda argv, environ, cwd: None)
+        try:
+            self.assertIsNone(self._forward(["daemon"]))
+        finally:
+            daemon.stop()
+            thread.join()
+
+    def test_disabled(self):
+        daemon, thread = self._start(lambda argv, environ, cwd: 0)
+        try:
+            self.assertIsNone(self._forward(["hivecmd", "check", "1"],
+                                            dict(self.env, QDS_NO_DAEMON="1")))
+        finally:
+            daemon.stop()
+            thread.join()
+
+    def test_client_gone(self):
+        # the command of a client which went away is cancelled
+        cancelled = threading.Event()
+        threads = []
+
+        def run(argv, environ, cwd):
+            threads.append(threading.current_thread())
+            cancelled.wait(10)
+            return 0
+
+        def cancel(thread):
+            self.assertEqual(threads, [thread])
+            cancelled.set()
+
+        daemon = Daemon(self.path, run, cancel=cancel)
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        try:
+            _wait_for(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            sock.sendall(b'{"argv": ["hivecmd", "run"], "env": {}}\n')
+            while not threads:
+                time.sleep(0.01)
+            sock.close()
+            self.assertTrue(cancelled.wait(10))
+        finally:
+            daemon.stop()
+            thread.join()
+
+    def test_signal_handler_interrupt(self):
+        from qds_sdk.commands import SignalHandler
+        handlers = []
+        thread = threading.Thread(target=lambda: handlers.append(SignalHandler()))
+        thread.start()
+        thread.join()
+        self.assertFalse(handlers[0].received_term_signal)
+        SignalHandler.interrupt(thread)
+        self.assertTrue(handlers[0].received_term_signal)
+
+    def test_already_running(self):
+        daemon, thread = self._start(lambda argv, environ, cwd: 0)
+        try:
+            self.assertRaises(RuntimeError, Daemon(self.path, None).serve_forever)
+        finally:
+            daemon.stop()
+            thread.join()
+
+    def _qds_daemon(self, api_call, *commands):
+        """
+        Runs `commands` through a qds.py daemon, returns their exit statuses
+        """
+        sys.argv = ['qds.py', '--token', 'abc', 'daemon', '--socket', self.path,
+                    '--idle-timeout', '1']
+        with patch.object(Connection, "_api_call", side_effect=api_call):
+            thread = threading.Thread(target=qds.main)
+            thread.start()
+            try:
+                _wait_for(self.path)
+                env = dict(os.environ, QDS_DAEMON_SOCKET=self.path)
+                return [self._forward(argv, env) for argv in commands]
+            finally:
+                thread.join()
+
+    def test_qds_daemon(self):
+        api_call = Mock(return_value={"id": 123})
+        statuses = self._qds_daemon(api_call,
+                                    ['--token', 'abc', 'hivecmd', 'check', '123'],
+                                    ['--token', 'xyz', 'hivecmd', 'check', '123'])
+        self.assertEqual(statuses, [0, None])
+        api_call.assert_called_once_with("GET", "commands/123",
+                                         params={'include_query_properties': 'false'})
+        self.assertIn(b'"id": 123', self.stdout.getvalue())
+
+    def test_qds_daemon_run(self):
+        # run() watches for termination signals, which worker threads of the
+        # daemon cannot install handlers for
+        api_call = Mock(side_effect=lambda req_type, path, data=None, params=None, headers=None:
+                        {"id": 1, "status": "error"})
+        statuses = self._qds_daemon(api_call, ['--token', 'abc', 'hivecmd', 'run', '-q', 'show tables'])
+        self.assertEqual(statuses, [1])
+        api_call.assert_any_call("POST", "commands", ANY)
+        self.assertNotIn(b"signal", self.stderr.getvalue())
+
+    def test_qds_daemon_relative_paths(self):
+        # files are looked up relative to the directory of the client
+        with open(os.path.join(self.tmpdir, "query.sql"), "w") as f:
+            f.write("show tables")
+        api_call = Mock(return_value={"id": 1, "status": "waiting"})
+        sys.argv = ['qds.py', '--token', 'abc', 'daemon', '--socket', self.path,
+                    '--idle-timeout', '1']
+        with patch.object(Connection, "_api_call", api_call):
+            thread = threading.Thread(target=qds.main)
+            thread.start()
+            try:
+                _wait_for(self.path)
+                env = dict(os.environ, QDS_DAEMON_SOCKET=self.path)
+                for argv in (['--token', 'abc', 'hivecmd', 'submit', '-f', 'query.sql'],
+                             ['--token', 'abc', 'hivecmd', 'submit', '--script_location=query.sql']):
+                    self.assertIsNone(forward(argv, env, self.stdout, self.stderr, cwd=self.tmpdir))
+                self.assertEqual(forward(['--token', 'abc', 'hivecmd', 'submit', '-f',
+                                          os.path.join(self.tmpdir, "query.sql")],
+                                         env, self.stdout, self.stderr, cwd=self.tmpdir), 0)
+            finally:
+                thread.join()
+        self.assertEqual(api_call.call_count, 1)
+
+    def test_qds_daemon_getresult(self):
+        def api_call(req_type, path, data=None, params=None, headers=None):
+            if path == "commands/1/results":
+                return {"inline": True, "results": "a\tb"}
+            return {"id": 1, "status": "done", "qlog": None,
+                    "meta_data": {"results_resource": "commands/1/results"}}
+
+        statuses = self._qds_daemon(api_call, ['--token', 'abc', 'hivecmd', 'getresult', '1'])
+        self.assertEqual(statuses, [0])
+        self.assertEqual(self.stdout.getvalue(), b"a\tb")
+
+    def test_redirected_stream_binary_writer(self):
+        # used for results downloaded from S3
+        from qds_sdk.commands import _binary_writer
+        from qds_sdk.daemon import _RedirectedStream, _Sink, _local
+        sink = Mock(spec=_Sink)
+        stream = _RedirectedStream(io.StringIO(), b"o")
+        _local.sink = sink
+        try:
+            _binary_writer(stream)(b"a\tb")
+        finally:
+            _local.sink = None
+        sink.send.assert_called_once_with(b"o", b"a\tb")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import sys
+import os
+import json
+import subprocess
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+
+BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../bin')
+
+# Imports requests, then qds.py in a fresh interpreter and reports how long
+# each took, and which of the modules only some subcommands need got imported
+_SCRIPT = """
+import json
+import sys
+import time
+sys.path.insert(0, %r)
+started = time.time()
+import requests
+requests_elapsed = time.time() - started
+started = time.time()
+import qds
+elapsed = time.time() - started
+print(json.dumps({"elapsed": elapsed, "requests_elapsed": requests_elapsed, "modules": [m for m in
+    ("boto", "pkg_resources", "qds_sdk.commands", "qds_sdk.cluster",
+     "qds_sdk.clusterv2", "qds_sdk.sensors", "qds_sdk.scheduler")
+    if m in sys.modules]}))
+"""
+
+
+class TestImportTime(unittest.TestCase):
+
+    def _import_qds(self):
+        output = subprocess.check_output([sys.executable, "-c", _SCRIPT % BIN])
+        return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+    def test_subsystems_not_imported(self):
+        result = self._import_qds()
+        self.assertEqual(result["modules"], [])
+
+    def test_import_time(self):
+        # the SDK's own share of the startup, on top of requests which it
+        # cannot do without, is measured against importing requests so that
+        # slow machines do not fail it. eager imports of boto and
+        # pkg_resources took several times as long as requests
+        results = [self._import_qds() for _ in range(3)]
+        self.assertLess(min(r["elapsed"] / r["requests_elapsed"] for r in results), 1.0)
+
+    def test_subcommand_loads_its_classes(self):
+        sys.path.append(BIN)
+        import qds
+        self.assertEqual(qds._load_class("qds_sdk.commands", qds.CommandClasses["hivecmd"]).__name__,
+                         "HiveCommand")
+        self.assertEqual(qds._load_class("qds_sdk.sensors", qds.SensorClasses["filesensor"]).__name__,
+                         "FileSensor")
+
+
+if __name__ == '__main__':
+    unittest.main()
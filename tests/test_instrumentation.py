@@ -0,0 +1,61 @@
+import sys
+import os
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+from qds_sdk.instrumentation import Histogram, MetricsRegistry, RequestEvent, notify
+from test_base import QdsCliTestCase
+
+
+def _event(method, path, elapsed, status_code=200, body=None, trace_id=None):
+    event = RequestEvent(method, path, "https://qds.api.url/api/v1.2/" + path, body)
+    response = Mock(status_code=status_code,
+                    headers={'Content-Length': '10', 'X-Qubole-Trace-Id': trace_id})
+    event.finish(response=response)
+    event.elapsed = elapsed
+    return event
+
+
+class TestInstrumentation(QdsCliTestCase):
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative_counts(),
+                         [(0.1, 2), (1, 3), (float('inf'), 4)])
+        self.assertEqual(histogram.count, 4)
+
+    def test_prometheus(self):
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        registry.after_request(_event("GET", "commands/12", 0.05, body=None, trace_id="t1"))
+        registry.after_request(_event("GET", "commands/13", 0.5, status_code=404))
+        registry.after_request(_event("POST", "commands", 2, body='{"a": 1}'))
+        registry.on_retry("POST commands", Exception(), 1)
+        text = registry.to_prometheus()
+        for line in ['qds_sdk_request_duration_seconds_bucket{endpoint="GET commands/:id",le="0.1"} 1',
+                     'qds_sdk_request_duration_seconds_bucket{endpoint="GET commands/:id",le="+Inf"} 2',
+                     'qds_sdk_request_duration_seconds_count{endpoint="POST commands"} 1',
+                     'qds_sdk_requests_total{endpoint="GET commands/:id",status="404"} 1',
+                     'qds_sdk_retries_total{endpoint="POST commands"} 1',
+                     'qds_sdk_sent_bytes_total{endpoint="POST commands"} 8',
+                     'qds_sdk_received_bytes_total{endpoint="GET commands/:id"} 20',
+                     '# TYPE qds_sdk_requests_total counter']:
+            self.assertIn(line, text.splitlines())
+        self.assertEqual(list(registry.recent_trace_ids), [("GET commands/:id", "200", "t1")])
+
+    def test_failing_hooks_are_ignored(self):
+        hook = Mock()
+        hook.after_request.side_effect = ValueError("broken hook")
+        other = Mock()
+        notify([hook, other], 'after_request', "event")
+        other.after_request.assert_called_once_with("event")
+
+
+if __name__ == '__main__':
+    unittest.main()
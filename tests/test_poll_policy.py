@@ -0,0 +1,74 @@
+import sys
+import os
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+import qds
+from qds_sdk.qubole import Qubole
+from qds_sdk.connection import Connection
+from qds_sdk.poll_policy import PollPolicy, AdaptivePollPolicy
+from test_base import print_command
+from test_base import QdsCliTestCase
+
+
+class TestPollPolicy(QdsCliTestCase):
+
+    def test_fixed_intervals(self):
+        intervals = PollPolicy(7).intervals()
+        self.assertEqual([next(intervals) for _ in range(3)], [7, 7, 7])
+
+    @patch("time.time")
+    def test_adaptive_fast_path_then_ramp_up(self, time_):
+        time_.return_value = 1000
+        policy = AdaptivePollPolicy(initial_interval=1, fast_path=10,
+                                    backoff=2, max_interval=6, jitter=0)
+        intervals = policy.intervals()
+        self.assertEqual([next(intervals) for _ in range(2)], [1, 1])
+        time_.return_value = 1010
+        self.assertEqual([next(intervals) for _ in range(4)], [2, 4, 6, 6])
+
+    @patch("time.time")
+    def test_adaptive_jitter_stays_under_ceiling(self, time_):
+        time_.return_value = 0
+        policy = AdaptivePollPolicy(fast_path=0, max_interval=30, jitter=0.5)
+        intervals = policy.intervals()
+        for _ in range(50):
+            self.assertTrue(0 < next(intervals) <= 30)
+
+    @patch("time.sleep")
+    def test_poller_max_delay(self, sleep):
+        poller = PollPolicy(5).poller()
+        self.assertEqual(poller.wait(max_delay=2), 2)
+        self.assertEqual(poller.wait(max_delay=-1), 0)
+        sleep.assert_has_calls([call(2), call(0)])
+
+    def test_retry_after_header(self):
+        response = Mock(status_code=429, headers={'Retry-After': '12'})
+        self.assertEqual(Connection._get_retry_after(response), 12)
+        response = Mock(status_code=503, headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertEqual(Connection._get_retry_after(response), 0)
+        response = Mock(status_code=200, headers={'Retry-After': '12'})
+        self.assertEqual(Connection._get_retry_after(response), None)
+        response = Mock(status_code=429, headers={})
+        self.assertEqual(Connection._get_retry_after(response), None)
+
+    def test_configure_default_policy(self):
+        Qubole.configure(api_token='dummy_token', poll_interval=3)
+        self.assertEqual(Qubole.poll_policy.__class__, PollPolicy)
+        self.assertEqual(Qubole.poll_policy.interval, 3)
+
+    def test_cli_adaptive_policy(self):
+        sys.argv = ['qds.py', '--poll_policy', 'adaptive', 'hivecmd', 'list']
+        print_command()
+        Connection._api_call = Mock(return_value={})
+        qds.main()
+        self.assertTrue(isinstance(Qubole.poll_policy, AdaptivePollPolicy))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import sys
+import os
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+from qds_sdk.rate_limiter import TokenBucket
+from test_base import QdsCliTestCase
+
+
+class TestTokenBucket(QdsCliTestCase):
+
+    @patch("time.sleep")
+    @patch("time.time")
+    def test_acquire_waits_for_tokens(self, time_, sleep):
+        now = [100.0]
+        time_.side_effect = lambda: now[0]
+        sleep.side_effect = lambda seconds: now.__setitem__(0, now[0] + seconds)
+        bucket = TokenBucket(rate=2, burst=2)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertAlmostEqual(now[0], 101.0)
+
+    @patch("time.sleep")
+    @patch("time.time")
+    def test_throttling_adapts_rate(self, time_, sleep):
+        now = [100.0]
+        time_.side_effect = lambda: now[0]
+        sleep.side_effect = lambda seconds: now.__setitem__(0, now[0] + seconds)
+        bucket = TokenBucket(rate=10, min_rate=4)
+        bucket.throttled(retry_after=5)
+        self.assertEqual(bucket.rate, 5)
+        bucket.acquire()
+        self.assertAlmostEqual(now[0], 105.2)
+        bucket.throttled()
+        self.assertEqual(bucket.rate, 4)
+        for _ in range(30):
+            bucket.succeeded()
+        self.assertEqual(bucket.rate, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
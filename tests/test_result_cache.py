@@ -0,0 +1,136 @@
+import sys
+import os
+import shutil
+import tempfile
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+import qds
+import qds_sdk
+from qds_sdk.qubole import Qubole
+from qds_sdk.connection import Connection
+from qds_sdk.result_cache import ResultCache
+from test_base import print_command
+from test_base import QdsCliTestCase
+
+
+class TestResultCache(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestResultCache, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        Qubole.result_cache = None
+
+    def _read(self, cache, key):
+        chunks = []
+        found = cache.read(key, chunks.append)
+        return b''.join(chunks) if found else None
+
+    def test_write_and_read(self):
+        cache = ResultCache(self.directory)
+        key = cache.key(1, 'false', '\t')
+        self.assertEqual(self._read(cache, key), None)
+        with cache.writer(key) as f:
+            f.write(b'a\tb\n')
+        self.assertEqual(self._read(cache, key), b'a\tb\n')
+        self.assertNotEqual(key, cache.key(1, 'true', '\t'))
+
+    def test_failed_write_is_not_stored(self):
+        cache = ResultCache(self.directory)
+        key = cache.key(1)
+        with self.assertRaises(ValueError):
+            with cache.writer(key) as f:
+                f.write(b'partial')
+                raise ValueError()
+        self.assertEqual(self._read(cache, key), None)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_lru_eviction(self):
+        cache = ResultCache(self.directory, max_bytes=15)
+        for i, age in ((1, 300), (2, 200), (3, 100)):
+            with cache.writer(cache.key(i)) as f:
+                f.write(b'12345')
+            path = os.path.join(self.directory, cache.key(i))
+            os.utime(path, (os.path.getmtime(path) - age,) * 2)
+        # reading 1 makes 2 the least recently used entry
+        self._read(cache, cache.key(1))
+        cache.max_bytes = 10
+        cache.evict()
+        self.assertEqual(self._read(cache, cache.key(2)), None)
+        self.assertEqual(self._read(cache, cache.key(1)), b'12345')
+        self.assertEqual(self._read(cache, cache.key(3)), b'12345')
+
+    def test_entry_larger_than_cache(self):
+        cache = ResultCache(self.directory, max_bytes=3)
+        with cache.writer(cache.key(1)) as f:
+            f.write(b'12')
+            f.write(b'345')
+        self.assertEqual(self._read(cache, cache.key(1)), None)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_evict_keeps_entry(self):
+        cache = ResultCache(self.directory, max_bytes=15)
+        for i in range(1, 4):
+            with cache.writer(cache.key(i)) as f:
+                f.write(b'12345')
+            path = os.path.join(self.directory, cache.key(i))
+            os.utime(path, (i, i))
+        cache.max_bytes = 10
+        cache.evict(keep=cache.key(1))
+        self.assertEqual(self._read(cache, cache.key(1)), b'12345')
+        self.assertEqual(self._read(cache, cache.key(2)), None)
+
+    def test_result_larger_than_cache(self):
+        from six import BytesIO
+        from qds_sdk.commands import HiveCommand
+        Qubole.configure(api_token='dummy_token', result_cache_dir=self.directory,
+                         result_cache_max_bytes=2)
+        Connection._api_call = Mock(return_value={'results': 'a\tb', 'inline': True})
+        cmd = HiveCommand({'id': 1, 'status': 'done',
+                           'meta_data': {'results_resource': 'commands/1/results'}})
+        fp = BytesIO()
+        cmd.get_results(fp)
+        self.assertEqual(fp.getvalue(), b'a\tb')
+        self.assertEqual(Connection._api_call.call_count, 1)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_inline_is_part_of_the_key(self):
+        from six import BytesIO
+        from qds_sdk.commands import HiveCommand
+        Qubole.configure(api_token='dummy_token', result_cache_dir=self.directory)
+        Connection._api_call = Mock(return_value={'results': 'a\tb', 'inline': True})
+        cmd = HiveCommand({'id': 1, 'status': 'done',
+                           'meta_data': {'results_resource': 'commands/1/results'}})
+        cmd.get_results(BytesIO())
+        cmd.get_results(BytesIO(), inline=False)
+        cmd.get_results(BytesIO(), inline=False)
+        self.assertEqual(Connection._api_call.call_count, 2)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_getresult_uses_cache(self):
+        sys.argv = ['qds.py', '--result_cache_dir', self.directory, 'hivecmd', 'getresult', '314591']
+        print_command()
+        Connection._api_call = Mock(return_value={'id': 314591,
+                                                  'results': 'a\tb',
+                                                  'inline': True,
+                                                  'qlog': None,
+                                                  'meta_data': {'results_resource': 'commands/314591/results'},
+                                                  'status': 'done'})
+        qds.main()
+        qds.main()
+        results_calls = [c for c in Connection._api_call.call_args_list
+                         if c[0][1] == "commands/314591/results"]
+        self.assertEqual(len(results_calls), 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
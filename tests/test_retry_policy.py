@@ -0,0 +1,91 @@
+import sys
+import os
+
+if sys.version_info > (2, 7, 0):
+    import unittest
+else:
+    import unittest2 as unittest
+from mock import *
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../bin'))
+from qds_sdk.exception import ServerError, CircuitOpenError
+from qds_sdk.retry_policy import RetryPolicy
+from test_base import QdsCliTestCase
+
+
+class TestRetryPolicy(QdsCliTestCase):
+
+    def test_endpoint(self):
+        self.assertEqual(RetryPolicy.endpoint("get", "commands/123/logs"),
+                         "GET commands/:id/logs")
+        self.assertEqual(RetryPolicy.endpoint("post", "/commands"), "POST commands")
+        self.assertEqual(RetryPolicy.endpoint("get", "scheduler?page=2"), "GET scheduler")
+
+    def test_delay(self):
+        policy = RetryPolicy(base_delay=1, backoff=3, max_delay=5)
+        self.assertEqual([policy.delay(n) for n in range(4)], [1, 3, 5, 5])
+        self.assertEqual(policy.delay(0, retry_after=30), 30)
+        jittered = RetryPolicy(base_delay=4, jitter=True)
+        with patch("random.uniform", return_value=1.5) as uniform:
+            self.assertEqual(jittered.delay(1), 1.5)
+        uniform.assert_called_once_with(0, 8)
+
+    @patch("time.time", return_value=100)
+    def test_deadline(self, time_):
+        policy = RetryPolicy(base_delay=10, deadline=25)
+        self.assertEqual(policy.on_failure("GET commands", ServerError(Mock()), 0, 100), 10)
+        time_.return_value = 110
+        self.assertIsNone(policy.on_failure("GET commands", ServerError(Mock()), 1, 100))
+        metrics = policy.metrics.snapshot()
+        self.assertEqual((metrics["retries"], metrics["giveups"]), (1, 1))
+        self.assertEqual(metrics["retries_by_exception"], {"ServerError": 1})
+
+    @patch("time.time")
+    def test_circuit_breaker(self, time_):
+        time_.return_value = 100
+        policy = RetryPolicy(failure_threshold=2, reset_timeout=30)
+        policy.before_call("GET clusters")
+        self.assertEqual(policy.on_failure("GET clusters", ServerError(Mock()), 0, 100), 10)
+        policy.before_call("GET clusters")
+        # the failure opening the circuit gives up at once, without a wait
+        self.assertRaises(CircuitOpenError, policy.on_failure,
+                          "GET clusters", ServerError(Mock()), 1, 100)
+        self.assertRaises(CircuitOpenError, policy.before_call, "GET clusters")
+        policy.before_call("GET commands")
+        time_.return_value = 131
+        policy.before_call("GET clusters")
+        # only one trial call goes through while the circuit is half open
+        self.assertRaises(CircuitOpenError, policy.before_call, "GET clusters")
+        policy.on_success("GET clusters")
+        policy.before_call("GET clusters")
+        self.assertEqual(policy.metrics.snapshot()["circuit_rejections"], 2)
+
+    @patch("time.sleep")
+    def test_circuit_opens_without_sleeping(self, sleep):
+        from qds_sdk.connection import Connection
+        connection = Connection(None, 'https://qds.api.url/api/v1.2', False)
+        connection.retry_policy = RetryPolicy(max_retries=5, failure_threshold=2)
+        with patch.object(Connection, '_api_call', side_effect=ServerError(Mock())) as api_call:
+            self.assertRaises(CircuitOpenError, connection.get, "clusters")
+        self.assertEqual(api_call.call_count, 2)
+        self.assertEqual(sleep.call_count, 1)
+
+
+    @patch("time.sleep")
+    @patch("time.time", return_value=100)
+    def test_client_error_closes_half_open_circuit(self, time_, sleep):
+        from qds_sdk.connection import Connection
+        from qds_sdk.exception import ResourceNotFound
+        connection = Connection(None, 'https://qds.api.url/api/v1.2', False)
+        connection.retry_policy = RetryPolicy(failure_threshold=1, reset_timeout=30)
+        with patch.object(Connection, '_api_call', side_effect=ServerError(Mock())):
+            self.assertRaises(CircuitOpenError, connection.get, "clusters/1")
+        time_.return_value = 131
+        with patch.object(Connection, '_api_call', side_effect=ResourceNotFound(Mock())):
+            self.assertRaises(ResourceNotFound, connection.get, "clusters/1")
+        # the server answered the trial call, the circuit is closed again
+        connection.retry_policy.before_call("GET clusters/:id")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -76,5 +76,77 @@ class TestSchedulerCheck(QdsCliTestCase):
             [call("GET", "scheduler", params={'name': '123'})])
 
 
+class TestSchedulerIterAll(QdsCliTestCase):
+
+    def setUp(self):
+        super(TestSchedulerIterAll, self).setUp()
+        Qubole.configure(api_token='dummy_token', api_url='https://qds.api.url/api')
+
+    @staticmethod
+    def _pages(key, pages):
+        def _api_call(req_type, path, params=None):
+            page = params["page"]
+            return {key: [{"id": id} for id in pages[page - 1]],
+                    "paging_info": {"next_page": page + 1 if page < len(pages) else None,
+                                    "per_page": params.get("per_page")}}
+        return Mock(side_effect=_api_call)
+
+    def test_iter_all(self):
+        Connection._api_call = self._pages("schedules", [[1, 2], [3, 4], [5]])
+        schedules = Scheduler.iter_all(per_page=2)
+        self.assertEqual([s.id for s in schedules], [1, 2, 3, 4, 5])
+        Connection._api_call.assert_has_calls(
+            [call("GET", "scheduler", params={'page': 1, 'per_page': 2}),
+             call("GET", "scheduler", params={'page': 2, 'per_page': 2}),
+             call("GET", "scheduler", params={'page': 3, 'per_page': 2})])
+
+    def test_iter_all_with_client(self):
+        from qds_sdk.dbtaps import DbTap
+        Connection._api_call = Mock()
+        client = Mock()
+        pages = {"db_taps": {"db_taps": [{"id": 1}], "paging_info": {}},
+                 "actions": {"actions": [{"id": 2}], "paging_info": {}}}
+        client.agent.return_value.get.side_effect = lambda path, params: pages[path]
+        taps = list(DbTap.iter_all(client=client))
+        actions = list(Action.iter_all(client=client))
+        self.assertEqual([(r.id, r._client) for r in taps + actions], [(1, client), (2, client)])
+        self.assertFalse(Connection._api_call.called)
+
+    def test_methods_use_the_client_of_the_object(self):
+        from qds_sdk.dbtaps import DbTap
+        Connection._api_call = Mock()
+        client = Mock()
+        conn = client.agent.return_value
+        conn.get.return_value = {"id": 5, "schedules": [{"id": 5}], "commands": [], "actions": []}
+        schedule = Scheduler.find_by_name("daily", client=client)
+        schedule.kill()
+        schedule.list_instances()
+        Action({"id": 7}, client).rerun()
+        DbTap({"id": 9}, client).delete()
+        self.assertEqual(conn.put.call_args[0][0], "scheduler/5")
+        conn.post.assert_called_once_with("actions/7/rerun", data=None)
+        conn.delete.assert_called_once_with("db_taps/9")
+        self.assertFalse(Connection._api_call.called)
+
+    def test_iter_all_actions_prefetch(self):
+        Connection._api_call = self._pages("actions", [[1], [2], []])
+        schedule = Scheduler({"id": 123})
+        actions = schedule.iter_all_actions(sequence_id=7, prefetch=True)
+        self.assertEqual([a.id for a in actions], [1, 2])
+        self.assertEqual(Connection._api_call.call_count, 3)
+        Connection._api_call.assert_called_with(
+            "GET", "scheduler/123/actions/7", params={'page': 3})
+
+    def test_iter_all_is_lazy(self):
+        Connection._api_call = Mock(return_value={
+            "commands": [{"id": 1, "command_type": "HiveCommand"}],
+            "paging_info": {"next_page": 2}})
+        schedule = Scheduler({"id": 123})
+        instances = schedule.iter_all_instances()
+        first = next(instances)
+        self.assertIsInstance(first, HiveCommand)
+        self.assertEqual(Connection._api_call.call_count, 1)
+
+
 if __name__ == '__main__':
     unittest.main()